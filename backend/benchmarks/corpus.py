@@ -0,0 +1,243 @@
+"""
+Synthetic lab-report corpus for benchmarks and offline testing.
+
+Generates digital PDFs (real text layer), scanned-looking images and
+image-only PDFs, and plain text files with a configurable number of
+pages and tests per page. Output is deterministic for a given seed.
+"""
+import os
+import json
+import random
+from typing import Dict, List, Tuple
+
+# (name, unit, low, high) - reference ranges are illustrative, not clinical
+LAB_TESTS: List[Tuple[str, str, float, float]] = [
+    ("Hemoglobin", "g/dL", 12.0, 16.0),
+    ("Hematocrit", "%", 36.0, 46.0),
+    ("RBC Count", "million/uL", 4.2, 5.4),
+    ("WBC Count", "thousand/uL", 4.0, 11.0),
+    ("Platelet Count", "thousand/uL", 150.0, 400.0),
+    ("MCV", "fL", 80.0, 100.0),
+    ("MCH", "pg", 27.0, 33.0),
+    ("MCHC", "g/dL", 32.0, 36.0),
+    ("RDW", "%", 11.5, 14.5),
+    ("Glucose, Fasting", "mg/dL", 70.0, 99.0),
+    ("HbA1c", "%", 4.0, 5.6),
+    ("Total Cholesterol", "mg/dL", 125.0, 200.0),
+    ("LDL Cholesterol", "mg/dL", 0.0, 100.0),
+    ("HDL Cholesterol", "mg/dL", 40.0, 60.0),
+    ("Triglycerides", "mg/dL", 0.0, 150.0),
+    ("TSH", "uIU/mL", 0.4, 4.0),
+    ("Free T4", "ng/dL", 0.8, 1.8),
+    ("Vitamin B12", "pg/mL", 200.0, 900.0),
+    ("Vitamin D, 25-OH", "ng/mL", 30.0, 100.0),
+    ("Ferritin", "ng/mL", 15.0, 150.0),
+    ("Iron", "ug/dL", 60.0, 170.0),
+    ("Creatinine", "mg/dL", 0.6, 1.2),
+    ("BUN", "mg/dL", 7.0, 20.0),
+    ("eGFR", "mL/min/1.73m2", 90.0, 120.0),
+    ("Sodium", "mmol/L", 135.0, 145.0),
+    ("Potassium", "mmol/L", 3.5, 5.1),
+    ("Chloride", "mmol/L", 98.0, 107.0),
+    ("Calcium", "mg/dL", 8.6, 10.3),
+    ("ALT (SGPT)", "U/L", 7.0, 56.0),
+    ("AST (SGOT)", "U/L", 10.0, 40.0),
+    ("Alkaline Phosphatase", "U/L", 44.0, 147.0),
+    ("Total Bilirubin", "mg/dL", 0.1, 1.2),
+    ("Albumin", "g/dL", 3.4, 5.4),
+    ("CRP", "mg/L", 0.0, 3.0),
+    ("Uric Acid", "mg/dL", 3.5, 7.2),
+]
+
+
+def format_range(low: float, high: float) -> str:
+    return f"<{high:g}" if low == 0 else f"{low:g}-{high:g}"
+
+
+def generate_report(pages: int, tests_per_page: int, seed: int = 0) -> List[List[Dict]]:
+    """Random findings grouped by page"""
+    rng = random.Random(seed)
+    report = []
+    for _ in range(pages):
+        page = []
+        for _ in range(tests_per_page):
+            name, unit, low, high = rng.choice(LAB_TESTS)
+            span = (high - low) or high
+            value = round(rng.uniform(low - 0.3 * span, high + 0.3 * span), 1)
+            page.append({
+                "test_name": name,
+                "value": f"{max(value, 0):g} {unit}",
+                "normal_range": f"{format_range(low, high)} {unit}",
+            })
+        report.append(page)
+    return report
+
+
+def report_lines(page: List[Dict], page_number: int = 1) -> List[str]:
+    lines = [
+        "CITY DIAGNOSTICS LABORATORY",
+        f"Patient: Jane Doe    Sample ID: SYN-{page_number:04d}    Page {page_number}",
+        "TEST                          RESULT            REFERENCE RANGE",
+    ]
+    for f in page:
+        lines.append(f"{f['test_name']:<30}{f['value']:<18}{f['normal_range']}")
+    return lines
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _write_pdf(path: str, page_streams: List[str], base_font: str):
+    """Minimal PDF writer: one content stream per page, one Type1 font - no reportlab needed"""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} >>".encode())
+    pages_id = len(objects) + 1
+    objects.append(None)  # placeholder for the page tree
+
+    page_ids = []
+    for ops in page_streams:
+        stream = ops.encode("latin-1", "replace")
+        content_id = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add((
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref
+    )
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_text_pdf(path: str, pages: List[List[str]]):
+    """Courier, one text line per row, columns padded with spaces"""
+    streams = []
+    for lines in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        streams.append("\n".join(ops))
+    _write_pdf(path, streams, "Courier")
+
+
+# x position of the name, result and reference range columns
+TABLE_COLUMNS = (40, 240, 380)
+
+
+def write_table_pdf(path: str, report: List[List[Dict]], column_order: bool = False):
+    """
+    Helvetica table with every cell placed on its own, as report generators
+    do. With column_order the cells are written column by column, which is
+    how fast extractors then read them back.
+    """
+    streams = []
+    for page in report:
+        cells = [
+            (row, column, text)
+            for row, finding in enumerate(page)
+            for column, text in enumerate((finding["test_name"], finding["value"], finding["normal_range"]))
+        ]
+        if column_order:
+            cells.sort(key=lambda cell: (cell[1], cell[0]))
+        streams.append("\n".join(
+            f"BT /F1 9 Tf 1 0 0 1 {TABLE_COLUMNS[column]} {780 - 12 * row} Tm ({_pdf_escape(text)}) Tj ET"
+            for row, column, text in cells
+        ))
+    _write_pdf(path, streams, "Helvetica")
+
+
+def render_scan(lines: List[str], seed: int = 0, width: int = 2480, skew: float = 1.5):
+    """Render lines as a slightly rotated, noisy 'phone photo' of a page"""
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    rng = random.Random(seed)
+    height = int(width * 1.414)
+    img = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.load_default(size=max(width // 60, 12))
+    except TypeError:
+        font = ImageFont.load_default()
+
+    line_height = max(width // 40, 14)
+    y = line_height * 3
+    for line in lines:
+        draw.text((width // 12, y), line, fill=20, font=font)
+        y += line_height
+
+    img = img.rotate(rng.uniform(-skew, skew), fillcolor=90, expand=True)
+    return img.filter(ImageFilter.GaussianBlur(0.6))
+
+
+def write_text_file(path: str, pages: List[List[str]]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n".join(lines) for lines in pages))
+
+
+def synthetic_llm_response(findings: List[Dict], truncate_at: float = 1.0) -> str:
+    """
+    An analyze_document-style JSON response. truncate_at < 1.0 cuts it off
+    part-way, like a completion that hit max_tokens.
+    """
+    body = {
+        "overall_summary": "Synthetic report for benchmarking.",
+        "overall_status": "MONITOR",
+        "findings": [
+            dict(f, status="NORMAL", plain_english="Within the expected range.",
+                 what_it_means="This measures a routine marker.",
+                 clinical_significance="No action needed.",
+                 recommendations=["Retest at next checkup"])
+            for f in findings
+        ],
+    }
+    text = json.dumps(body, indent=2)
+    return text[:int(len(text) * truncate_at)]
+
+
+def build_corpus(out_dir: str, pages: int = 2, tests_per_page: int = 25,
+                 seed: int = 0, scans: bool = True) -> Dict[str, str]:
+    """Write one document of each kind to out_dir and return their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    report = generate_report(pages, tests_per_page, seed)
+    pages_lines = [report_lines(page, i + 1) for i, page in enumerate(report)]
+
+    paths = {
+        "txt": os.path.join(out_dir, "report.txt"),
+        "pdf": os.path.join(out_dir, "report.pdf"),
+    }
+    write_text_file(paths["txt"], pages_lines)
+    write_text_pdf(paths["pdf"], pages_lines)
+    paths["table_pdf"] = os.path.join(out_dir, "table.pdf")
+    write_table_pdf(paths["table_pdf"], report)
+    paths["table_columns_pdf"] = os.path.join(out_dir, "table_columns.pdf")
+    write_table_pdf(paths["table_columns_pdf"], report, column_order=True)
+
+    if scans:
+        images = [render_scan(lines, seed + i) for i, lines in enumerate(pages_lines)]
+        paths["jpg"] = os.path.join(out_dir, "scan.jpg")
+        images[0].save(paths["jpg"], quality=85)
+        paths["scanned_pdf"] = os.path.join(out_dir, "scan.pdf")
+        images[0].save(paths["scanned_pdf"], save_all=True, append_images=images[1:], resolution=300)
+
+    return paths
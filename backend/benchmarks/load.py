@@ -0,0 +1,256 @@
+"""
+End-to-end load generator: upload -> background processing -> completed analysis.
+
+Against a running API:
+    python -m benchmarks.load --url http://127.0.0.1:8000 --rate 30 --count 100
+
+Self-contained (spawns the API and the mock LLM on free ports):
+    python -m benchmarks.load --spawn --rate 30 --count 100 --mix txt=0.6,pdf=0.4 \\
+        --mock-args "--latency lognormal:-0.5,0.4 --tokens-per-sec 1800 --p429 0.02"
+
+Arrivals are Poisson at --rate documents/minute. Every job is followed
+until its status is completed/failed, and the report gives throughput,
+p50/p95/p99 per stage and error rates as JSON.
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import socket
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import build_corpus  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "jpg": "image/jpeg",
+    "scanned_pdf": "application/pdf",
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 4)
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in CONTENT_TYPES:
+            raise ValueError(f"Unknown document kind '{kind}' (use {', '.join(CONTENT_TYPES)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def build_documents(mix: Dict[str, float], variants: int, pages: int, tests: int) -> Dict[str, List[str]]:
+    """A few distinct documents per kind so uploads aren't all byte-identical"""
+    work_dir = tempfile.mkdtemp(prefix="docusage-load-")
+    needs_scans = any(kind in ("jpg", "scanned_pdf") for kind in mix)
+    documents: Dict[str, List[str]] = {kind: [] for kind in mix}
+    for seed in range(variants):
+        paths = build_corpus(os.path.join(work_dir, str(seed)), pages, tests, seed, scans=needs_scans)
+        for kind in mix:
+            documents[kind].append(paths[kind])
+    return documents
+
+
+class LoadRun:
+    def __init__(self, url: str, poll_interval: float, job_timeout: float):
+        self.url = url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.stages: Dict[str, List[float]] = {"upload": [], "processing": [], "end_to_end": []}
+        self.outcomes: Dict[str, int] = {}
+        self.completed_at: List[float] = []
+
+    def _count(self, outcome: str):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    async def job(self, client: httpx.AsyncClient, kind: str, path: str):
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                response = await client.post(
+                    f"{self.url}/api/upload",
+                    files={"file": (os.path.basename(path), f, CONTENT_TYPES[kind])},
+                )
+        except httpx.HTTPError as e:
+            logger.warning(f"upload error: {e}")
+            self._count("upload_error")
+            return
+        uploaded = time.perf_counter()
+        if response.status_code != 202:
+            self._count(f"upload_http_{response.status_code}")
+            return
+        self.stages["upload"].append(uploaded - start)
+        document_id = response.json()["document_id"]
+
+        while time.perf_counter() - start < self.job_timeout:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                status = await client.get(f"{self.url}/api/document/{document_id}/status")
+            except httpx.HTTPError:
+                continue
+            if status.status_code != 200:
+                continue
+            state = status.json().get("status")
+            if state in ("completed", "failed"):
+                done = time.perf_counter()
+                self._count(state)
+                if state == "completed":
+                    self.stages["processing"].append(done - uploaded)
+                    self.stages["end_to_end"].append(done - start)
+                    self.completed_at.append(done)
+                return
+        self._count("timeout")
+
+    async def run(self, documents: Dict[str, List[str]], mix: Dict[str, float],
+                  rate_per_min: float, count: int, seed: int) -> Dict:
+        rng = random.Random(seed)
+        kinds, weights = list(mix), list(mix.values())
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+
+        async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+            started = time.perf_counter()
+            tasks = []
+            for _ in range(count):
+                kind = rng.choices(kinds, weights)[0]
+                tasks.append(asyncio.create_task(self.job(client, kind, rng.choice(documents[kind]))))
+                await asyncio.sleep(rng.expovariate(rate_per_min / 60.0))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+
+        completed = self.outcomes.get("completed", 0)
+        return {
+            "config": {"url": self.url, "rate_per_min": rate_per_min, "count": count, "mix": mix},
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput_per_min": round(completed / elapsed * 60, 2) if elapsed else 0.0,
+            "outcomes": self.outcomes,
+            "error_rate": round(1 - completed / count, 4) if count else 0.0,
+            "latency_seconds": {stage: summarize(values) for stage, values in self.stages.items()},
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+def spawn_stack(mock_args: str) -> Tuple[str, List[subprocess.Popen]]:
+    """Start the mock LLM and the API (scratch SQLite db and uploads) as subprocesses"""
+    mock_port, api_port = _free_port(), _free_port()
+    work_dir = tempfile.mkdtemp(prefix="docusage-stack-")
+    env = dict(os.environ)
+    env.update({
+        "CEREBRAS_API_URL": f"http://127.0.0.1:{mock_port}/v1/chat/completions",
+        "CEREBRAS_API_KEY": "mock",
+        "SQLITE_PATH": os.path.join(work_dir, "docusage.db"),
+        "STORAGE_BACKEND": "local",
+    })
+    env.pop("DATABASE_URL", None)
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_llm", "--port", str(mock_port),
+         "--record-dir", os.path.join(work_dir, "recordings")] + shlex.split(mock_args),
+        cwd=BACKEND_DIR, env=env,
+    )
+    _wait_ready(f"http://127.0.0.1:{mock_port}/__mock/stats")
+
+    # Run from the scratch dir so uploads/ lands there too (tables are created at startup)
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(api_port), "--log-level", "warning"],
+        cwd=work_dir, env=env,
+    )
+    url = f"http://127.0.0.1:{api_port}"
+    _wait_ready(url)
+    return url, [api, mock]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DocuSage end-to-end load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="start API + mock LLM locally")
+    parser.add_argument("--mock-args", default="--mode synthetic", help="extra args for benchmarks.mock_llm")
+    parser.add_argument("--rate", type=float, default=30.0, help="arrivals per minute")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--mix", default="txt=0.5,pdf=0.5")
+    parser.add_argument("--variants", type=int, default=5, help="distinct documents per kind")
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--tests", type=int, default=25)
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--job-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    mix = parse_mix(args.mix)
+    documents = build_documents(mix, args.variants, args.pages, args.tests)
+
+    processes = []
+    url = args.url
+    if args.spawn:
+        url, processes = spawn_stack(args.mock_args)
+    try:
+        report = asyncio.run(LoadRun(url, args.poll_interval, args.job_timeout).run(
+            documents, mix, args.rate, args.count, args.seed
+        ))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Local OpenAI-compatible stand-in for the Cerebras chat completions API.
+
+Point the backend at it with
+    CEREBRAS_API_URL=http://127.0.0.1:8100/v1/chat/completions CEREBRAS_API_KEY=mock
+
+and run it with
+    python -m benchmarks.mock_llm --port 8100 --latency lognormal:-0.5,0.4 --tokens-per-sec 1800
+
+Modes:
+  replay  - answer from recordings keyed on a hash of the request; misses
+            fall back to a synthetic answer (or 404 with --miss error)
+  record  - forward to the real API (UPSTREAM_API_URL / CEREBRAS_API_KEY)
+            and save each response under its request hash
+  synthetic - always generate answers locally
+
+Faults (--p429, --ptimeout, --ptruncate, --pmalformed) are drawn from an
+RNG seeded with the request hash and attempt number, so a run is
+reproducible while retries of the same request can still succeed.
+"""
+import os
+import re
+import sys
+import json
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import LAB_TESTS  # noqa: E402
+from services.explanations import finding_direction  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MockConfig:
+    mode: str = "replay"
+    record_dir: str = os.path.join(os.path.dirname(__file__), "recordings")
+    miss: str = "synthesize"
+    upstream_url: str = "https://api.cerebras.ai/v1/chat/completions"
+    # "fixed:S", "uniform:A,B", "normal:MEAN,STD" or "lognormal:MU,SIGMA" (seconds)
+    latency: str = "fixed:0"
+    tokens_per_sec: float = 0.0
+    p429: float = 0.0
+    ptimeout: float = 0.0
+    ptruncate: float = 0.0
+    pmalformed: float = 0.0
+    timeout_seconds: float = 130.0
+    seed: int = 0
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def request_hash(payload: Dict) -> str:
+    """Stable key for a completion request (fields that change the answer)"""
+    key = {k: payload.get(k) for k in ("model", "messages", "temperature", "top_p", "seed")}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v] or [0.0]
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+# --- synthetic answers -------------------------------------------------------
+
+_NUM = r"\d+(?:\.\d+)?"
+_TEST_PATTERN = re.compile(
+    r"(?P<name>" + "|".join(re.escape(name) for name, _, _, _ in sorted(LAB_TESTS, key=lambda t: -len(t[0]))) + r")"
+    rf"\s+(?P<value>{_NUM})\s*(?P<unit>\S+)?\s+(?P<range><\s*{_NUM}|{_NUM}\s*-\s*{_NUM})"
+)
+
+
+def _status(value: float, normal_range: str) -> str:
+    numbers = [float(n) for n in re.findall(_NUM, normal_range)]
+    low, high = (0.0, numbers[0]) if normal_range.strip().startswith("<") else (numbers[0], numbers[-1])
+    if value < low or value > high:
+        return "URGENT"
+    span = (high - low) or high
+    if min(value - low, high - value) < 0.2 * span and low > 0:
+        return "MONITOR"
+    return "NORMAL"
+
+
+def synthetic_findings(text: str) -> List[Dict]:
+    findings = []
+    for match in _TEST_PATTERN.finditer(text):
+        unit = match.group("unit") or ""
+        normal_range = f"{match.group('range').replace(' ', '')} {unit}".strip()
+        status = _status(float(match.group("value")), normal_range)
+        findings.append({
+            "test_name": match.group("name"),
+            "value": f"{match.group('value')} {unit}".strip(),
+            "normal_range": normal_range,
+            "status": status,
+            "plain_english": f"Your {match.group('name')} result is {status.lower()}.",
+            "what_it_means": f"{match.group('name')} is a routine lab marker.",
+            "clinical_significance": "Discuss with your doctor if it is outside the range.",
+            "recommendations": ["Retest at your next checkup"],
+        })
+    return findings
+
+
+_ALREADY_RETURNED = re.compile(r"Already returned: (\[.*?\])\n")
+_KNOWN_RESULTS = re.compile(r"KNOWN RESULTS \(explanations already on file\), as \[test, status, direction\]: (\[.*?\])\n")
+_EXPLANATION_FIELDS = ("plain_english", "what_it_means", "clinical_significance", "recommendations")
+
+
+def _without_known(findings: List[Dict], system: str) -> List[Dict]:
+    """Follow the prompt: no explanation text for results the app already explains"""
+    known = _KNOWN_RESULTS.search(system)
+    results = {tuple(result) for result in json.loads(known.group(1))} if known else set()
+
+    def is_known(f: Dict) -> bool:
+        direction = finding_direction(f["value"], f["normal_range"], f["status"])
+        return (f["test_name"], f["status"], direction) in results
+
+    return [{k: v for k, v in f.items() if k not in _EXPLANATION_FIELDS} if is_known(f) else f for f in findings]
+
+
+def synthetic_content(messages: List[Dict]) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    document = next((m["content"] for m in messages if m.get("role") == "user"), "")
+
+    # Continuation of a truncated analysis: pick up after the findings already returned
+    already = _ALREADY_RETURNED.search(user)
+    if already and '"findings"' in system:
+        done = json.loads(already.group(1))
+        return json.dumps({"findings": _without_known(synthetic_findings(document)[len(done):], system)}, indent=2)
+
+    if "generic patient-friendly explanations" in system:
+        explanations = []
+        for line in user.splitlines():
+            name, _, rest = line.lstrip("- ").partition(" | ")
+            status, _, direction = rest.partition(" | ")
+            explanations.append({
+                "test_name": name, "status": status, "direction": direction,
+                "plain_english": f"A {status.lower()} {name} result ({direction}).",
+                "what_it_means": f"{name} is a routine lab marker.",
+                "clinical_significance": "Discuss with your doctor if it is outside the range.",
+                "recommendations": ["Retest at your next checkup"],
+            })
+        return json.dumps({"explanations": explanations})
+
+    if "medical document classifier" in system:
+        return "Lab Results"
+
+    if "prepare specific questions" in system:
+        tests = re.findall(r"• ([^:]+): ([^(]+)\(", user)[:3] or [("your results", "")]
+        return json.dumps({"questions": [
+            {"priority": "IMPORTANT", "question": f"My {name.strip()} is {value.strip()}. What should I do about it?",
+             "category": "Treatment"}
+            for name, value in tests
+        ]})
+
+    if '"findings"' in system:
+        findings = _without_known(synthetic_findings(user), system)
+        counts = {s: sum(1 for f in findings if f["status"] == s) for s in ("URGENT", "MONITOR", "NORMAL")}
+        overall = "URGENT" if counts["URGENT"] else "MONITOR" if counts["MONITOR"] else "NORMAL"
+        return json.dumps({
+            "overall_summary": f"{len(findings)} tests reviewed.",
+            "overall_status": overall,
+            "findings": findings,
+            "urgent_findings_count": counts["URGENT"],
+            "monitor_findings_count": counts["MONITOR"],
+            "normal_findings_count": counts["NORMAL"],
+        }, indent=2)
+
+    return "This is a synthetic summary of the document."
+
+
+def completion_body(payload: Dict, content: str, finish_reason: str = "stop") -> Dict:
+    prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in payload.get("messages", []))
+    completion_tokens = estimate_tokens(content)
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "model": payload.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def truncate(body: Dict, rng: random.Random, max_chars: Optional[int] = None) -> Dict:
+    content = body["choices"][0]["message"]["content"]
+    cut = content[:max_chars or max(1, int(len(content) * rng.uniform(0.3, 0.9)))]
+    body = json.loads(json.dumps(body))
+    body["choices"][0]["message"]["content"] = cut
+    body["choices"][0]["finish_reason"] = "length"
+    body["usage"]["completion_tokens"] = estimate_tokens(cut)
+    body["usage"]["total_tokens"] = body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+    return body
+
+
+def malform(body: Dict, rng: random.Random) -> Dict:
+    content = body["choices"][0]["message"]["content"]
+    body = json.loads(json.dumps(body))
+    # Typical LLM breakage: a dropped quote/comma plus a markdown fence
+    broken = content.replace('",', '"', 1) if '",' in content else content + ","
+    body["choices"][0]["message"]["content"] = "Here is the analysis:\n```json\n" + broken + "\n```"
+    return body
+
+
+# --- app ---------------------------------------------------------------------
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    os.makedirs(config.record_dir, exist_ok=True)
+    attempts: Dict[str, int] = {}
+    app = FastAPI(title="Mock Cerebras API")
+
+    def bump(name: str):
+        config.stats[name] = config.stats.get(name, 0) + 1
+
+    def recording_path(key: str) -> str:
+        return os.path.join(config.record_dir, f"{key}.json")
+
+    async def upstream(payload: Dict) -> Dict:
+        headers = {"Authorization": f"Bearer {os.getenv('CEREBRAS_API_KEY', '')}"}
+        async with httpx.AsyncClient(timeout=config.timeout_seconds) as client:
+            response = await client.post(config.upstream_url, headers=headers, json=payload)
+            response.raise_for_status()
+            return response.json()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        key = request_hash(payload)
+        attempt = attempts.get(key, 0)
+        attempts[key] = attempt + 1
+        rng = random.Random(f"{config.seed}:{key}:{attempt}")
+        bump("requests")
+
+        # Faults are drawn before any work so they cost no upstream budget
+        roll = rng.random()
+        if roll < config.p429:
+            bump("429")
+            return JSONResponse(status_code=429, headers={"Retry-After": "1"},
+                                content={"error": {"message": "Rate limit exceeded (mock)"}})
+        roll -= config.p429
+        if roll < config.ptimeout:
+            bump("timeout")
+            await asyncio.sleep(config.timeout_seconds)
+            return JSONResponse(status_code=504, content={"error": {"message": "Timed out (mock)"}})
+
+        path = recording_path(key)
+        if config.mode != "synthetic" and os.path.exists(path):
+            with open(path) as f:
+                body = json.load(f)
+            bump("replayed")
+        elif config.mode == "record":
+            body = await upstream(payload)
+            with open(path, "w") as f:
+                json.dump(body, f)
+            bump("recorded")
+        elif config.mode == "replay" and config.miss == "error":
+            bump("miss")
+            return JSONResponse(status_code=404, content={"error": {"message": f"No recording for {key}"}})
+        else:
+            body = completion_body(payload, synthetic_content(payload.get("messages", [])))
+            bump("synthesized")
+
+        # Honour max_tokens like the real API: cut the answer, finish_reason "length"
+        max_tokens = payload.get("max_tokens")
+        if max_tokens and body.get("usage", {}).get("completion_tokens", 0) > max_tokens:
+            body = truncate(body, rng, max_chars=max_tokens * 4)
+            bump("length")
+
+        fault = rng.random()
+        if fault < config.ptruncate:
+            body = truncate(body, rng)
+            bump("truncated")
+        elif fault < config.ptruncate + config.pmalformed:
+            body = malform(body, rng)
+            bump("malformed")
+
+        delay = sample_latency(config.latency, rng)
+        if config.tokens_per_sec:
+            delay += body.get("usage", {}).get("completion_tokens", 0) / config.tokens_per_sec
+        if delay:
+            await asyncio.sleep(delay)
+
+        return JSONResponse(status_code=200, content=body)
+
+    @app.get("/__mock/stats")
+    async def stats():
+        return config.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Cerebras chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--mode", choices=["replay", "record", "synthetic"], default="replay")
+    parser.add_argument("--record-dir", default=MockConfig.record_dir)
+    parser.add_argument("--miss", choices=["synthesize", "error"], default="synthesize")
+    parser.add_argument("--upstream-url", default=os.getenv("UPSTREAM_API_URL", MockConfig.upstream_url))
+    parser.add_argument("--latency", default="fixed:0")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--p429", type=float, default=0.0)
+    parser.add_argument("--ptimeout", type=float, default=0.0)
+    parser.add_argument("--ptruncate", type=float, default=0.0)
+    parser.add_argument("--pmalformed", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=130.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(**{k: v for k, v in vars(args).items() if k not in ("host", "port")})
+    sample_latency(config.latency, random.Random(0))  # validate the spec up front
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Extraction / parsing / database micro-benchmarks.
+
+    python -m benchmarks.run --pages 3 --tests 30 --output bench.json
+    python -m benchmarks.run --compare bench.json     # fail on regressions
+
+Set BENCH_DATABASE_URL to include the PostgreSQL backend.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import build_corpus, generate_report, synthetic_llm_response  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+REGRESSION_THRESHOLD = 0.15
+
+
+async def _time(fn: Callable[[], Awaitable], repeat: int) -> Dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def _sync(fn, *args):
+    async def wrapper():
+        return fn(*args)
+    return wrapper
+
+
+async def bench_processor(paths: Dict[str, str], repeat: int, results: Dict):
+    from services.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    for kind, path in paths.items():
+        name = f"extract_text.{kind}"
+        try:
+            await processor.extract_text(path)  # warm-up (imports, OCR engine)
+            results[name] = await _time(lambda: processor.extract_text(path), repeat)
+        except Exception as e:
+            results[name] = {"error": str(e)}
+
+    with open(paths["txt"], encoding="utf-8") as f:
+        raw = f.read()
+    results["clean_text"] = await _time(_sync(processor.clean_text, raw * 10), repeat * 10)
+
+
+def _rows_intact(pages, report) -> float:
+    """Share of findings whose name and value come out on the same line"""
+    lines = [line for text in pages for line in text.splitlines()]
+    findings = [f for page in report for f in page]
+    intact = sum(1 for f in findings if any(f["test_name"] in line and f["value"] in line for line in lines))
+    return round(intact / len(findings), 4) if findings else 1.0
+
+
+async def bench_pdf_layout(paths: Dict[str, str], report, repeat: int, results: Dict):
+    """
+    Net effect of the layout pass: time and rows kept intact per PDF_LAYOUT_PAGES
+    setting, on text-line PDFs and on tables read back in row or column order
+    """
+    from services import pdf_extractors
+
+    if not pdf_extractors.get_extractor(pdf_extractors.PDF_LAYOUT_EXTRACTOR):
+        return
+    setting = pdf_extractors.PDF_LAYOUT_PAGES
+    try:
+        for kind in ("pdf", "table_pdf", "table_columns_pdf"):
+            path = paths[kind]
+            for mode in ("none", "tables", "all"):
+                pdf_extractors.PDF_LAYOUT_PAGES = mode
+                name = f"pdf_layout.{kind}.{mode}"
+                pages = pdf_extractors.extract_pdf_pages(path)  # warm-up
+                results[name] = await _time(_sync(pdf_extractors.extract_pdf_pages, path), repeat)
+                results[name]["rows_intact"] = _rows_intact(pages, report)
+            pdf_extractors.PDF_LAYOUT_PAGES = "none"
+            fast_pages = pdf_extractors.extract_pdf_pages(path)
+            results[f"pdf_layout.{kind}.tables"]["pages_reread"] = sum(
+                1 for text in fast_pages if pdf_extractors.lost_table_layout(text)
+            )
+    finally:
+        pdf_extractors.PDF_LAYOUT_PAGES = setting
+
+
+async def bench_json_repair(findings, repeat: int, results: Dict):
+    from services.json_repair import parse_partial_json
+
+    truncated = synthetic_llm_response(findings, truncate_at=0.9)
+    results["parse_partial_json.truncated"] = await _time(_sync(parse_partial_json, truncated), repeat)
+    fenced = "Here is the analysis:\n```json\n" + synthetic_llm_response(findings, truncate_at=1.0) + "\n```"
+    results["parse_partial_json.fenced"] = await _time(_sync(parse_partial_json, fenced), repeat)
+
+
+async def bench_database(name: str, db, report, repeat: int, results: Dict):
+    from models.schemas import DocumentMetadata
+
+    await db.init_tables()
+    base = datetime.utcnow()
+    counter = {"n": 0}
+    findings = [f for page in report for f in page]
+
+    async def save():
+        counter["n"] += 1
+        document_id = f"bench-{os.getpid()}-{base.timestamp()}-{counter['n']}"
+        await db.save_document_metadata(DocumentMetadata(
+            document_id=document_id, filename="bench.pdf", file_type="application/pdf",
+            upload_time=base, status="processing"
+        ))
+        await db.save_analysis(document_id, {
+            "analysis": {"findings": findings},
+            "processed_at": (base + timedelta(minutes=counter["n"])).isoformat(),
+        })
+
+    results[f"{name}.save_analysis"] = await _time(save, repeat)
+    test_name = findings[0]["test_name"]
+    results[f"{name}.get_trends"] = await _time(lambda: db.get_trends("", test_name), repeat)
+    await db.disconnect()
+
+
+async def run(args) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix="docusage-bench-")
+    report = generate_report(args.pages, args.tests, args.seed)
+    paths = build_corpus(work_dir, args.pages, args.tests, args.seed, scans=not args.no_ocr)
+    results: Dict[str, Dict] = {}
+
+    await bench_processor(paths, args.repeat, results)
+    await bench_pdf_layout(paths, report, args.repeat, results)
+    await bench_json_repair([f for page in report for f in page], args.repeat, results)
+
+    from database.sqlite_db import SQLiteDatabase
+    sqlite_db = SQLiteDatabase()
+    sqlite_db.db_path = os.path.join(work_dir, "bench.db")
+    await bench_database("sqlite", sqlite_db, report, args.repeat, results)
+
+    if os.getenv("BENCH_DATABASE_URL"):
+        from database.db import Database
+        pg = Database()
+        pg.db_url = os.environ["BENCH_DATABASE_URL"]
+        await bench_database("postgres", pg, report, args.repeat, results)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pages": args.pages,
+            "tests_per_page": args.tests,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> bool:
+    """Print median deltas against a baseline run; True if nothing regressed"""
+    ok = True
+    for name, cur in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(name)
+        if "median_ms" not in cur or not base or "median_ms" not in base:
+            continue
+        delta = (cur["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+        flag = ""
+        if delta > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<45}{base['median_ms']:>10.2f}ms -> {cur['median_ms']:>10.2f}ms  {delta:+.1%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DocuSage extraction benchmarks")
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--tests", type=int, default=25, help="tests per page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-ocr", action="store_true", help="skip scanned image/PDF inputs")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# Maintenance commands, run from backend/ as python -m commands.<name>
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+load_dotenv()
+
+from database import select_database  # noqa: E402
+from services.explanations import ExplanationCache  # noqa: E402
+from services.pipeline import DocumentPipeline  # noqa: E402
+from services.storage import get_storage  # noqa: E402
+
+
+@asynccontextmanager
+async def open_pipeline() -> AsyncIterator[DocumentPipeline]:
+    """The database, analyzer and pipeline, set up the way the API sets them up"""
+    from services.document_processor import DocumentProcessor
+    from services.llama_analyzer import LlamaAnalyzer
+
+    db = await select_database()
+    llama_analyzer = LlamaAnalyzer()
+    llama_analyzer.explanations = ExplanationCache(db)
+    await llama_analyzer.explanations.load()
+    try:
+        yield DocumentPipeline(DocumentProcessor(), llama_analyzer, get_storage(), db)
+    finally:
+        await llama_analyzer.drain()
+        await db.disconnect()
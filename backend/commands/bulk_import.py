@@ -0,0 +1,302 @@
+"""
+Import a directory of historical documents (PDF, JPG, PNG, TXT) without
+going through one HTTP upload per file:
+
+    python -m commands.bulk_import /data/clinic-archive --extract-workers 8 --llm-concurrency 4 --rate 120
+
+Files are deduplicated by content hash, against each other and against
+documents already in the database. Text extraction runs in a process
+pool; extracted documents then go through a rate-limited queue to the
+LLM stages (the same DocumentPipeline the API uses).
+
+Progress lives in the database: extracted text and stage checkpoints are
+stored as they finish, so running the same import again skips completed
+documents and picks the others up at the stage where they stopped.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+from commands import open_pipeline
+from database.db import WORKER_CONCURRENCY
+from models.schemas import DocumentMetadata
+from services.document_processor import DocumentProcessor
+from services.pipeline import DocumentPipeline
+from services.storage import CHUNK_SIZE, CONTENT_TYPE_EXTENSIONS, MAX_UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_CONTENT_TYPES = {extension: content_type for content_type, extension in CONTENT_TYPE_EXTENSIONS.items()}
+EXTENSION_CONTENT_TYPES["jpeg"] = "image/jpeg"
+
+
+def find_files(root: str) -> List[str]:
+    """Supported files under root, in a stable order"""
+    found = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.rsplit(".", 1)[-1].lower() in EXTENSION_CONTENT_TYPES:
+                found.append(os.path.join(directory, name))
+    return found
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _extract(path: str) -> str:
+    """Runs in a pool process: the same extraction the API does"""
+    try:
+        return asyncio.run(DocumentProcessor().extract_text(path))
+    except Exception as e:
+        # Library exceptions don't always unpickle, which would break the whole pool
+        raise RuntimeError(str(e)) from None
+
+
+class RateLimiter:
+    """Spaces out starts to at most per_minute a minute (0 = unlimited)"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class ImportReport:
+    files: int
+    new: int = 0
+    resumed: int = 0
+    duplicates: int = 0  # same content as another file or a completed document
+    extracted: int = 0
+    analyzed: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+class BulkImporter:
+    def __init__(self, pipeline: DocumentPipeline, extract_workers: int = os.cpu_count() or 1,
+                 llm_concurrency: int = WORKER_CONCURRENCY, rate: float = 0,
+                 max_bytes: int = MAX_UPLOAD_BYTES, progress_seconds: float = 10):
+        self.pipeline = pipeline
+        self.db = pipeline.db
+        self.extract_workers = extract_workers
+        self.llm_concurrency = llm_concurrency
+        self.limiter = RateLimiter(rate)
+        self.max_bytes = max_bytes
+        self.progress_seconds = progress_seconds
+        self._seen: Set[str] = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.report: Optional[ImportReport] = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already runs an event loop and threads isn't safe
+        return ProcessPoolExecutor(self.extract_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def run(self, root: str) -> ImportReport:
+        files = await run_in_threadpool(find_files, root)
+        self.report = ImportReport(files=len(files))
+        logger.info(f"📥 Importing {len(files)} files from {root}")
+
+        started = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        workers = [asyncio.create_task(self._analyze_worker(queue)) for _ in range(self.llm_concurrency)]
+        progress = asyncio.create_task(self._log_progress(started, queue))
+
+        self._pool = self._new_pool()
+        try:
+            # Hash/store/extract a few files ahead of the busy pool processes, not the whole directory
+            slots = asyncio.Semaphore(self.extract_workers * 2)
+            ingesting = set()
+            for path in files:
+                await slots.acquire()
+                task = asyncio.create_task(self._ingest(root, path, queue))
+                task.add_done_callback(lambda done: slots.release())
+                ingesting.add(task)
+                task.add_done_callback(ingesting.discard)
+            if ingesting:
+                await asyncio.gather(*ingesting)
+        finally:
+            self._pool.shutdown()
+
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+        progress.cancel()
+
+        self.report.seconds = round(time.perf_counter() - started, 2)
+        self._progress_line(started, queue)
+        return self.report
+
+    async def _ingest(self, root: str, path: str, queue: asyncio.Queue):
+        """Register one file as a document and extract its text unless that's already done"""
+        report = self.report
+        document_id = None
+        try:
+            content_hash = await run_in_threadpool(_hash_file, path)
+            if content_hash in self._seen:
+                report.duplicates += 1
+                return
+            self._seen.add(content_hash)
+
+            existing = await self.db.find_document_by_hash(content_hash)
+            if existing and existing["status"] == "completed":
+                report.duplicates += 1
+                return
+            if existing:
+                document_id, storage_key = existing["document_id"], existing["storage_key"]
+                report.resumed += 1
+            else:
+                document_id, storage_key = await self._register(root, path)
+                report.new += 1
+
+            if "extract" not in await self.db.get_checkpoints(document_id):
+                text = await self._extract_text(path)
+                if not text:
+                    raise ValueError("no text could be extracted")
+                await self.db.save_extracted_text(document_id, text)
+                await self.db.save_checkpoint(document_id, "extract", {"chars": len(text)})
+                report.extracted += 1
+
+            await queue.put((document_id, storage_key))
+        except Exception as e:
+            report.failed += 1
+            logger.warning(f"⚠️  Import of {path} failed: {e}")
+            if document_id:
+                await self.db.update_document_status(document_id, "failed")
+
+    async def _extract_text(self, path: str) -> str:
+        """
+        Extract in the pool. A native OCR crash takes the pool down with it,
+        so the pool is replaced and the file tried once more; files that
+        still fail are left for the next run.
+        """
+        for attempt in range(2):
+            pool = self._pool
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, _extract, path)
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                if self._pool is pool:
+                    logger.warning("⚠️  An extraction process died; starting a new pool")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._new_pool()
+
+    async def _register(self, root: str, path: str):
+        extension = path.rsplit(".", 1)[-1].lower()
+        content_type = EXTENSION_CONTENT_TYPES[extension]
+        storage = self.pipeline.storage
+        with open(path, "rb") as f:
+            stored = await storage.save(f, CONTENT_TYPE_EXTENSIONS[content_type], self.max_bytes)
+
+            document_id = str(uuid.uuid4())
+            await self.db.save_document_metadata(DocumentMetadata(
+                document_id=document_id,
+                filename=os.path.relpath(path, root),
+                file_type=content_type,
+                upload_time=datetime.utcnow(),
+                status="processing",
+                storage_key=stored.key,
+                file_size=stored.size,
+                content_hash=stored.content_hash
+            ))
+            # The API may have deleted the deduplicated file since save() (see main._record_upload)
+            if not await storage.exists(stored.key):
+                f.seek(0)
+                await storage.save(f, CONTENT_TYPE_EXTENSIONS[content_type], self.max_bytes)
+        return document_id, stored.key
+
+    async def _analyze_worker(self, queue: asyncio.Queue):
+        """Run the LLM stages (resuming from the extract checkpoint) for queued documents"""
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            document_id, storage_key = item
+            await self.limiter.wait()
+            try:
+                await self.pipeline.run(document_id, storage_key, "import")
+                self.report.analyzed += 1
+            except Exception as e:
+                self.report.failed += 1
+                logger.warning(f"⚠️  Analysis of {document_id} failed: {e}")
+
+    async def _log_progress(self, started: float, queue: asyncio.Queue):
+        while True:
+            await asyncio.sleep(self.progress_seconds)
+            self._progress_line(started, queue)
+
+    def _progress_line(self, started: float, queue: asyncio.Queue):
+        report = self.report
+        minutes = (time.perf_counter() - started) / 60 or 1e-9
+        logger.info(
+            f"   extracted {report.extracted} ({report.extracted / minutes:.1f}/min), "
+            f"analyzed {report.analyzed} ({report.analyzed / minutes:.1f}/min), "
+            f"{report.duplicates} duplicates, {report.failed} failed, {queue.qsize()} waiting for the LLM"
+        )
+
+
+async def main(args) -> int:
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 2
+    async with open_pipeline() as pipeline:
+        importer = BulkImporter(
+            pipeline,
+            extract_workers=args.extract_workers,
+            llm_concurrency=args.llm_concurrency,
+            rate=args.rate,
+            max_bytes=args.max_mb * 1024 * 1024,
+            progress_seconds=args.progress_seconds,
+        )
+        report = await importer.run(args.directory)
+        print(json.dumps(asdict(report), indent=2))
+        return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a directory of historical documents")
+    parser.add_argument("directory", help="directory to import (searched recursively)")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="processes extracting text (default: CPU count)")
+    parser.add_argument("--llm-concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="documents in the LLM stages at once (default WORKER_CONCURRENCY)")
+    parser.add_argument("--rate", type=float, default=0, help="documents started on the LLM per minute (0 = no limit)")
+    parser.add_argument("--max-mb", type=int, default=MAX_UPLOAD_BYTES // (1024 * 1024), help="largest file accepted")
+    parser.add_argument("--progress-seconds", type=float, default=10, help="seconds between throughput lines")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        sys.exit(asyncio.run(main(parser.parse_args())))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
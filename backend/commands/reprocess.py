@@ -0,0 +1,142 @@
+"""
+Bring stored analyses up to date after a prompt or model change.
+
+Every analysis records LlamaAnalyzer.prompt_version (a hash of the model
+and prompts). This finds documents without an analysis for the current
+version and reruns their LLM stages from the stored text:
+
+    python -m commands.reprocess --dry-run
+    python -m commands.reprocess --concurrency 8 --token-budget 2000000
+
+Runs are resumable: a reprocessed document drops out of the stale set, so
+an interrupted or budget-limited run can simply be started again.
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from commands import open_pipeline
+from database.db import WORKER_CONCURRENCY
+from services.pipeline import DocumentPipeline
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReprocessReport:
+    prompt_version: str
+    stale: int
+    reprocessed: int = 0
+    failed: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    stopped: Optional[str] = None  # "token_budget" / "limit" when cut short
+
+
+async def reprocess(pipeline: DocumentPipeline, concurrency: int = WORKER_CONCURRENCY,
+                    token_budget: int = 0, limit: int = 0, batch_size: int = 100,
+                    progress_every: int = 10) -> ReprocessReport:
+    """
+    Reanalyze stale documents, at most `concurrency` at a time. No new
+    document is started once `token_budget` tokens (0 = unlimited) or
+    `limit` documents (0 = all) have been used up.
+    """
+    db, analyzer = pipeline.db, pipeline.llama_analyzer
+    report = ReprocessReport(prompt_version=analyzer.prompt_version,
+                             stale=await db.count_stale_documents(analyzer.prompt_version))
+    logger.info(f"🔄 {report.stale} documents to reprocess for prompt version {report.prompt_version}")
+
+    started = time.perf_counter()
+    tokens_before = analyzer.tokens_used
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    def log_progress():
+        done = report.reprocessed + report.failed
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        eta = (min(report.stale, limit or report.stale) - done) / rate if rate else 0.0
+        logger.info(
+            f"   {done}/{report.stale} done ({report.failed} failed), "
+            f"{analyzer.tokens_used - tokens_before} tokens, {rate * 60:.1f} docs/min, ETA {eta:.0f}s"
+        )
+
+    async def run_one(document_id: str):
+        try:
+            await pipeline.reanalyze(document_id)
+            report.reprocessed += 1
+        except Exception as e:
+            report.failed += 1
+            logger.warning(f"⚠️  Reprocessing {document_id} failed: {e}")
+        finally:
+            slots.release()
+            if (report.reprocessed + report.failed) % progress_every == 0:
+                log_progress()
+
+    # Keyset paging: documents that fail are not retried within this run
+    after = ""
+    scheduled = 0
+    while report.stopped is None:
+        batch = await db.list_stale_documents(report.prompt_version, after, batch_size)
+        if not batch:
+            break
+        after = batch[-1]
+        for document_id in batch:
+            await slots.acquire()
+            if token_budget and analyzer.tokens_used - tokens_before >= token_budget:
+                report.stopped = "token_budget"
+            elif limit and scheduled >= limit:
+                report.stopped = "limit"
+            if report.stopped:
+                slots.release()
+                break
+            scheduled += 1
+            task = asyncio.create_task(run_one(document_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    if running:
+        await asyncio.gather(*running)
+    report.tokens = analyzer.tokens_used - tokens_before
+    report.seconds = round(time.perf_counter() - started, 2)
+    log_progress()
+    if report.stopped:
+        logger.info(f"⏸️  Stopped early ({report.stopped}); run again to continue")
+    return report
+
+
+async def main(args) -> int:
+    async with open_pipeline() as pipeline:
+        if args.dry_run:
+            version = pipeline.llama_analyzer.prompt_version
+            stale = await pipeline.db.count_stale_documents(version)
+            print(json.dumps({"prompt_version": version, "stale": stale}, indent=2))
+            return 0
+        report = await reprocess(
+            pipeline,
+            concurrency=args.concurrency,
+            token_budget=args.token_budget,
+            limit=args.limit,
+            batch_size=args.batch_size,
+            progress_every=args.progress_every,
+        )
+        print(json.dumps(asdict(report), indent=2))
+        return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reanalyze documents analyzed with an older prompt/model version")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="documents in flight at once (default WORKER_CONCURRENCY)")
+    parser.add_argument("--token-budget", type=int, default=0, help="stop starting documents after this many tokens (0 = no limit)")
+    parser.add_argument("--limit", type=int, default=0, help="reprocess at most this many documents (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=100, help="stale documents fetched per query")
+    parser.add_argument("--progress-every", type=int, default=10, help="log progress every N documents")
+    parser.add_argument("--dry-run", action="store_true", help="only report the prompt version and stale count")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(asyncio.run(main(parser.parse_args())))
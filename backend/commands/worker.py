@@ -0,0 +1,117 @@
+"""
+Standalone processing worker, so OCR/LLM load stays off the API process:
+
+    PROCESSING_MODE=worker uvicorn main:app      # uploads are only queued
+    python -m commands.worker --concurrency 4    # as many of these as needed
+
+Queued documents are rows in `documents` with status 'processing'. A
+worker claims one (FOR UPDATE SKIP LOCKED on Postgres, a conditional
+UPDATE on SQLite) and runs the same DocumentPipeline as the API,
+which heartbeats the claim while it works. A worker that dies stops
+heartbeating; after PIPELINE_CLAIM_TTL seconds another worker reclaims the
+document and resumes it from its last checkpoint.
+
+Several nodes need the Postgres database and shared (S3) storage.
+SIGTERM/SIGINT stop claiming and let running jobs finish.
+"""
+import os
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+
+from prometheus_client import start_http_server
+
+from commands import open_pipeline
+from database.db import WORKER_CONCURRENCY
+from services.pipeline import CLAIM_TTL, DocumentPipeline
+
+logger = logging.getLogger(__name__)
+
+# Seconds between queue checks while there is nothing to claim
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+
+
+class Worker:
+    def __init__(self, pipeline: DocumentPipeline, concurrency: int = WORKER_CONCURRENCY,
+                 poll_seconds: float = POLL_SECONDS):
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+
+    async def run(self):
+        """Claim and process documents until stop() is called"""
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        logger.info(f"👷 Worker {self.pipeline.owner} started ({self.concurrency} slots)")
+
+        while not self.stopping.is_set():
+            await slots.acquire()
+            job = None
+            if not self.stopping.is_set():
+                try:
+                    job = await self.pipeline.db.claim_next_document(self.pipeline.owner, CLAIM_TTL)
+                except Exception as e:
+                    logger.warning(f"⚠️  Could not claim a job: {e}")
+            if job is None:
+                slots.release()
+                await self._idle()
+                continue
+
+            task = asyncio.create_task(self._process(job))
+            task.add_done_callback(lambda done: slots.release())
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+        if running:
+            logger.info(f"Stopping: waiting for {len(running)} running job(s)")
+            await asyncio.gather(*running)
+        logger.info(f"👋 Worker stopped ({self.processed} processed, {self.failed} failed)")
+
+    def stop(self):
+        self.stopping.set()
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), self.poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _process(self, job):
+        document_id = job["document_id"]
+        try:
+            # Already claimed by this owner, so the pipeline takes it straight away
+            await self.pipeline.run(document_id, job["storage_key"], "worker")
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"⚠️  Job {document_id} failed: {e}")
+
+
+async def main(args) -> int:
+    async with open_pipeline() as pipeline:
+        worker = Worker(pipeline, concurrency=args.concurrency, poll_seconds=args.poll_seconds)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued documents outside the API process")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="documents processed at once (default WORKER_CONCURRENCY)")
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS,
+                        help="wait between queue checks when idle (default WORKER_POLL_SECONDS)")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve Prometheus metrics for this worker on this port (0 = off)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    sys.exit(asyncio.run(main(args)))
@@ -1 +1,43 @@
-# Database package
\ No newline at end of file
+# Database package
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for PostgreSQL before falling back to SQLite
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+
+async def select_database():
+    """
+    Use PostgreSQL when DATABASE_URL points at a reachable server (the pool
+    is opened and warmed here), SQLite otherwise. Tables are created either
+    way. Only a failed or timed-out connection falls back to SQLite; errors
+    after connecting close the pool and are raised.
+    """
+    db_url = os.getenv("DATABASE_URL", "")
+    if db_url.startswith(("postgresql://", "postgres://")):
+        try:
+            from database.db import Database
+            database = Database()
+            await asyncio.wait_for(database.connect(), timeout=DB_CONNECT_TIMEOUT)
+        except Exception as e:
+            logger.info(f"📦 Using SQLite database (PostgreSQL not available: {e!r})")
+        else:
+            try:
+                await database.init_tables()
+                await database.warm_up()
+            except BaseException:
+                # Reachable but unusable: running on SQLite now would split data between two stores
+                await database.disconnect()
+                raise
+            logger.info("✅ Using PostgreSQL database")
+            return database
+    else:
+        logger.info("📦 Using SQLite database (no PostgreSQL configured)")
+
+    from database.sqlite_db import SQLiteDatabase
+    database = SQLiteDatabase()
+    await database.init_tables()
+    return database
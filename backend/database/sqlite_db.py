@@ -1,13 +1,23 @@
 import os
+import zlib
 import sqlite3
 import json
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
 import logging
 
+from services.export import EXPORT_BATCH_SIZE
+from services.metrics import timed_queries
+from services.test_names import canonical_test_key
+
 logger = logging.getLogger(__name__)
 
 
+def _unzip_text(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+
+@timed_queries("sqlite")
 class SQLiteDatabase:
     """
     SQLite database interface for DocuSage (development/demo mode)
@@ -15,14 +25,23 @@ class SQLiteDatabase:
     """
 
     def __init__(self):
-        self.db_path = os.path.join(os.path.dirname(__file__), "..", "docusage.db")
+        self.db_path = os.getenv(
+            "SQLITE_PATH",
+            os.path.join(os.path.dirname(__file__), "..", "docusage.db")
+        )
         self.conn = None
+        self.fts_enabled = False
 
     async def connect(self):
         """Initialize database connection"""
         if not self.conn:
             self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             self.conn.row_factory = sqlite3.Row
+            # Used by the documents_text view the search index reads its content from
+            self.conn.create_function("unzip_text", 1, _unzip_text, deterministic=True)
+            self.fts_enabled = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+            ).fetchone() is not None
             logger.info(f"SQLite database connected: {self.db_path}")
 
     async def disconnect(self):
@@ -32,6 +51,14 @@ class SQLiteDatabase:
             self.conn = None
             logger.info("SQLite database connection closed")
 
+    async def warm_up(self):
+        """Nothing to pool; just open the connection"""
+        await self.connect()
+
+    def pool_stats(self) -> Dict:
+        """SQLite uses one shared connection"""
+        return {"backend": "sqlite", "connected": self.conn is not None}
+
     async def init_tables(self):
         """Create database tables if they don't exist"""
         await self.connect()
@@ -50,6 +77,9 @@ class SQLiteDatabase:
                 processed_time TEXT,
                 document_type TEXT,
                 extracted_text TEXT,
+                storage_key TEXT,
+                file_size INTEGER,
+                content_hash TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -71,6 +101,7 @@ class SQLiteDatabase:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 document_id TEXT NOT NULL,
                 test_name TEXT NOT NULL,
+                test_key TEXT,
                 value REAL,
                 value_text TEXT,
                 status TEXT,
@@ -80,14 +111,128 @@ class SQLiteDatabase:
             )
         """)
 
+        # Per-run stage timing / resource traces
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS processing_traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                total_seconds REAL NOT NULL,
+                trace_data TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            )
+        """)
+
+        # Output of each completed pipeline stage, so a retry resumes after it
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+                document_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (document_id, stage),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            )
+        """)
+
+        # Generic test explanations shared across documents (services/explanations.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS explanations (
+                test_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                test_name TEXT,
+                plain_english TEXT,
+                what_it_means TEXT,
+                clinical_significance TEXT,
+                recommendations TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (test_key, status, direction)
+            )
+        """)
+
+        # Columns added after the initial schema
+        self._ensure_column(cursor, "findings", "test_key", "TEXT")
+        self._ensure_column(cursor, "documents", "storage_key", "TEXT")
+        self._ensure_column(cursor, "documents", "file_size", "INTEGER")
+        self._ensure_column(cursor, "documents", "content_hash", "TEXT")
+        self._ensure_column(cursor, "documents", "claimed_by", "TEXT")
+        self._ensure_column(cursor, "documents", "claimed_at", "TEXT")
+        self._ensure_column(cursor, "documents", "pipeline_stage", "TEXT")
+        self._ensure_column(cursor, "documents", "extracted_text_z", "BLOB")
+        self._ensure_column(cursor, "analyses", "prompt_version", "TEXT")
+        self._ensure_column(cursor, "explanations", "hits", "INTEGER NOT NULL DEFAULT 0")
+        self._backfill_test_keys(cursor)
+
         # Create indices
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_document_id ON documents(document_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyses_document_id ON analyses(document_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_findings_test_name ON findings(test_name, test_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_findings_test_key ON findings(test_key, test_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_findings_document_id ON findings(document_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_storage_key ON documents(storage_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)")
+        # Job queue for commands/worker.py: documents still waiting to be processed
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_queue ON documents(upload_time) WHERE status = 'processing'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_traces_document_id ON processing_traces(document_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_traces_total_seconds ON processing_traces(total_seconds)")
+
+        # Full-text index over extracted text (FTS5 is compiled into most SQLite builds).
+        # External content: the index keeps only terms and reads text (for snippets)
+        # through documents_text, so the text itself is stored once, compressed.
+        try:
+            legacy = cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+            ).fetchone()
+            rebuild = legacy is not None and "content=" not in legacy[0].replace(" ", "")
+            if rebuild:
+                # Older index with its own full copy of every text
+                cursor.execute("DROP TABLE documents_fts")
+            cursor.execute("""
+                CREATE VIEW IF NOT EXISTS documents_text AS
+                SELECT id, filename, COALESCE(unzip_text(extracted_text_z), extracted_text) AS extracted_text
+                FROM documents
+                WHERE extracted_text_z IS NOT NULL OR extracted_text IS NOT NULL
+            """)
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    filename,
+                    extracted_text,
+                    content = 'documents_text',
+                    content_rowid = 'id',
+                    tokenize = 'porter unicode61'
+                )
+            """)
+            if rebuild:
+                cursor.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+                logger.info("Rebuilt the search index without its copy of the text")
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, search falls back to LIKE: {e}")
 
         self.conn.commit()
         logger.info("SQLite database tables initialized")
 
+    def _ensure_column(self, cursor, table: str, column: str, definition: str):
+        """Add a column to an existing table (SQLite has no ADD COLUMN IF NOT EXISTS)"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Added column {table}.{column}")
+
+    def _backfill_test_keys(self, cursor):
+        """Populate test_key for findings saved before canonicalization existed"""
+        cursor.execute("SELECT DISTINCT test_name FROM findings WHERE test_key IS NULL")
+        names = [row[0] for row in cursor.fetchall()]
+        if names:
+            cursor.executemany(
+                "UPDATE findings SET test_key = ? WHERE test_name = ? AND test_key IS NULL",
+                [(canonical_test_key(name), name) for name in names]
+            )
+            logger.info(f"Backfilled test_key for {len(names)} test names")
+
     async def save_document_metadata(self, metadata):
         """Save document metadata"""
         await self.connect()
@@ -95,20 +240,124 @@ class SQLiteDatabase:
         cursor = self.conn.cursor()
         cursor.execute("""
             INSERT OR REPLACE INTO documents 
-            (document_id, filename, file_type, upload_time, status)
-            VALUES (?, ?, ?, ?, ?)
+            (document_id, filename, file_type, upload_time, status,
+             storage_key, file_size, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """,
             (
                 metadata.document_id,
                 metadata.filename,
                 metadata.file_type,
                 metadata.upload_time.isoformat(),
-                metadata.status.value if hasattr(metadata.status, 'value') else metadata.status
+                metadata.status.value if hasattr(metadata.status, 'value') else metadata.status,
+                getattr(metadata, 'storage_key', None),
+                getattr(metadata, 'file_size', None),
+                getattr(metadata, 'content_hash', None)
             )
         )
         self.conn.commit()
         logger.info(f"Document metadata saved: {metadata.document_id}")
 
+    async def get_document(self, document_id: str) -> Optional[Dict]:
+        """Fetch a document row (without extracted text)"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT 
+                document_id, filename, file_type, upload_time, status,
+                processed_time, document_type, storage_key, file_size, content_hash,
+                claimed_by, claimed_at, pipeline_stage
+            FROM documents
+            WHERE document_id = ?
+        """, (document_id,))
+
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    async def claim_document(self, document_id: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Claim a document for processing (or refresh an existing claim). Fails
+        while another owner holds a claim younger than ttl_seconds.
+        """
+        await self.connect()
+
+        now = datetime.utcnow()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE documents
+            SET claimed_by = ?, claimed_at = ?
+            WHERE document_id = ?
+            AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)
+        """, (owner, now.isoformat(), document_id, owner, (now - timedelta(seconds=ttl_seconds)).isoformat()))
+        self.conn.commit()
+        return cursor.rowcount == 1
+
+    async def claim_next_document(self, owner: str, ttl_seconds: float) -> Optional[Dict]:
+        """
+        Claim the oldest queued document: status 'processing' and unclaimed,
+        or claimed by a worker that stopped heartbeating ttl_seconds ago.
+        Each candidate is taken with a conditional UPDATE, so only one of
+        several competing workers gets it.
+        """
+        await self.connect()
+
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=ttl_seconds)).isoformat()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT document_id, storage_key FROM documents
+            WHERE status = 'processing' AND storage_key IS NOT NULL
+            AND (claimed_by IS NULL OR claimed_at < ?)
+            ORDER BY upload_time
+            LIMIT 10
+        """, (stale,))
+        for candidate in cursor.fetchall():
+            cursor.execute("""
+                UPDATE documents
+                SET claimed_by = ?, claimed_at = ?
+                WHERE document_id = ? AND status = 'processing'
+                AND (claimed_by IS NULL OR claimed_at < ?)
+            """, (owner, now.isoformat(), candidate['document_id'], stale))
+            self.conn.commit()
+            if cursor.rowcount == 1:
+                return dict(candidate)
+        return None
+
+    async def release_document(self, document_id: str, owner: str):
+        """Drop a processing claim held by owner"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE documents SET claimed_by = NULL, claimed_at = NULL
+            WHERE document_id = ? AND claimed_by = ?
+        """, (document_id, owner))
+        self.conn.commit()
+
+    async def count_storage_references(self, storage_key: str) -> int:
+        """How many documents point at a stored file (uploads are deduplicated by content)"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM documents WHERE storage_key = ?", (storage_key,))
+        return cursor.fetchone()[0]
+
+    async def find_document_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """The document already holding this file's content (a completed one first), if any"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT document_id, filename, status, storage_key, pipeline_stage
+            FROM documents
+            WHERE content_hash = ?
+            ORDER BY status = 'completed' DESC, upload_time
+            LIMIT 1
+        """, (content_hash,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
     async def update_document_status(self, document_id: str, status: str):
         """Update document processing status"""
         await self.connect()
@@ -122,17 +371,148 @@ class SQLiteDatabase:
         self.conn.commit()
         logger.info(f"Document status updated: {document_id} -> {status}")
 
+    async def save_extracted_text(self, document_id: str, extracted_text: str,
+                                  document_type: Optional[str] = None):
+        """
+        Store the full extracted text (zlib-compressed) and keep the search
+        index in sync. The plain column is only filled for the LIKE fallback
+        when FTS5 is unavailable; the index itself holds terms, not the text.
+        """
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        if self.fts_enabled:
+            self._unindex(cursor, document_id)
+        cursor.execute("""
+            UPDATE documents 
+            SET extracted_text = ?, extracted_text_z = ?, document_type = COALESCE(?, document_type)
+            WHERE document_id = ?
+        """, (
+            None if self.fts_enabled else extracted_text,
+            zlib.compress(extracted_text.encode("utf-8")),
+            document_type,
+            document_id
+        ))
+
+        if self.fts_enabled:
+            cursor.execute("""
+                INSERT INTO documents_fts (rowid, filename, extracted_text)
+                SELECT id, filename, ?
+                FROM documents WHERE document_id = ?
+            """, (extracted_text, document_id))
+
+        self.conn.commit()
+        logger.info(f"Extracted text saved: {document_id} ({len(extracted_text)} chars)")
+
+    def _unindex(self, cursor, document_id: str):
+        """
+        Remove a document's terms from the search index. External-content
+        FTS5 needs the indexed values to delete them, so this must run
+        before the stored text changes or the row goes away.
+        """
+        cursor.execute("""
+            INSERT INTO documents_fts (documents_fts, rowid, filename, extracted_text)
+            SELECT 'delete', t.id, t.filename, t.extracted_text
+            FROM documents_text t
+            JOIN documents d ON d.id = t.id
+            WHERE d.document_id = ?
+        """, (document_id,))
+
+    async def get_extracted_text(self, document_id: str) -> Optional[str]:
+        """The stored full text of a document (None if it was never extracted)"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT extracted_text, extracted_text_z FROM documents WHERE document_id = ?",
+            (document_id,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        if row['extracted_text_z'] is not None:
+            return _unzip_text(row['extracted_text_z'])
+        # Rows saved before compression
+        return row['extracted_text']
+
+    async def set_document_type(self, document_id: str, document_type: str):
+        """Record the classified document type"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE documents SET document_type = ? WHERE document_id = ?",
+            (document_type, document_id)
+        )
+        self.conn.commit()
+
+    async def search_documents(self, query: str, skip: int = 0, limit: int = 10) -> Dict:
+        """Ranked full-text search over extracted document text"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        terms = query.split()
+        if not terms:
+            return {"query": query, "total": 0, "results": []}
+
+        if self.fts_enabled:
+            # Quote each term so user input can't inject FTS5 query syntax
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+            cursor.execute("SELECT COUNT(*) FROM documents_fts WHERE documents_fts MATCH ?", (match,))
+            total = cursor.fetchone()[0]
+
+            cursor.execute("""
+                SELECT 
+                    d.document_id, d.filename, d.document_type, d.upload_time,
+                    bm25(documents_fts) AS rank,
+                    snippet(documents_fts, 1, '<mark>', '</mark>', '…', 16) AS snippet
+                FROM documents_fts f
+                JOIN documents d ON d.id = f.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            """, (match, limit, skip))
+        else:
+            like = f"%{query}%"
+            cursor.execute("""
+                SELECT COUNT(*) FROM documents
+                WHERE extracted_text LIKE ? OR filename LIKE ?
+            """, (like, like))
+            total = cursor.fetchone()[0]
+
+            cursor.execute("""
+                SELECT 
+                    document_id, filename, document_type, upload_time,
+                    0.0 AS rank,
+                    substr(extracted_text, max(instr(lower(extracted_text), lower(?)) - 60, 1), 200) AS snippet
+                FROM documents
+                WHERE extracted_text LIKE ? OR filename LIKE ?
+                ORDER BY upload_time DESC
+                LIMIT ? OFFSET ?
+            """, (query, like, like, limit, skip))
+
+        results = []
+        for row in cursor.fetchall():
+            result = dict(row)
+            # bm25() is lower-is-better; expose higher-is-better like Postgres ts_rank
+            result["rank"] = round(-result["rank"], 4) if result["rank"] else 0.0
+            results.append(result)
+
+        return {"query": query, "total": total, "results": results}
+
     async def save_analysis(self, document_id: str, analysis_data: Dict):
         """Save analysis results"""
         await self.connect()
 
         cursor = self.conn.cursor()
 
-        # Save full analysis
+        # Save full analysis (the text is stored once, on the document)
+        stored = {k: v for k, v in analysis_data.items() if k != 'extracted_text'}
         cursor.execute("""
-            INSERT INTO analyses (document_id, analysis_data)
-            VALUES (?, ?)
-        """, (document_id, json.dumps(analysis_data)))
+            INSERT INTO analyses (document_id, analysis_data, prompt_version)
+            VALUES (?, ?, ?)
+        """, (document_id, json.dumps(stored), analysis_data.get('prompt_version')))
 
         # Extract and save findings for trend analysis
         findings = analysis_data.get('analysis', {}).get('findings', [])
@@ -152,14 +532,17 @@ class SQLiteDatabase:
                     # Keep as string for SQLite
                     pass
 
+                test_name = finding.get('test_name', 'Unknown')
+
                 cursor.execute("""
                     INSERT INTO findings 
-                    (document_id, test_name, value, value_text, status, test_date)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    (document_id, test_name, test_key, value, value_text, status, test_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                 """,
                     (
                         document_id,
-                        finding.get('test_name', 'Unknown'),
+                        test_name,
+                        canonical_test_key(test_name),
                         numeric_value,
                         value_text,
                         finding.get('status', 'NORMAL'),
@@ -172,6 +555,118 @@ class SQLiteDatabase:
         self.conn.commit()
         logger.info(f"Analysis saved: {document_id}")
 
+    async def save_checkpoint(self, document_id: str, stage: str, data):
+        """Store a stage's output and advance the document's stage cursor"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO pipeline_checkpoints (document_id, stage, data, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (document_id, stage, json.dumps(data), datetime.utcnow().isoformat()))
+        cursor.execute(
+            "UPDATE documents SET pipeline_stage = ? WHERE document_id = ?",
+            (stage, document_id)
+        )
+        self.conn.commit()
+
+    async def get_checkpoints(self, document_id: str) -> Dict:
+        """Checkpointed stage outputs for a document, by stage"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT stage, data FROM pipeline_checkpoints WHERE document_id = ?",
+            (document_id,)
+        )
+        return {row['stage']: json.loads(row['data']) for row in cursor.fetchall()}
+
+    async def clear_checkpoints(self, document_id: str):
+        """Drop a document's checkpoints and reset its stage cursor"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM pipeline_checkpoints WHERE document_id = ?", (document_id,))
+        cursor.execute("UPDATE documents SET pipeline_stage = NULL WHERE document_id = ?", (document_id,))
+        self.conn.commit()
+
+    async def save_trace(self, document_id: str, trace: Dict):
+        """Save the stage timing/resource trace of one pipeline run"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO processing_traces (document_id, path, outcome, total_seconds, trace_data)
+            VALUES (?, ?, ?, ?, ?)
+        """, (document_id, trace['path'], trace['outcome'], trace['total_seconds'], json.dumps(trace)))
+        self.conn.commit()
+
+    async def get_traces(self, document_id: str) -> List[Dict]:
+        """All traces for a document, newest first"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT trace_data FROM processing_traces
+            WHERE document_id = ?
+            ORDER BY id DESC
+        """, (document_id,))
+        return [json.loads(row['trace_data']) for row in cursor.fetchall()]
+
+    async def list_traces(self, min_seconds: float = 0.0, outcome: Optional[str] = None,
+                          limit: int = 20) -> List[Dict]:
+        """Slowest traces first"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT trace_data FROM processing_traces
+            WHERE total_seconds >= ? AND (? IS NULL OR outcome = ?)
+            ORDER BY total_seconds DESC
+            LIMIT ?
+        """, (min_seconds, outcome, outcome, limit))
+        return [json.loads(row['trace_data']) for row in cursor.fetchall()]
+
+    async def get_explanations(self) -> List[Dict]:
+        """All cached test explanations"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM explanations")
+        entries = []
+        for row in cursor.fetchall():
+            entry = dict(row)
+            entry['recommendations'] = json.loads(entry['recommendations'] or '[]')
+            entries.append(entry)
+        return entries
+
+    async def save_explanations(self, entries: List[Dict]):
+        """Add test explanations; existing keys are kept"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT OR IGNORE INTO explanations
+            (test_key, status, direction, test_name, plain_english, what_it_means,
+             clinical_significance, recommendations)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            e['test_key'], e['status'], e['direction'], e.get('test_name'), e.get('plain_english'),
+            e.get('what_it_means'), e.get('clinical_significance'), json.dumps(e.get('recommendations') or [])
+        ) for e in entries])
+        self.conn.commit()
+
+    async def add_explanation_hits(self, hits: Dict[Tuple[str, str, str], int]):
+        """Count cache hits per (test_key, status, direction); the prompt lists the most used first"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            UPDATE explanations SET hits = hits + ?
+            WHERE test_key = ? AND status = ? AND direction = ?
+        """, [(count, *key) for key, count in hits.items()])
+        self.conn.commit()
+
     async def get_analysis(self, document_id: str) -> Optional[Dict]:
         """Retrieve analysis for a document"""
         await self.connect()
@@ -187,9 +682,101 @@ class SQLiteDatabase:
 
         row = cursor.fetchone()
         if row:
-            return json.loads(row['analysis_data'])
+            analysis = json.loads(row['analysis_data'])
+            if 'extracted_text' not in analysis:
+                analysis['extracted_text'] = await self.get_extracted_text(document_id)
+            return analysis
         return None
 
+    async def list_stale_documents(self, prompt_version: str, after: str = "",
+                                   limit: int = 100) -> List[str]:
+        """
+        IDs of documents with stored text but no analysis made with
+        prompt_version, in document_id order after `after` (keyset paging).
+        Documents still being processed for the first time are skipped.
+        """
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT d.document_id FROM documents d
+            WHERE d.document_id > ?
+            AND d.status <> 'processing'
+            AND (d.extracted_text_z IS NOT NULL OR d.extracted_text IS NOT NULL)
+            AND NOT EXISTS (
+                SELECT 1 FROM analyses a
+                WHERE a.document_id = d.document_id AND a.prompt_version = ?
+            )
+            ORDER BY d.document_id
+            LIMIT ?
+        """, (after, prompt_version, limit))
+        return [row['document_id'] for row in cursor.fetchall()]
+
+    async def count_stale_documents(self, prompt_version: str) -> int:
+        """How many documents list_stale_documents would return in total"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM documents d
+            WHERE d.status <> 'processing'
+            AND (d.extracted_text_z IS NOT NULL OR d.extracted_text IS NOT NULL)
+            AND NOT EXISTS (
+                SELECT 1 FROM analyses a
+                WHERE a.document_id = d.document_id AND a.prompt_version = ?
+            )
+        """, (prompt_version,))
+        return cursor.fetchone()[0]
+
+    async def iter_findings(self, document_id: Optional[str] = None, test_key: Optional[str] = None,
+                            batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict]:
+        """All findings (optionally one document's / one test's), fetched batch_size rows at a time"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        # Joined: rows orphaned by deletes from before they were removed together stay out
+        cursor.execute("""
+            SELECT f.document_id, f.test_name, f.test_key, f.value, f.value_text, f.status, f.test_date
+            FROM findings f
+            JOIN documents d ON f.document_id = d.document_id
+            WHERE (? IS NULL OR f.document_id = ?) AND (? IS NULL OR f.test_key = ?)
+            ORDER BY f.id
+        """, (document_id, document_id, test_key, test_key))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    async def iter_analyses(self, document_id: Optional[str] = None,
+                            batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict]:
+        """All stored analyses (without extracted text), fetched batch_size rows at a time"""
+        await self.connect()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT a.document_id, a.prompt_version, a.created_at, a.analysis_data
+            FROM analyses a
+            JOIN documents d ON a.document_id = d.document_id
+            WHERE ? IS NULL OR a.document_id = ?
+            ORDER BY a.id
+        """, (document_id, document_id))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    analysis = dict(row)
+                    analysis['analysis_data'] = json.loads(analysis['analysis_data'])
+                    yield analysis
+        finally:
+            cursor.close()
+
     async def list_documents(self, skip: int = 0, limit: int = 10) -> List[Dict]:
         """List all documents with pagination"""
         await self.connect()
@@ -212,7 +799,14 @@ class SQLiteDatabase:
         await self.connect()
 
         cursor = self.conn.cursor()
+        if self.fts_enabled:
+            self._unindex(cursor, document_id)
         cursor.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        # SQLite doesn't enforce the ON DELETE CASCADE without PRAGMA foreign_keys
+        cursor.execute("DELETE FROM analyses WHERE document_id = ?", (document_id,))
+        cursor.execute("DELETE FROM findings WHERE document_id = ?", (document_id,))
+        cursor.execute("DELETE FROM processing_traces WHERE document_id = ?", (document_id,))
+        cursor.execute("DELETE FROM pipeline_checkpoints WHERE document_id = ?", (document_id,))
         self.conn.commit()
         logger.info(f"Document deleted: {document_id}")
 
@@ -230,20 +824,22 @@ class SQLiteDatabase:
                     f.status, f.test_date, d.document_id
                 FROM findings f
                 JOIN documents d ON f.document_id = d.document_id
-                WHERE f.test_name = ?
+                WHERE f.test_key = ?
                 ORDER BY f.test_date ASC
-            """, (test_name,))
+            """, (canonical_test_key(test_name),))
         else:
-            # Get all available tests from this document
+            # Get all available tests from this document (one name per canonical test)
             cursor.execute("""
-                SELECT DISTINCT test_name
+                SELECT test_key, MIN(test_name) AS test_name
                 FROM findings
                 WHERE document_id = ?
+                GROUP BY test_key
             """, (document_id,))
 
             rows = cursor.fetchall()
             return {
-                "available_tests": [row['test_name'] for row in rows]
+                "available_tests": [row['test_name'] for row in rows],
+                "available_test_keys": [row['test_key'] for row in rows]
             }
 
         rows = cursor.fetchall()
@@ -279,6 +875,7 @@ class SQLiteDatabase:
 
         return {
             "test_name": test_name,
+            "test_key": canonical_test_key(test_name),
             "data_points": data_points,
             "trend_direction": trend_direction,
             "percentage_change": round(percentage_change, 2) if percentage_change else None,
@@ -1,67 +1,89 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
 import shutil
+from contextlib import asynccontextmanager
 from typing import Optional
 import uuid
 from datetime import datetime
 import logging
 
-from fastapi.concurrency import run_in_threadpool
 
-# Load environment variables
+# Load environment variables (before our modules read their settings)
 from dotenv import load_dotenv
 load_dotenv()
 
+from database import select_database
+from services.storage import CONTENT_TYPE_EXTENSIONS, delete_unreferenced, get_storage
+from services.metrics import STARTUP_SECONDS, stage_timer
+from services.pipeline import DocumentPipeline, PipelineError
+from services.explanations import ExplanationCache
+from services.reference_ranges import evaluate
+from services.export import ANALYSIS_COLUMNS, FINDING_COLUMNS, FORMATS, export_chunks
+from services.test_names import canonical_test_key
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
 # Configure logging first
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import our modules (these should exist in your project)
+# Import our modules (these should exist in your project).
+# Extraction libraries (PDF backends, PIL, OCR) load on first use, not here.
 try:
 	from services.document_processor import DocumentProcessor
 	from services.llama_analyzer import LlamaAnalyzer
-	from models.schemas import AnalysisResponse, DocumentMetadata
-	
-	# Use SQLite by default (simpler, no PostgreSQL needed)
-	try:
-		# Check if PostgreSQL is actually available by trying to connect
-		import os
-		db_url = os.getenv("DATABASE_URL", "")
-		if db_url.startswith("postgresql://") and "localhost" in db_url:
-			# Only use PostgreSQL if it's actually running
-			import socket
-			try:
-				sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-				sock.settimeout(1)
-				result = sock.connect_ex(('localhost', 5432))
-				sock.close()
-				if result == 0:
-					from database.db import Database
-					logger.info("✅ Using PostgreSQL database")
-				else:
-					raise ConnectionError("PostgreSQL not running")
-			except:
-				raise ConnectionError("PostgreSQL not available")
-		else:
-			raise ConnectionError("No PostgreSQL configured")
-	except Exception as e:
-		logger.info(f"📦 Using SQLite database (PostgreSQL not available: {e})")
-		from database.sqlite_db import SQLiteDatabase as Database
-		
+	from models.schemas import AnalysisResponse, DocumentMetadata, StatusRequest
 except Exception:
 	# If running in an environment where these modules aren't present, provide stubs/log warnings.
 	DocumentProcessor = None
 	LlamaAnalyzer = None
 	AnalysisResponse = None
 	DocumentMetadata = None
-	Database = None
+	StatusRequest = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	"""Pick the database backend, warm its connections and create tables before serving"""
+	global db, pipeline
+	lifespan_started = time.perf_counter()
+	# Raises (and stops startup) when configured PostgreSQL is reachable but unusable
+	db = await select_database()
+
+	if llama_analyzer:
+		llama_analyzer.explanations = ExplanationCache(db)
+		try:
+			await llama_analyzer.explanations.load()
+		except Exception as e:
+			logger.warning(f"Could not load cached explanations: {e}")
+	pipeline = DocumentPipeline(document_processor, llama_analyzer, storage, db)
+
+	startup["lifespan_seconds"] = round(time.perf_counter() - lifespan_started, 3)
+	startup["total_seconds"] = round(startup["import_seconds"] + startup["lifespan_seconds"], 3)
+	startup["database"] = type(db).__name__ if db else None
+	for phase in ("import", "lifespan", "total"):
+		STARTUP_SECONDS.labels(phase=phase).set(startup[f"{phase}_seconds"])
+	logger.info(
+		f"🚀 Started in {startup['total_seconds']:.3f}s "
+		f"(imports {startup['import_seconds']:.3f}s, lifespan {startup['lifespan_seconds']:.3f}s)"
+	)
+
+	yield
+
+	if llama_analyzer:
+		await llama_analyzer.drain()
+	if db:
+		await db.disconnect()
+
 
 app = FastAPI(
 	title="DocuSage API",
 	description="AI-powered medical document translator",
-	version="1.0.0"
+	version="1.0.0",
+	lifespan=lifespan
 )
 
 # CORS middleware for frontend
@@ -76,11 +98,82 @@ app.add_middleware(
 # Initialize services (if available)
 document_processor = DocumentProcessor() if DocumentProcessor else None
 llama_analyzer = LlamaAnalyzer() if LlamaAnalyzer else None
-db = Database() if Database else None
+# Chosen and connected in lifespan()
+db = None
+pipeline = None
+
+# "worker": uploads are only queued and `python -m commands.worker` processes them
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "inline").lower()
 
-# Create upload directory
+# Upload storage (hash-sharded local directory or S3-compatible bucket)
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+storage = get_storage(UPLOAD_DIR)
+
+# Cold-start timing, reported by the health check and /metrics
+startup = {"import_seconds": round(time.perf_counter() - _import_started, 3)}
+
+async def _resolve_storage_key(document_id: str) -> Optional[str]:
+	"""
+	Look up where a document's file lives. Uploads made before sharded
+	storage have no recorded key and sit flat in UPLOAD_DIR as <id>.<ext>.
+	"""
+	if db:
+		document = await db.get_document(document_id)
+		if document and document.get("storage_key"):
+			return document["storage_key"]
+
+	for ext in ["pdf", "jpg", "jpeg", "png", "txt"]:
+		legacy_key = f"{document_id}.{ext}"
+		if await storage.exists(legacy_key):
+			return legacy_key
+	return None
+
+
+async def _register_unrecorded(document_id: str, storage_key: str):
+	"""
+	Add the documents row a stored file is missing (legacy flat uploads, or
+	uploads made while the database was down), so the pipeline can claim it
+	"""
+	extension = storage_key.rsplit(".", 1)[-1].lower()
+	file_type = next(
+		(content_type for content_type, ext in CONTENT_TYPE_EXTENSIONS.items() if ext == extension),
+		"image/jpeg" if extension == "jpeg" else "application/octet-stream"
+	)
+	logger.info(f"Registering {document_id}, stored without a database record")
+	await db.save_document_metadata(DocumentMetadata(
+		document_id=document_id,
+		filename=os.path.basename(storage_key),
+		file_type=file_type,
+		upload_time=datetime.utcnow(),
+		status="processing",
+		storage_key=storage_key
+	))
+
+
+async def _delete_stored_file(storage_key: str):
+	"""Remove a stored file once no document references it (runs after the response)"""
+	try:
+		if db:
+			await delete_unreferenced(storage, storage_key, db.count_storage_references)
+		else:
+			await storage.delete(storage_key)
+	except Exception as e:
+		logger.warning(f"Could not delete stored file {storage_key}: {e}")
+
+
+async def _record_upload(metadata, src_file, extension: str):
+	"""
+	Save a document's metadata (its reference to the stored file). A delete
+	of the last document with the same content, in any process, may have
+	removed the file after save() deduplicated onto it, so it is written
+	again if missing (the other half of storage.delete_unreferenced).
+	"""
+	await db.save_document_metadata(metadata)
+	if not await storage.exists(metadata.storage_key):
+		logger.info(f"Stored file {metadata.storage_key} was deleted meanwhile; writing it again")
+		src_file.seek(0)
+		await storage.save(src_file, extension)
 
 
 @app.get("/")
@@ -89,10 +182,17 @@ async def root():
 	return {
 		"status": "healthy",
 		"service": "DocuSage API",
-		"version": "1.0.0"
+		"version": "1.0.0",
+		"startup": startup
 	}
 
 
+@app.get("/metrics")
+async def metrics():
+	"""Prometheus metrics: stage durations, LLM tokens, cache hits, in-flight jobs, DB latency"""
+	return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/api/upload")
 async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
 	"""
@@ -103,8 +203,7 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
 	"""
 	try:
 		# Validate file type
-		allowed_types = ["application/pdf", "image/jpeg", "image/png", "text/plain"]
-		if file.content_type not in allowed_types:
+		if file.content_type not in CONTENT_TYPE_EXTENSIONS:
 			raise HTTPException(
 				status_code=400,
 				detail=f"Invalid file type. Allowed: PDF, JPG, PNG, TXT"
@@ -113,32 +212,11 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
 		# Generate unique document ID
 		document_id = str(uuid.uuid4())
 
-		# Save file to disk without loading entire content into memory
-		file_extension = (file.filename or "").split(".")[-1]
-		file_path = os.path.join(UPLOAD_DIR, f"{document_id}.{file_extension}")
-
-		# Stream file to disk in a threadpool to avoid blocking event loop
-		def _save_file_sync(src_file, dest_path, max_bytes=10 * 1024 * 1024):
-			bytes_written = 0
-			with open(dest_path, "wb") as dest:
-				while True:
-					chunk = src_file.read(1024 * 64)
-					if not chunk:
-						break
-					bytes_written += len(chunk)
-					if bytes_written > max_bytes:
-						raise ValueError("File size exceeds 10MB limit")
-					dest.write(chunk)
-
+		# Stream file into content-addressed storage without loading it into memory
 		try:
-			await run_in_threadpool(_save_file_sync, file.file, file_path)
+			with stage_timer("upload_write"):
+				stored = await storage.save(file.file, CONTENT_TYPE_EXTENSIONS[file.content_type])
 		except ValueError as ve:
-			# remove partial file if created
-			try:
-				if os.path.exists(file_path):
-					os.remove(file_path)
-			except Exception:
-				pass
 			raise HTTPException(status_code=400, detail=str(ve))
 
 		logger.info(f"File uploaded: {document_id} - {file.filename}")
@@ -150,18 +228,22 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
 				filename=file.filename,
 				file_type=file.content_type,
 				upload_time=datetime.utcnow(),
-				status="processing"
+				status="processing",
+				storage_key=stored.key,
+				file_size=stored.size,
+				content_hash=stored.content_hash
+			)
+			await _record_upload(metadata, file.file, CONTENT_TYPE_EXTENSIONS[file.content_type])
+
+		# Start background processing (non-blocking), unless separate workers pick it up
+		if PROCESSING_MODE != "worker" or not db:
+			background_tasks.add_task(
+				_background_process,
+				document_id,
+				stored.key,
+				file.filename,
+				file.content_type
 			)
-			await db.save_document_metadata(metadata)
-
-		# Start background processing (non-blocking)
-		background_tasks.add_task(
-			_background_process,
-			document_id,
-			file_path,
-			file.filename,
-			file.content_type
-		)
 
 		return JSONResponse(
 			status_code=202,
@@ -183,76 +265,86 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
 @app.post("/api/document/{document_id}/process")
 async def process_document(document_id: str):
 	"""
-	Process uploaded document: Extract text, classify, and analyze
+	Process uploaded document: Extract text, classify, and analyze.
+	Joins the run already in flight if the document is being processed.
 	"""
 	try:
-		# Get file path
-		file_path = None
-		for ext in ["pdf", "jpg", "jpeg", "png"]:
-			potential_path = os.path.join(UPLOAD_DIR, f"{document_id}.{ext}")
-			if os.path.exists(potential_path):
-				file_path = potential_path
-				break
-
-		if not file_path:
+		# Get stored file
+		storage_key = await _resolve_storage_key(document_id)
+		if not storage_key:
 			raise HTTPException(status_code=404, detail="Document not found")
+		if db and DocumentMetadata and not await db.get_document(document_id):
+			await _register_unrecorded(document_id, storage_key)
 
-		# Step 1: Extract text from document
-		logger.info(f"Extracting text from: {document_id}")
-		if not document_processor:
-			raise HTTPException(status_code=500, detail="Document processor not configured")
-		extracted_text = await document_processor.extract_text(file_path)
+		result = await pipeline.run(document_id, storage_key, "process")
+		return JSONResponse(status_code=200, content=result)
 
-		if not extracted_text:
-			raise HTTPException(
-				status_code=400,
-				detail="Could not extract text from document"
-			)
+	except HTTPException as e:
+		raise e
+	except PipelineError as e:
+		raise HTTPException(status_code=e.status_code, detail=e.detail)
+	except Exception as e:
+		logger.error(f"Processing error: {str(e)}")
+		raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
-		# Step 2: Classify document type
-		logger.info(f"Classifying document: {document_id}")
-		document_type = await llama_analyzer.classify_document(extracted_text) if llama_analyzer else "unknown"
-
-		# Step 3: Analyze with Llama
-		logger.info(f"Analyzing with Llama: {document_id}")
-		analysis = await llama_analyzer.analyze_document(
-			text=extracted_text,
-			document_type=document_type
-		) if llama_analyzer else {"findings": []}
-
-		# Step 4: Generate questions
-		logger.info(f"Generating questions: {document_id}")
-		questions = await llama_analyzer.generate_questions(
-			findings=analysis.get("findings", []),
-			document_type=document_type
-		) if llama_analyzer else []
-
-		# Combine results
-		result = {
-			"document_id": document_id,
-			"document_type": document_type,
-			"extracted_text": extracted_text,  # Full text (removed 500 char limit)
-			"analysis": analysis,
-			"questions": questions,
-			"processed_at": datetime.utcnow().isoformat()
-		}
-
-		# Save analysis to database if available
-		if db:
-			await db.save_analysis(document_id, result)
-			await db.update_document_status(document_id, "completed")
 
-		logger.info(f"Processing completed: {document_id}")
+@app.post("/api/document/{document_id}/reanalyze")
+async def reanalyze_document(document_id: str):
+	"""
+	Rerun only the LLM stages (classify, analyze, questions) from the stored
+	extracted text, e.g. after a prompt or model change. No file or OCR needed.
+	"""
+	try:
+		if not db:
+			raise HTTPException(status_code=500, detail="Database not configured")
+		if not await db.get_document(document_id):
+			raise HTTPException(status_code=404, detail="Document not found")
 
+		result = await pipeline.reanalyze(document_id)
 		return JSONResponse(status_code=200, content=result)
 
 	except HTTPException as e:
 		raise e
+	except PipelineError as e:
+		raise HTTPException(status_code=e.status_code, detail=e.detail)
 	except Exception as e:
-		logger.error(f"Processing error: {str(e)}")
-		if db:
-			await db.update_document_status(document_id, "failed")
-		raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+		logger.error(f"Reanalysis error: {str(e)}")
+		raise HTTPException(status_code=500, detail=f"Reanalysis failed: {str(e)}")
+
+
+@app.get("/api/document/{document_id}/status")
+async def get_document_status(document_id: str):
+	"""
+	Processing status for a document (lets clients poll instead of retrying /analysis)
+	"""
+	try:
+		if not db:
+			raise HTTPException(status_code=500, detail="Database not configured")
+		document = await db.get_document(document_id)
+
+		if not document:
+			raise HTTPException(status_code=404, detail="Document not found")
+
+		processed_time = document.get("processed_time")
+		if hasattr(processed_time, "isoformat"):
+			processed_time = processed_time.isoformat()
+
+		return JSONResponse(status_code=200, content={
+			"document_id": document_id,
+			"status": document["status"],
+			"document_type": document.get("document_type"),
+			"processed_time": processed_time,
+			# A pipeline run holds a claim on the document (here or in another process)
+			"in_progress": bool(document.get("claimed_by")),
+			# Last checkpointed pipeline stage of an unfinished/failed run
+			"stage": document.get("pipeline_stage")
+		})
+
+	except HTTPException as e:
+		raise e
+	except Exception as e:
+		logger.error(f"Status error: {str(e)}")
+		raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/document/{document_id}/analysis")
@@ -293,22 +385,122 @@ async def list_documents(skip: int = 0, limit: int = 10):
 		raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/traces")
+async def list_traces(min_seconds: float = 0.0, outcome: Optional[str] = None, limit: int = 20):
+	"""
+	Slowest pipeline runs first - per-stage wall/CPU time, RSS, bytes, pages and tokens
+	"""
+	try:
+		if not db:
+			raise HTTPException(status_code=500, detail="Database not configured")
+		traces = await db.list_traces(min_seconds=min_seconds, outcome=outcome, limit=max(1, min(limit, 200)))
+		return JSONResponse(status_code=200, content={"traces": traces})
+
+	except HTTPException as e:
+		raise e
+	except Exception as e:
+		logger.error(f"Trace list error: {str(e)}")
+		raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/admin/document/{document_id}/traces")
+async def get_document_traces(document_id: str):
+	"""
+	All recorded pipeline runs for one document, newest first
+	"""
+	try:
+		if not db:
+			raise HTTPException(status_code=500, detail="Database not configured")
+		traces = await db.get_traces(document_id)
+		return JSONResponse(status_code=200, content={"document_id": document_id, "traces": traces})
+
+	except HTTPException as e:
+		raise e
+	except Exception as e:
+		logger.error(f"Trace retrieval error: {str(e)}")
+		raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/admin/db/pool")
+async def get_pool_stats():
+	"""Database connection pool occupancy (wait times are in /metrics)"""
+	if not db:
+		raise HTTPException(status_code=500, detail="Database not configured")
+	return db.pool_stats()
+
+
+@app.get("/api/search")
+async def search_documents(q: str, skip: int = 0, limit: int = 10):
+	"""
+	Full-text search over extracted document text, ranked by relevance
+	"""
+	try:
+		if not db:
+			raise HTTPException(status_code=500, detail="Database not configured")
+		skip = max(skip, 0)
+		limit = max(1, min(limit, 100))
+		results = await db.search_documents(q, skip=skip, limit=limit)
+		results["skip"] = skip
+		results["limit"] = limit
+		return JSONResponse(status_code=200, content=results)
+
+	except HTTPException as e:
+		raise e
+	except Exception as e:
+		logger.error(f"Search error: {str(e)}")
+		raise HTTPException(status_code=500, detail=str(e))
+
+
+def _export_response(rows, format: str, columns, name: str) -> StreamingResponse:
+	"""Stream rows as NDJSON or CSV; memory use doesn't depend on the export size"""
+	if format not in FORMATS:
+		raise HTTPException(status_code=400, detail=f"Unsupported format. Allowed: {', '.join(FORMATS)}")
+	return StreamingResponse(
+		export_chunks(rows, format, columns),
+		media_type=FORMATS[format],
+		headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+	)
+
+
+@app.get("/api/export/findings")
+async def export_findings(format: str = "ndjson", document_id: Optional[str] = None, test_name: Optional[str] = None):
+	"""
+	Stream every stored finding (optionally one document's or one test's) as NDJSON or CSV
+	"""
+	if not db:
+		raise HTTPException(status_code=500, detail="Database not configured")
+	test_key = canonical_test_key(test_name) if test_name else None
+	rows = db.iter_findings(document_id=document_id, test_key=test_key)
+	return _export_response(rows, format, FINDING_COLUMNS, "findings")
+
+
+@app.get("/api/export/analyses")
+async def export_analyses(format: str = "ndjson", document_id: Optional[str] = None):
+	"""
+	Stream every stored analysis as NDJSON or CSV (analysis_data as a JSON column)
+	"""
+	if not db:
+		raise HTTPException(status_code=500, detail="Database not configured")
+	rows = db.iter_analyses(document_id=document_id)
+	return _export_response(rows, format, ANALYSIS_COLUMNS, "analyses")
+
+
 @app.delete("/api/document/{document_id}")
-async def delete_document(document_id: str):
+async def delete_document(document_id: str, background_tasks: BackgroundTasks):
 	"""
 	Delete a document and its analysis
 	"""
 	try:
-		# Delete file
-		for ext in ["pdf", "jpg", "jpeg", "png"]:
-			file_path = os.path.join(UPLOAD_DIR, f"{document_id}.{ext}")
-			if os.path.exists(file_path):
-				os.remove(file_path)
+		storage_key = await _resolve_storage_key(document_id)
 
 		# Delete from database
 		if db:
 			await db.delete_document(document_id)
 
+		# Delete file after responding (shared content is kept while still referenced)
+		if storage_key:
+			background_tasks.add_task(_delete_stored_file, storage_key)
+
 		return JSONResponse(
 			status_code=200,
 			content={"message": "Document deleted successfully"}
@@ -335,59 +527,36 @@ async def get_trends(document_id: str, test_name: Optional[str] = None):
 		raise HTTPException(status_code=500, detail=str(e))
 
 
-async def _background_process(document_id: str, file_path: str, filename: str, content_type: str):
+@app.post("/api/statuses")
+async def compute_statuses(request: StatusRequest):
+	"""
+	Status-only evaluation: classify results from value and reference range
+	with the deterministic engine, without calling the LLM. status is null
+	where the value or range can't be read; agrees compares it with any
+	status supplied in the request.
+	"""
+	findings = [finding.model_dump(mode="json") for finding in request.findings]
+	results = []
+	for finding, computed in zip(findings, evaluate(findings)):
+		reported = finding.pop("status")
+		results.append({
+			**finding,
+			"status": computed,
+			"reported_status": reported,
+			"agrees": None if computed is None or reported is None else computed == reported,
+		})
+	return {"findings": results}
+
+
+async def _background_process(document_id: str, storage_key: str, filename: str, content_type: str):
 	"""
 	Background processing helper used by the upload endpoint.
-	Mirrors logic in /api/document/{document_id}/process but runs asynchronously in background.
+	Runs the same pipeline as /api/document/{document_id}/process; errors are logged, not raised.
 	"""
 	try:
-		logger.info(f"Background processing started: {document_id}")
-
-		if not document_processor:
-			logger.error("Document processor not available; skipping background processing")
-			if db:
-				await db.update_document_status(document_id, "failed")
-			return
-
-		extracted_text = await document_processor.extract_text(file_path)
-		if not extracted_text:
-			await db.update_document_status(document_id, "failed")
-			logger.error(f"Background extract failed: {document_id}")
-			return
-
-		document_type = await llama_analyzer.classify_document(extracted_text) if llama_analyzer else "unknown"
-
-		analysis = await llama_analyzer.analyze_document(
-			text=extracted_text,
-			document_type=document_type
-		) if llama_analyzer else {"findings": []}
-
-		questions = await llama_analyzer.generate_questions(
-			findings=analysis.get("findings", []),
-			document_type=document_type
-		) if llama_analyzer else []
-
-		result = {
-			"document_id": document_id,
-			"document_type": document_type,
-			"extracted_text": extracted_text[:500],
-			"analysis": analysis,
-			"questions": questions,
-			"processed_at": datetime.utcnow().isoformat()
-		}
-
-		if db:
-			await db.save_analysis(document_id, result)
-			await db.update_document_status(document_id, "completed")
-		logger.info(f"Background processing completed: {document_id}")
-
+		await pipeline.run(document_id, storage_key, "background")
 	except Exception as e:
 		logger.error(f"Background processing error for {document_id}: {e}")
-		try:
-			if db:
-				await db.update_document_status(document_id, "failed")
-		except Exception:
-			pass
 
 
 if __name__ == "__main__":
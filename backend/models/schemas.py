@@ -32,6 +32,9 @@ class DocumentMetadata(BaseModel):
 	upload_time: datetime
 	status: DocumentStatus
 	processed_time: Optional[datetime] = None
+	storage_key: Optional[str] = None
+	file_size: Optional[int] = None
+	content_hash: Optional[str] = None
 
 class PatientContext(BaseModel):
 	"""Optional patient context for personalization"""
@@ -49,6 +52,18 @@ class Finding(BaseModel):
 	what_it_means: str
 	clinical_significance: str
 	recommendations: Optional[List[str]] = None
+	llm_status: Optional[FindingStatus] = None  # set when the reference-range engine disagreed
+
+class StatusCheck(BaseModel):
+	"""A result to classify from its value and reference range alone"""
+	test_name: str
+	value: Optional[str] = None
+	normal_range: Optional[str] = None
+	status: Optional[FindingStatus] = None  # status to verify, if any
+
+class StatusRequest(BaseModel):
+	"""Status-only request (no LLM call)"""
+	findings: List[StatusCheck]
 
 class Question(BaseModel):
 	"""Generated question for doctor"""
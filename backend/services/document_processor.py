@@ -1,11 +1,13 @@
+import os
+import asyncio
 import logging
-from typing import Optional
-from PIL import Image
-import pytesseract
-import PyPDF2
-import pdfplumber
+from typing import AsyncIterator
 from fastapi.concurrency import run_in_threadpool
 
+from services.metrics import stage_timer
+from services.tracing import trace_add
+from services.pdf_extractors import extract_pdf_pages
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,98 +21,110 @@ class DocumentProcessor:
         self.supported_formats = ['pdf', 'jpg', 'jpeg', 'png', 'txt']
 
     async def extract_text(self, file_path: str) -> str:
+        pages = [page async for page in self.iter_pages(file_path)]
+        return self.clean_text("\n".join(pages))
+
+    async def iter_pages(self, file_path: str) -> AsyncIterator[str]:
+        """
+        Yield raw page texts in order as each becomes available, so callers
+        can start on the first pages while later ones are still being OCR'd.
+        clean_text("\n".join(pages)) equals extract_text(file_path).
+        """
         file_extension = file_path.split('.')[-1].lower()
         if file_extension not in self.supported_formats:
             raise ValueError(f"Unsupported file format: {file_extension}")
 
+        trace_add("bytes_read", os.path.getsize(file_path))
+
         if file_extension == 'pdf':
-            return await self._extract_from_pdf(file_path)
+            pages = self._pdf_pages(file_path)
         elif file_extension == 'txt':
-            return await self._extract_from_txt(file_path)
+            pages = self._txt_pages(file_path)
         else:
-            return await self._extract_from_image(file_path)
-
-    async def _extract_from_pdf(self, file_path: str) -> str:
-        text = ""
+            pages = self._image_pages(file_path)
+        async for page in pages:
+            yield page
 
+    async def _pdf_pages(self, file_path: str) -> AsyncIterator[str]:
         try:
-            # Try pdfplumber first (better for structured data like lab reports)
-            def _pdfplumber_read(path):
-                out = ""
-                with pdfplumber.open(path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            out += page_text + "\n"
-                return out
-
-            text = await run_in_threadpool(_pdfplumber_read, file_path)
-
-            # If no text extracted, try PyPDF2
-            if not text.strip():
-                logger.info("pdfplumber extraction empty, trying PyPDF2")
-
-                def _pypdf2_read(path):
-                    out = ""
-                    with open(path, 'rb') as f:
-                        reader = PyPDF2.PdfReader(f)
-                        for page in reader.pages:
-                            try:
-                                ptext = page.extract_text()
-                                if ptext:
-                                    out += ptext + "\n"
-                            except Exception:
-                                continue
-                    return out
-
-                text = await run_in_threadpool(_pypdf2_read, file_path)
-
-            # If still no text, PDF might be scanned - use OCR
-            if not text.strip():
-                logger.info("PDF appears to be scanned or contains images, using OCR")
-                text = await self._ocr_pdf(file_path)
-
-            return self.clean_text(text)
-
+            # Fast backend for every page, pdfplumber only for table pages
+            pages = await run_in_threadpool(extract_pdf_pages, file_path)
         except Exception as e:
             logger.error(f"PDF extraction error: {e}")
             raise
 
-    async def _extract_from_image(self, file_path: str) -> str:
+        if any(page.strip() for page in pages if page):
+            for page in pages:
+                yield page or ""
+            return
+
+        # No text layer - PDF might be scanned - use OCR
+        logger.info("PDF appears to be scanned or contains images, using OCR")
+        async for page in self._ocr_pdf_pages(file_path):
+            yield page
+
+    async def _image_pages(self, file_path: str) -> AsyncIterator[str]:
         try:
+            # PIL and the OCR engine load on first use, keeping them off the startup path
+            from services.image_preprocessing import load_image, preprocess_for_ocr
+            from services.ocr_engine import get_ocr_engine
+
             def _image_ocr(path):
-                img = Image.open(path)
-                img = img.convert('L')
-                return pytesseract.image_to_string(img)
+                with stage_timer("ocr_page"):
+                    img = preprocess_for_ocr(load_image(path))
+                    text = get_ocr_engine().recognize(img)
+                trace_add("pages_ocr", 1)
+                return text
 
             text = await run_in_threadpool(_image_ocr, file_path)
-            return self.clean_text(text)
-
         except Exception as e:
             logger.error(f"Image OCR error: {e}")
             raise
+        yield text
 
-    async def _ocr_pdf(self, file_path: str) -> str:
+    async def _ocr_pdf_pages(self, file_path: str) -> AsyncIterator[str]:
         try:
             import pdf2image
+            from services.image_preprocessing import TARGET_DPI, preprocess_for_ocr
+            from services.ocr_engine import OCR_WORKERS, get_ocr_engine
 
-            def _pdf2img(path):
-                return pdf2image.convert_from_path(path)
-
-            images = await run_in_threadpool(_pdf2img, file_path)
-
-            out = ""
-            for i, image in enumerate(images):
-                logger.info(f"OCR processing page {i+1}/{len(images)}")
-                out += pytesseract.image_to_string(image) + "\n"
-
-            return self.clean_text(out)
+            info = await run_in_threadpool(pdf2image.pdfinfo_from_path, file_path)
+            page_count = int(info["Pages"])
+        except Exception as e:
+            logger.error(f"PDF OCR error: {e}")
+            raise
 
+        def _page_ocr(number):
+            logger.info(f"OCR processing page {number}/{page_count}")
+            with stage_timer("ocr_page"):
+                # Render one page straight to grayscale at the OCR resolution
+                images = pdf2image.convert_from_path(
+                    file_path, dpi=TARGET_DPI, grayscale=True, first_page=number, last_page=number
+                )
+                text = "\n".join(get_ocr_engine().recognize(preprocess_for_ocr(image)) for image in images)
+            trace_add("pages_ocr", 1)
+            return text
+
+        # Pages render and OCR concurrently (bounded like the engine pool)
+        # but are yielded in order as soon as each one is done
+        semaphore = asyncio.Semaphore(OCR_WORKERS)
+
+        async def _bounded(number):
+            async with semaphore:
+                return await run_in_threadpool(_page_ocr, number)
+
+        tasks = [asyncio.create_task(_bounded(number)) for number in range(1, page_count + 1)]
+        try:
+            for task in tasks:
+                yield await task
         except Exception as e:
             logger.error(f"PDF OCR error: {e}")
             raise
+        finally:
+            for task in tasks:
+                task.cancel()
 
-    async def _extract_from_txt(self, file_path: str) -> str:
+    async def _txt_pages(self, file_path: str) -> AsyncIterator[str]:
         """Extract text from a text file"""
         try:
             def _read_txt(path):
@@ -118,10 +132,10 @@ class DocumentProcessor:
                     return f.read()
             
             text = await run_in_threadpool(_read_txt, file_path)
-            return self.clean_text(text)
         except Exception as e:
             logger.error(f"Text file read error: {e}")
             raise
+        yield text
 
     def clean_text(self, text: str) -> str:
         # Remove multiple spaces
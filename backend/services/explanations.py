@@ -0,0 +1,121 @@
+import os
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from services.metrics import record_cache
+from services.reference_ranges import parse_range, parse_value
+from services.test_names import canonical_test_key
+
+logger = logging.getLogger(__name__)
+
+# The per-finding text that is the same for every patient with the same result
+EXPLANATION_FIELDS = ("plain_english", "what_it_means", "clinical_significance", "recommendations")
+
+# Most cached (test, status, direction) combinations listed in the analysis prompt
+PROMPT_LIMIT = int(os.getenv("EXPLANATION_PROMPT_LIMIT", "200"))
+
+ExplanationKey = Tuple[str, str, str]
+
+
+def finding_direction(value: str, normal_range: str, status: str) -> str:
+    """
+    Which side of the reference range a result sits on: "low" / "high"
+    (outside the range, or borderline nearest that bound), "within" for
+    NORMAL results, "unknown" when value or range can't be read
+    """
+    if (status or "").upper() == "NORMAL":
+        return "within"
+    number = parse_value(value)
+    low, high = (None if math.isnan(bound) else bound for bound in parse_range(normal_range))
+    if math.isnan(number) or (low is None and high is None):
+        return "unknown"
+    if low is not None and number < low:
+        return "low"
+    if high is not None and number > high:
+        return "high"
+    if low is not None and high is not None:
+        return "low" if number - low <= high - number else "high"
+    return "high" if high is not None else "low"
+
+
+def explanation_key(finding: Dict) -> ExplanationKey:
+    status = str(finding.get("status") or "").upper()
+    return (
+        canonical_test_key(str(finding.get("test_name") or "")),
+        status,
+        finding_direction(finding.get("value"), finding.get("normal_range"), status),
+    )
+
+
+def has_explanation(finding: Dict) -> bool:
+    return bool(finding.get("plain_english"))
+
+
+class ExplanationCache:
+    """
+    Generic explanations of lab results keyed on (canonical test, status,
+    direction), shared across documents. Held in memory and written
+    through to the database when one is configured.
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+        self._entries: Dict[ExplanationKey, Dict] = {}
+        self._names: Dict[str, str] = {}  # test_key -> display name
+        self._hits: Dict[ExplanationKey, int] = {}
+        self._unsaved_hits: Dict[ExplanationKey, int] = {}
+
+    async def load(self):
+        if not self.db:
+            return
+        for entry in await self.db.get_explanations():
+            self._remember(entry)
+        logger.info(f"Loaded {len(self._entries)} cached explanations for {len(self._names)} tests")
+
+    def _remember(self, entry: Dict):
+        key = (entry["test_key"], entry["status"], entry["direction"])
+        self._entries[key] = {field: entry.get(field) for field in EXPLANATION_FIELDS}
+        self._names.setdefault(entry["test_key"], entry.get("test_name") or entry["test_key"])
+        self._hits.setdefault(key, entry.get("hits") or 0)
+
+    def known_combinations(self, limit: int = PROMPT_LIMIT) -> List[List[str]]:
+        """[test name, status, direction] of each cached explanation, most used first"""
+        ranked = sorted(self._entries, key=lambda key: (-self._hits.get(key, 0), key))[:limit]
+        return [[self._names[test_key], status, direction] for test_key, status, direction in ranked]
+
+    def lookup(self, finding: Dict) -> Optional[Dict]:
+        return self._entries.get(explanation_key(finding))
+
+    def fill(self, finding: Dict, record: bool = True) -> bool:
+        """Fill a finding's missing explanation text from the cache; True on a hit"""
+        if has_explanation(finding):
+            return False
+        key = explanation_key(finding)
+        cached = self._entries.get(key)
+        if record:
+            record_cache("explanations", cached is not None)
+        if cached is None:
+            return False
+        if record:
+            self._hits[key] = self._hits.get(key, 0) + 1
+            self._unsaved_hits[key] = self._unsaved_hits.get(key, 0) + 1
+        for field, text in cached.items():
+            finding[field] = list(text) if isinstance(text, list) else text
+        return True
+
+    async def add(self, entries: List[Dict]):
+        """Store new generic explanations (entries carry test_key/status/direction)"""
+        fresh = [e for e in entries if (e["test_key"], e["status"], e["direction"]) not in self._entries]
+        for entry in fresh:
+            self._remember(entry)
+        if fresh and self.db:
+            await self.db.save_explanations(fresh)
+        if fresh:
+            logger.info(f"Cached {len(fresh)} new explanations")
+
+    async def save_hits(self):
+        """Write the hit counts gathered since the last call through to the database"""
+        hits, self._unsaved_hits = self._unsaved_hits, {}
+        if hits and self.db:
+            await self.db.add_explanation_hits(hits)
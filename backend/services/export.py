@@ -0,0 +1,85 @@
+"""
+Stream database rows out as NDJSON or CSV without holding the export in
+memory: rows come from a server-side cursor (Database.iter_findings /
+iter_analyses) and are encoded into ~CHUNK_BYTES chunks for a
+StreamingResponse.
+"""
+import io
+import os
+import csv
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Bytes buffered before a chunk is sent
+CHUNK_BYTES = 64 * 1024
+
+FINDING_COLUMNS = ("document_id", "test_name", "test_key", "value", "value_text", "status", "test_date")
+ANALYSIS_COLUMNS = ("document_id", "prompt_version", "created_at", "analysis_data")
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value):
+    """JSON/CSV-friendly form of a database value"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+async def ndjson_chunks(rows: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    """One JSON object per line"""
+    buffer = io.StringIO()
+    async for row in rows:
+        buffer.write(json.dumps(row, default=_plain))
+        buffer.write("\n")
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def csv_chunks(rows: AsyncIterator[Dict], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """Header row, then one row per record; nested values are written as JSON"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow([
+            json.dumps(row.get(column), default=_plain) if isinstance(row.get(column), (dict, list))
+            else _plain(row.get(column))
+            for column in columns
+        ])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def export_chunks(rows: AsyncIterator[Dict], fmt: str, columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """Encode rows in the requested format. Errors can't change the status once streaming, so they're logged"""
+    chunks = csv_chunks(rows, columns) if fmt == "csv" else ndjson_chunks(rows)
+    exported = 0
+    try:
+        async for chunk in chunks:
+            exported += len(chunk)
+            yield chunk
+    except Exception as e:
+        logger.error(f"Export failed after {exported} bytes: {e}")
+        raise
+    logger.info(f"📤 Exported {exported} bytes ({fmt})")
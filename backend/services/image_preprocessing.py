@@ -0,0 +1,147 @@
+import os
+import logging
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Resolution we normalize pages to before OCR. ~200 DPI keeps lab-report
+# digits legible while cutting pixel count several-fold versus 12MP photos.
+TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "200"))
+
+# Longest page side at TARGET_DPI (US Letter / A4 are both under 11.7in)
+PAGE_LONG_SIDE_INCHES = 11.7
+
+# psm 6 = single uniform block: skips tesseract's page layout analysis, which
+# tends to split lab tables into columns and lose the name/value pairing.
+# preserve_interword_spaces keeps column alignment in the output text.
+TESSERACT_PSM = int(os.getenv("OCR_PSM", "6"))
+TESSERACT_VARIABLES = {"preserve_interword_spaces": "1"}
+
+# Same settings as a pytesseract/CLI config string
+TESSERACT_CONFIG = f"--oem 1 --psm {TESSERACT_PSM} --dpi {TARGET_DPI} " + " ".join(
+    f"-c {name}={value}" for name, value in TESSERACT_VARIABLES.items()
+)
+
+# Deskew search range/step in degrees; photos are rarely off by more than this
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+DESKEW_SAMPLE_SIDE = 800
+
+BORDER_MARGIN = 10
+
+
+def _max_side() -> int:
+    return int(PAGE_LONG_SIDE_INCHES * TARGET_DPI)
+
+
+def load_image(path: str) -> Image.Image:
+    """
+    Open an image already reduced to roughly TARGET_DPI.
+    For JPEGs draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale
+    directly, so we never materialize the full-resolution bitmap.
+    """
+    img = Image.open(path)
+    limit = _max_side()
+    if img.format == "JPEG" and max(img.size) > limit:
+        scale = max(img.size) / limit
+        img.draft("L", (int(img.size[0] / scale), int(img.size[1] / scale)))
+    return img
+
+
+def _downscale(img: Image.Image) -> Image.Image:
+    limit = _max_side()
+    if max(img.size) > limit:
+        img = img.copy()
+        img.thumbnail((limit, limit), Image.LANCZOS)
+    return img
+
+
+def _otsu_threshold(img: Image.Image) -> int:
+    """Otsu's threshold from the grayscale histogram"""
+    hist = img.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+
+    sum_bg = 0.0
+    weight_bg = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = t
+    return best_threshold
+
+
+def binarize(img: Image.Image) -> Image.Image:
+    threshold = _otsu_threshold(img)
+    return img.point(lambda p: 255 if p > threshold else 0, mode="L")
+
+
+def _row_profile_score(img: Image.Image) -> float:
+    """Variance of row ink density: peaks when text lines are horizontal"""
+    # Squashing to one column with a box filter gives per-row means in C
+    rows = list(img.resize((1, img.size[1]), Image.BOX).getdata())
+    mean = sum(rows) / len(rows)
+    return sum((r - mean) ** 2 for r in rows) / len(rows)
+
+
+def estimate_skew(img: Image.Image) -> float:
+    """Projection-profile skew estimate (degrees) on a small binarized copy"""
+    sample = img.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE))
+    sample = ImageOps.invert(binarize(sample))
+
+    best_angle = 0.0
+    best_score = _row_profile_score(sample)
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        if angle == 0:
+            continue
+        score = _row_profile_score(sample.rotate(angle, resample=Image.BILINEAR, fillcolor=0))
+        if score > best_score:
+            best_score = score
+            best_angle = angle
+    return best_angle
+
+
+def crop_borders(img: Image.Image) -> Image.Image:
+    """Trim blank margins around the ink (expects a binarized page)"""
+    bbox = ImageOps.invert(img).getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    return img.crop((
+        max(left - BORDER_MARGIN, 0),
+        max(top - BORDER_MARGIN, 0),
+        min(right + BORDER_MARGIN, img.size[0]),
+        min(bottom + BORDER_MARGIN, img.size[1]),
+    ))
+
+
+def preprocess_for_ocr(img: Image.Image) -> Image.Image:
+    """
+    Normalize a page image for tesseract:
+    grayscale -> downscale to TARGET_DPI -> deskew -> binarize -> crop borders
+    """
+    img = ImageOps.exif_transpose(img)
+    img = _downscale(img.convert("L"))
+
+    angle = estimate_skew(img)
+    if angle:
+        logger.info(f"Deskewing page by {angle:.1f}°")
+        img = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    img = binarize(img)
+    return crop_borders(img)
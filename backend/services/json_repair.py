@@ -0,0 +1,262 @@
+"""
+Tolerant single-pass JSON parser for LLM output.
+
+Model responses arrive wrapped in markdown fences or preamble, cut off at
+max_tokens, or with small syntax slips (missing/trailing commas, raw
+newlines inside strings). parse_partial_json() walks the text once and
+returns whatever is structurally sound:
+
+- text before the first '{' / '[' and after the root value is ignored
+- missing commas, trailing commas and unescaped control characters are tolerated
+- on truncation, complete array elements are kept and an unfinished
+  trailing element is dropped; containers cut off mid-way are kept with
+  what they hold; a cut-off string is kept only as a top-level field
+"""
+import re
+import json
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+
+_STRING_CHUNK = re.compile(r'[^"\\]+')
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_WHITESPACE = re.compile(r'\s*')
+_LITERALS = (
+    ("true", True), ("false", False), ("null", None),
+    ("True", True), ("False", False), ("None", None),
+)
+# C-accelerated pieces of the stdlib decoder, tried first on every value
+_DECODER = json.JSONDecoder(strict=False)
+_scanstring = json.decoder.scanstring
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+@dataclass
+class ParseResult:
+    value: Any
+    complete: bool      # the root value was closed before the text ended
+    repairs: int = 0    # syntax slips skipped over (missing commas, stray characters)
+
+    @property
+    def clean(self) -> bool:
+        return self.complete and self.repairs == 0
+
+
+class _Truncated(Exception):
+    pass
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.end = len(text)
+        self.repairs = 0
+
+    def skip_ws(self):
+        self.pos = _WHITESPACE.match(self.text, self.pos).end()
+
+    def peek(self) -> str:
+        self.skip_ws()
+        if self.pos >= self.end:
+            raise _Truncated()
+        return self.text[self.pos]
+
+    # Each parse_* returns (value, complete)
+
+    def parse_value(self, depth: int) -> Tuple[Any, bool]:
+        char = self.peek()
+        if char in '{[':
+            # Well-formed subtrees (every finding before the cut) decode at C
+            # speed; only the broken path falls through to the code below.
+            # That costs one extra scan per nesting level, so it stays linear.
+            try:
+                value, self.pos = _DECODER.raw_decode(self.text, self.pos)
+                return value, True
+            except json.JSONDecodeError:
+                pass
+        if char == '{':
+            return self.parse_object(depth + 1)
+        if char == '[':
+            return self.parse_array(depth + 1)
+        if char == '"':
+            return self.parse_string()
+        match = _NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            value = float(number) if any(c in number for c in '.eE') else int(number)
+            # A number running into the end of the text may have lost digits
+            return value, self.pos < self.end
+        for literal, value in _LITERALS:
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value, True
+            rest = self.text[self.pos:self.pos + len(literal)]
+            if self.pos + len(rest) == self.end and literal.startswith(rest):
+                raise _Truncated()
+        raise ValueError(f"unexpected character {char!r} at {self.pos}")
+
+    def parse_string(self) -> Tuple[str, bool]:
+        self.pos += 1  # opening quote
+        try:
+            value, self.pos = _scanstring(self.text, self.pos, False)
+            return value, True
+        except json.JSONDecodeError:
+            pass
+        parts: List[str] = []
+        text = self.text
+        while self.pos < self.end:
+            match = _STRING_CHUNK.match(text, self.pos)
+            if match:
+                parts.append(match.group())
+                self.pos = match.end()
+                continue
+            char = text[self.pos]
+            if char == '"':
+                self.pos += 1
+                return ''.join(parts), True
+            # Backslash escape
+            if self.pos + 1 >= self.end:
+                break
+            code = text[self.pos + 1]
+            if code == 'u':
+                digits = text[self.pos + 2:self.pos + 6]
+                if len(digits) < 4:
+                    self.pos = self.end
+                    break
+                try:
+                    parts.append(chr(int(digits, 16)))
+                except ValueError:
+                    parts.append(digits)
+                    self.repairs += 1
+                self.pos += 6
+            else:
+                parts.append(_ESCAPES.get(code, code))
+                self.pos += 2
+        self.pos = self.end
+        return ''.join(parts), False
+
+    def _resync(self, stops: str):
+        """Skip a stray token up to the next structural character"""
+        self.repairs += 1
+        self.pos += 1
+        while self.pos < self.end and self.text[self.pos] not in stops:
+            self.pos += 1
+
+    def parse_array(self, depth: int) -> Tuple[list, bool]:
+        self.pos += 1
+        items: list = []
+        while True:
+            try:
+                char = self.peek()
+            except _Truncated:
+                return items, False
+            if char == ']':
+                self.pos += 1
+                return items, True
+            if char == ',':
+                # Separator, or a doubled/trailing comma
+                self.pos += 1
+                continue
+            try:
+                value, complete = self.parse_value(depth)
+            except _Truncated:
+                return items, False
+            except ValueError:
+                self._resync(',]{["')
+                continue
+            if not complete:
+                # An unfinished element is dropped rather than half-kept
+                return items, False
+            items.append(value)
+            try:
+                char = self.peek()
+            except _Truncated:
+                return items, False
+            if char not in ',]':
+                self.repairs += 1  # missing comma
+
+    def parse_object(self, depth: int) -> Tuple[dict, bool]:
+        self.pos += 1
+        members: dict = {}
+        while True:
+            try:
+                char = self.peek()
+            except _Truncated:
+                return members, False
+            if char == '}':
+                self.pos += 1
+                return members, True
+            if char == ',':
+                self.pos += 1
+                continue
+            if char != '"':
+                self._resync('"}')
+                continue
+            key, complete = self.parse_string()
+            if not complete:
+                return members, False
+            try:
+                if self.peek() != ':':
+                    self._resync('"}')
+                    continue
+                self.pos += 1
+                value, complete = self.parse_value(depth)
+            except _Truncated:
+                return members, False
+            except ValueError:
+                self._resync(',"}')
+                continue
+            if not complete:
+                # Cut-off containers keep what they hold; a cut-off string
+                # is only worth keeping as a top-level field
+                if isinstance(value, (dict, list)) or (depth == 1 and isinstance(value, str)):
+                    members[key] = value
+                return members, False
+            members[key] = value
+            try:
+                char = self.peek()
+            except _Truncated:
+                return members, False
+            if char not in ',}':
+                self.repairs += 1  # missing comma
+
+
+def _root_start(text: str) -> int:
+    """Offset of the root value, skipping preamble and markdown fences"""
+    fence = text.find("```")
+    offsets = (text.find("\n", fence) + 1, 0) if fence != -1 else (0,)
+    for offset in offsets:
+        # Both callers expect an object; a bare array is the fallback
+        for opener in ('{', '['):
+            start = text.find(opener, offset)
+            if start != -1:
+                return start
+    return -1
+
+
+def parse_partial_json(text: str) -> ParseResult:
+    """
+    Parse the first JSON object/array in text, recovering as much as
+    possible from truncated or slightly malformed output. Returns
+    ParseResult(value=None, complete=False) when no JSON is found.
+    """
+    start = _root_start(text)
+    if start == -1:
+        return ParseResult(value=None, complete=False)
+
+    # Fast path: well-formed JSON (optionally followed by a fence or epilogue)
+    try:
+        value, _ = _DECODER.raw_decode(text, start)
+        return ParseResult(value=value, complete=True)
+    except (json.JSONDecodeError, RecursionError):
+        # Too deeply nested to decode: the repairing parser below gives up on it cleanly
+        pass
+
+    parser = _Parser(text)
+    parser.pos = start
+    try:
+        value, complete = parser.parse_value(0)
+    except (_Truncated, ValueError, RecursionError):
+        return ParseResult(value=None, complete=False, repairs=parser.repairs)
+    return ParseResult(value=value, complete=complete, repairs=parser.repairs)
@@ -1,12 +1,29 @@
 import os
 import json
+import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import httpx
 from datetime import datetime
 
+from services.explanations import EXPLANATION_FIELDS, explanation_key, has_explanation
+from services.json_repair import parse_partial_json
+from services.metrics import LLM_REQUESTS, record_llm_usage
+from services.reference_ranges import OVERRIDE as STATUS_OVERRIDE, apply_statuses
+from services.test_names import canonical_test_key
+from services.tracing import trace_add
+
 logger = logging.getLogger(__name__)
 
+# Per-request completion budget. Truncated analyses are continued rather
+# than sized for the largest report up front.
+MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "8192"))
+# Follow-up requests allowed after a truncated analysis (0 disables continuation)
+CONTINUATION_ROUNDS = int(os.getenv("LLM_CONTINUATION_ROUNDS", "3"))
+# Seconds shutdown waits for background explanation requests before cancelling them
+DRAIN_SECONDS = float(os.getenv("LLM_DRAIN_SECONDS", "10"))
+
 
 class LlamaAnalyzer:
     """
@@ -19,7 +36,8 @@ class LlamaAnalyzer:
         if not self.api_key:
             logger.warning("CEREBRAS_API_KEY is not set; LlamaAnalyzer will be disabled until configured.")
 
-        self.base_url = "https://api.cerebras.ai/v1/chat/completions"
+        # Override to point at a proxy or the local stand-in (benchmarks/mock_llm.py)
+        self.base_url = os.getenv("CEREBRAS_API_URL", "https://api.cerebras.ai/v1/chat/completions")
         self.model = "llama3.1-8b"  # Cerebras supports: llama3.1-8b, llama3.1-70b (if you have access)
 
         self.headers = {
@@ -27,10 +45,26 @@ class LlamaAnalyzer:
             "Content-Type": "application/json"
         }
 
+        # Cross-document ExplanationCache, attached at startup (main.py lifespan)
+        self.explanations = None
+        self._background = set()
+        # Tokens used by this instance (commands/reprocess.py enforces a budget with it)
+        self.tokens_used = 0
+
     async def _call_llama(self, messages: List[Dict], temperature: float = 0.3) -> str:
         """
         Make API call to Cerebras/Llama. Raises RuntimeError if API key is missing.
         """
+        content, _ = await self._complete(messages, temperature)
+        return content
+
+    async def _complete(self, messages: List[Dict], temperature: float = 0.3,
+                        max_tokens: Optional[int] = None) -> Tuple[str, Optional[str]]:
+        """
+        Chat completion returning (content, finish_reason); finish_reason is
+        "length" when the response hit max_tokens (default LLM_MAX_TOKENS)
+        """
+        max_tokens = max_tokens or MAX_TOKENS
         if not self.api_key:
             raise RuntimeError("Cerebras API key not configured")
 
@@ -40,7 +74,7 @@ class LlamaAnalyzer:
                     "model": self.model,
                     "messages": messages,
                     "temperature": temperature,
-                    "max_tokens": 32000,  # Doubled to 32k to handle very large lab reports (50+ tests)
+                    "max_tokens": max_tokens,
                     "top_p": 1.0,  # Use full probability distribution (no sampling truncation)
                     "seed": 12345  # Fixed seed for deterministic responses
                 }
@@ -51,6 +85,7 @@ class LlamaAnalyzer:
                     json=payload
                 )
                 response.raise_for_status()
+                LLM_REQUESTS.labels(model=self.model, outcome="ok").inc()
 
                 result = response.json()
                 # Defensive parsing
@@ -58,38 +93,59 @@ class LlamaAnalyzer:
                     raise RuntimeError("Empty response from Llama API")
 
                 # Check if response was truncated
+                finish_reason = None
                 if "choices" in result and len(result["choices"]) > 0:
                     finish_reason = result["choices"][0].get("finish_reason")
                     if finish_reason == "length":
-                        logger.warning("⚠️  AI response was TRUNCATED due to max_tokens limit!")
-                        logger.warning(f"   Consider increasing max_tokens beyond 16000")
+                        LLM_REQUESTS.labels(model=self.model, outcome="truncated").inc()
+                        logger.warning(f"⚠️  AI response was TRUNCATED at max_tokens={max_tokens}")
                     
                     # Log token usage for debugging
                     if "usage" in result:
                         usage = result["usage"]
+                        record_llm_usage(self.model, usage)
+                        self.tokens_used += (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+                        trace_add("prompt_tokens", usage.get("prompt_tokens") or 0)
+                        trace_add("completion_tokens", usage.get("completion_tokens") or 0)
                         logger.info(f"📊 Token usage: prompt={usage.get('prompt_tokens')}, completion={usage.get('completion_tokens')}, total={usage.get('total_tokens')}")
 
                 # Some APIs nest choices differently; try common shapes
                 try:
-                    return result["choices"][0]["message"]["content"]
+                    return result["choices"][0]["message"]["content"], finish_reason
                 except Exception:
                     # fallback: try top-level 'content'
                     if isinstance(result, dict) and "content" in result:
-                        return result["content"]
+                        return result["content"], finish_reason
                     raise RuntimeError("Unexpected Llama API response shape")
 
         except httpx.HTTPStatusError as e:
+            LLM_REQUESTS.labels(model=self.model, outcome=f"http_{e.response.status_code}").inc()
             logger.error(f"Cerebras API error: {e.response.status_code} - {e.response.text}")
             raise
         except Exception as e:
+            LLM_REQUESTS.labels(model=self.model, outcome="error").inc()
             logger.error(f"Llama API call failed: {str(e)}")
             raise
 
-    async def classify_document(self, text: str) -> str:
+    @property
+    def prompt_version(self) -> str:
         """
-        Classify the type of medical document
+        Short hash of the model and the prompts (rendered for placeholder
+        input). Stored with each analysis, so analyses made with an older
+        prompt or model can be found and rerun (python -m commands.reprocess).
         """
-        messages = [
+        sample = [{"test_name": "TEST", "value": "VALUE", "normal_range": "RANGE",
+                   "status": "STATUS", "plain_english": "MEANING"}]
+        rendered = [
+            self.model,
+            self._classify_messages("TEXT"),
+            self._analysis_messages("TEXT", "TYPE"),
+            self._questions_messages(sample, "TYPE"),
+        ]
+        return hashlib.sha256(json.dumps(rendered).encode()).hexdigest()[:12]
+
+    def _classify_messages(self, text: str) -> List[Dict]:
+        return [
             {
                 "role": "system",
                 "content": "You are a medical document classifier. Classify the document into one of these categories: Lab Results, Imaging Report, Pathology Report, Discharge Summary, Doctor's Notes, or Other. Respond with ONLY the category name."
@@ -100,18 +156,35 @@ class LlamaAnalyzer:
             }
         ]
 
+    async def classify_document(self, text: str) -> str:
+        """
+        Classify the type of medical document
+        """
+        messages = self._classify_messages(text)
         classification = await self._call_llama(messages, temperature=0.1)
         return classification.strip()
 
-    async def analyze_document(self, text: str, document_type: str,
-                               patient_context: Optional[Dict] = None) -> Dict:
-        """
-        Main analysis: Translate medical jargon, identify findings, flag abnormalities
-        """
+    def _analysis_messages(self, text: str, document_type: str,
+                           patient_context: Optional[Dict] = None,
+                           known_results: Optional[List[List[str]]] = None) -> List[Dict]:
         context_str = ""
         if patient_context:
             context_str = f"\nPatient Context: Age {patient_context.get('age', 'unknown')}, Gender {patient_context.get('gender', 'unknown')}"
 
+        # Explanations for these results are filled in from the cache afterwards.
+        # Listed per (test, status, direction), the cache key, so a result
+        # that isn't cached still gets its explanation in this response.
+        known_str = ""
+        if known_results:
+            known_str = (
+                "\nKNOWN RESULTS (explanations already on file), as [test, status, direction]: "
+                + json.dumps(known_results) + "\n"
+                "Direction is low or high (the side of the normal range the value is outside of, or nearest to) "
+                "and within for NORMAL results. For a finding whose test, status and direction all match "
+                "a known result, output ONLY test_name, value, normal_range and status - omit plain_english, "
+                "what_it_means, clinical_significance and recommendations. Give every other finding all fields.\n"
+            )
+
         system_prompt = f"""You are a medical translator helping patients understand their health records.
 
 DOCUMENT TYPE: {document_type}
@@ -127,23 +200,23 @@ CRITICAL CLASSIFICATION RULES (STATUS FIELD):
 
 **URGENT (🔴)** - Immediate medical attention needed:
 - Value is OUTSIDE the normal range (above max OR below min)
-- Borderline values at risk boundary (within 5-10% of range limits)
+- Borderline values at risk boundary (within 5% of the range width from a limit)
 - Critical markers significantly elevated or depleted
 - Example: B12 at 210 pg/mL (normal: 200-900) = URGENT (borderline low)
 - Example: Hemoglobin 10.2 (normal: 12-16) = URGENT (below range)
 - Example: Cholesterol 240 (normal: <200) = URGENT (above range)
 
 **MONITOR (🟡)** - Watch carefully, may need intervention:
-- Value is technically within range but approaching boundaries (10-20% from limits)
+- Value is technically within range but approaching boundaries (5-20% of the range width from a limit)
 - Suboptimal levels that could improve
 - Trending toward abnormal even if currently "normal"
 - Example: B12 at 250 pg/mL (normal: 200-900) = MONITOR (low-normal, should be higher)
-- Example: Vitamin D at 32 ng/mL (normal: 30-100) = MONITOR (barely adequate)
+- Example: Vitamin D at 40 ng/mL (normal: 30-100) = MONITOR (barely adequate)
 - Example: TSH at 3.8 (normal: 0.4-4.0) = MONITOR (high-normal)
 
 **NORMAL (🟢)** - Healthy, optimal range:
 - Value is comfortably within the normal range
-- At least 20% away from both upper and lower limits
+- At least 20% of the range width away from both upper and lower limits
 - No concerns or follow-up needed
 - Example: B12 at 500 pg/mL (normal: 200-900) = NORMAL (middle of range)
 - Example: Vitamin D at 55 ng/mL (normal: 30-100) = NORMAL (optimal)
@@ -196,144 +269,240 @@ REQUIRED OUTPUT FORMAT - MUST BE VALID JSON:
   "monitor_findings_count": 2,
   "normal_findings_count": 9
 }}
-
+{known_str}
 YOUR RESPONSE MUST START WITH {{ AND END WITH }} - NOTHING ELSE."""
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Analyze this document and respond with ONLY valid JSON (no markdown, no preamble):\n\n{text}"}
         ]
 
-        response = await self._call_llama(messages, temperature=0.0)  # Completely deterministic
+    async def analyze_document(self, text: str, document_type: str,
+                               patient_context: Optional[Dict] = None) -> Dict:
+        """
+        Main analysis: Translate medical jargon, identify findings, flag abnormalities
+        """
+        known_results = self.explanations.known_combinations() if self.explanations else []
+        messages = self._analysis_messages(text, document_type, patient_context, known_results)
 
-        try:
-            # Parse JSON response; strip markdown fences and preamble if present
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0]
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0]
-            
-            # Sometimes LLM adds text before JSON like "Here's the analysis:"
-            # Find the first { and last } to extract just the JSON
-            first_brace = response.find('{')
-            last_brace = response.rfind('}')
-            if first_brace != -1 and last_brace != -1:
-                response = response[first_brace:last_brace+1]
-
-            # Try to close incomplete JSON if it's missing closing braces
-            # This handles cases where the response was cut off mid-JSON
-            if response.count('{') > response.count('}'):
-                logger.warning("⚠️  Detected incomplete JSON - attempting to close it")
-                # Count how many closing braces we need
-                missing_closes = response.count('{') - response.count('}')
-                
-                # Try to close the findings array and main object
-                if '"findings"' in response and not response.rstrip().endswith(']}'):
-                    # Close findings array if incomplete
-                    response = response.rstrip().rstrip(',') + ']'
-                
-                # Add remaining closing braces
-                response += '}' * missing_closes
-                logger.info(f"   Added {missing_closes} closing braces to complete JSON")
-
-            analysis = json.loads(response.strip())
-            
-            # Validate and fix count mismatches
-            findings = analysis.get('findings', [])
-            findings_count = len(findings)
-            
-            # Recalculate counts from actual findings
-            urgent_count = sum(1 for f in findings if f.get('status') == 'URGENT')
-            monitor_count = sum(1 for f in findings if f.get('status') == 'MONITOR')
-            normal_count = sum(1 for f in findings if f.get('status') == 'NORMAL')
-            
-            # Fix any count mismatches
-            analysis['urgent_findings_count'] = urgent_count
-            analysis['monitor_findings_count'] = monitor_count
-            analysis['normal_findings_count'] = normal_count
-            
-            # Log the number of findings for debugging consistency
-            logger.info(f"✅ Successfully extracted {findings_count} findings from analysis")
-            logger.info(f"   🔴 Urgent: {urgent_count}")
-            logger.info(f"   🟡 Monitor: {monitor_count}")
-            logger.info(f"   🟢 Normal: {normal_count}")
-            
-            # Warn if the response might have been truncated
-            if findings_count < 20:
-                logger.warning(f"⚠️  Only {findings_count} findings extracted - PDF might have more tests!")
-                logger.warning(f"   If you uploaded a comprehensive lab report, the AI response may have been truncated.")
-            
-            return analysis
+        response, finish_reason = await self._complete(messages, temperature=0.0)  # Completely deterministic
+
+        # Tolerates fences/preamble and recovers what it can from truncated output
+        parsed = parse_partial_json(response)
+        analysis = parsed.value if isinstance(parsed.value, dict) else None
+
+        if analysis is not None and finish_reason == "length" and CONTINUATION_ROUNDS > 0:
+            complete = await self._continue_findings(messages, analysis, response)
+            if complete:
+                parsed.complete = True
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Llama response as JSON: {str(e)}")
+        if analysis is None:
+            logger.error("Failed to parse Llama response as JSON")
             logger.error(f"Response was: {response[:500]}")
-            
-            # Try to salvage findings from incomplete JSON
-            findings = self._extract_findings_from_incomplete_json(response)
-            
             return {
                 "overall_summary": "Analysis completed but formatting issue occurred.",
                 "overall_status": "MONITOR",
-                "findings": findings,
+                "findings": [],
                 "raw_response": response,
                 "error": "JSON parse error - recovered findings"
             }
 
-    def _extract_findings_from_incomplete_json(self, text: str) -> List[Dict]:
+        if not parsed.clean:
+            logger.warning(f"⚠️  Recovered analysis from malformed JSON (complete={parsed.complete}, repairs={parsed.repairs})")
+            analysis.setdefault("overall_summary", "Analysis completed but formatting issue occurred.")
+            analysis.setdefault("overall_status", "MONITOR")
+            analysis["error"] = "JSON parse error - recovered findings"
+
+        # Validate and fix count mismatches
+        findings = [f for f in analysis.get('findings') or [] if isinstance(f, dict)]
+        analysis['findings'] = findings
+        findings_count = len(findings)
+
+        # Statuses follow the documented rules, not the model's reading of them
+        disagreements = apply_statuses(findings)
+        analysis['status_disagreements'] = disagreements
+        trace_add("status_disagreements", disagreements)
+
+        # Before explanations: cache keys include the final status
+        if self.explanations:
+            await self._apply_explanations(findings)
+
+        # Recalculate counts from actual findings
+        urgent_count = sum(1 for f in findings if f.get('status') == 'URGENT')
+        monitor_count = sum(1 for f in findings if f.get('status') == 'MONITOR')
+        normal_count = sum(1 for f in findings if f.get('status') == 'NORMAL')
+
+        # Fix any count mismatches
+        analysis['urgent_findings_count'] = urgent_count
+        analysis['monitor_findings_count'] = monitor_count
+        analysis['normal_findings_count'] = normal_count
+        if disagreements and findings and STATUS_OVERRIDE:
+            analysis['overall_status'] = "URGENT" if urgent_count else "MONITOR" if monitor_count else "NORMAL"
+
+        # Log the number of findings for debugging consistency
+        logger.info(f"✅ Successfully extracted {findings_count} findings from analysis")
+        logger.info(f"   🔴 Urgent: {urgent_count}")
+        logger.info(f"   🟡 Monitor: {monitor_count}")
+        logger.info(f"   🟢 Normal: {normal_count}")
+
+        # Warn if the response might have been truncated
+        if findings_count < 20:
+            logger.warning(f"⚠️  Only {findings_count} findings extracted - PDF might have more tests!")
+            logger.warning(f"   If you uploaded a comprehensive lab report, the AI response may have been truncated.")
+
+        return analysis
+
+    async def _continue_findings(self, messages: List[Dict], analysis: Dict, response: str) -> bool:
         """
-        Extract findings from incomplete/malformed JSON response
+        Ask for the findings after the last complete one until a response
+        finishes on its own or CONTINUATION_ROUNDS is used up. Each request
+        carries the conversation so far, truncated replies included, so the
+        model sees where it stopped. Findings are appended to analysis in
+        place; returns True if the final round was not truncated.
         """
-        import re
-        findings = []
-        
+        findings = [f for f in analysis.get('findings') or [] if isinstance(f, dict)]
+        analysis['findings'] = findings
+        seen = {(canonical_test_key(str(f.get('test_name', ''))), str(f.get('value'))) for f in findings}
+
+        for round_number in range(1, CONTINUATION_ROUNDS + 1):
+            done = [f.get('test_name') for f in findings]
+            last = f' after "{done[-1]}"' if done else ""
+            follow_up = messages + [{"role": "assistant", "content": response}, {
+                "role": "user",
+                "content": (
+                    f"Your previous response was cut off{last}. Already returned: {json.dumps(done)}\n\n"
+                    "Continue with the remaining test results from the document, in document order, "
+                    "skipping the tests already returned. Respond with ONLY valid JSON: "
+                    '{"findings": [ ... ]} using the same finding fields as before.'
+                )
+            }]
+            messages = follow_up
+            response, finish_reason = await self._complete(messages, temperature=0.0)
+            trace_add("continuations", 1)
+
+            parsed = parse_partial_json(response)
+            more = parsed.value.get('findings') if isinstance(parsed.value, dict) else None
+            added = 0
+            for finding in more or []:
+                if not isinstance(finding, dict):
+                    continue
+                key = (canonical_test_key(str(finding.get('test_name', ''))), str(finding.get('value')))
+                if key not in seen:
+                    seen.add(key)
+                    findings.append(finding)
+                    added += 1
+
+            logger.info(f"🔁 Continuation round {round_number}: +{added} findings ({len(findings)} total)")
+            if finish_reason != "length":
+                analysis['continuation_rounds'] = round_number
+                return True
+            if not added:
+                break
+
+        analysis['continuation_rounds'] = round_number
+        logger.warning(f"⚠️  Analysis still truncated after {round_number} continuation round(s)")
+        return False
+
+    async def _apply_explanations(self, findings: List[Dict]):
+        """
+        Fill findings the prompt left without explanations from the cache,
+        generate the ones still missing, and in the background add generic
+        entries for result combinations seen for the first time.
+        """
+        hits = sum(1 for f in findings if self.explanations.fill(f))
+        trace_add("explanation_hits", hits)
         try:
-            # Try to find all test_name patterns and extract the finding object
-            # Look for pattern: {"test_name": "...", "value": "...", ...}
-            pattern = r'\{\s*"test_name":\s*"([^"]+)"[^}]*"value":\s*"([^"]*)"[^}]*"normal_range":\s*"([^"]*)"[^}]*"status":\s*"([^"]*)"[^}]*"plain_english":\s*"([^"]*)"'
-            
-            matches = re.finditer(pattern, text, re.DOTALL)
-            
-            for match in matches:
-                finding = {
-                    "test_name": match.group(1),
-                    "value": match.group(2),
-                    "normal_range": match.group(3),
-                    "status": match.group(4),
-                    "plain_english": match.group(5)
-                }
-                
-                # Try to extract additional fields if present
-                finding_text = text[match.start():min(match.end() + 500, len(text))]
-                
-                what_match = re.search(r'"what_it_means":\s*"([^"]*)"', finding_text)
-                if what_match:
-                    finding["what_it_means"] = what_match.group(1)
-                
-                sig_match = re.search(r'"clinical_significance":\s*"([^"]*)"', finding_text)
-                if sig_match:
-                    finding["clinical_significance"] = sig_match.group(1)
-                
-                rec_match = re.search(r'"recommendations":\s*\[(.*?)\]', finding_text)
-                if rec_match:
-                    recs = re.findall(r'"([^"]+)"', rec_match.group(1))
-                    finding["recommendations"] = recs
-                else:
-                    finding["recommendations"] = []
-                
-                findings.append(finding)
-            
-            logger.info(f"Recovered {len(findings)} findings from incomplete JSON")
-            return findings
-            
+            await self.explanations.save_hits()
         except Exception as e:
-            logger.error(f"Failed to extract findings from incomplete JSON: {str(e)}")
-            return []
-
-    async def generate_questions(self, findings: List[Dict], document_type: str) -> List[Dict]:
+            logger.warning(f"⚠️  Could not save explanation hit counts: {e}")
+
+        missing = [f for f in findings if not has_explanation(f)]
+        if missing:
+            await self.explain_findings(missing)
+            for finding in missing:
+                self.explanations.fill(finding, record=False)
+
+        # Combinations explained inline are cached from a generic prompt, not
+        # copied from the finding, whose wording is about this patient's value
+        new = [f for f in findings if self.explanations.lookup(f) is None]
+        if new:
+            task = asyncio.create_task(self.explain_findings(new))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def drain(self, timeout: float = DRAIN_SECONDS):
         """
-        Generate personalized questions for doctor based on findings
+        Let background explanation requests finish, cancelling any still
+        running after timeout. Call before closing the database they write to.
         """
+        if not self._background:
+            return
+        pending = set(self._background)
+        logger.info(f"Waiting for {len(pending)} background explanation request(s)")
+        _, still_running = await asyncio.wait(pending, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            await asyncio.gather(*still_running, return_exceptions=True)
+            logger.warning(f"⚠️  Cancelled {len(still_running)} background explanation request(s) at shutdown")
+
+    async def explain_findings(self, findings: List[Dict]):
+        """
+        Generate generic, patient-independent explanations for each distinct
+        (test, status, direction) among findings and add them to the cache
+        """
+        keys = {}
+        for finding in findings:
+            key = explanation_key(finding)
+            if key[0] and key not in keys:
+                keys[key] = finding.get('test_name')
+        if not keys:
+            return
+
+        lines = "\n".join(f"- {name} | {status} | {direction}" for (_, status, direction), name in keys.items())
+        system_prompt = """You write generic patient-friendly explanations of lab results.
+Each input line is: test name | status (NORMAL, MONITOR or URGENT) | direction (low, high, within or unknown).
+Explain what that kind of result generally means. Do not mention specific values.
+
+Respond with ONLY valid JSON:
+{"explanations": [{"test_name": "...", "status": "...", "direction": "...", "plain_english": "1 sentence, 8th grade level", "what_it_means": "1 sentence", "clinical_significance": "1 sentence", "recommendations": ["...", "..."]}]}"""
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": lines}
+        ]
+        try:
+            response = await self._call_llama(messages, temperature=0.0)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not generate explanations: {e}")
+            return
+
+        parsed = parse_partial_json(response)
+        items = parsed.value.get('explanations') if isinstance(parsed.value, dict) else None
+        entries = []
+        for item in items or []:
+            if not isinstance(item, dict) or not item.get('plain_english'):
+                continue
+            key = (
+                canonical_test_key(str(item.get('test_name') or '')),
+                str(item.get('status') or '').upper(),
+                str(item.get('direction') or '').lower(),
+            )
+            if key not in keys:
+                continue
+            test_key, status, direction = key
+            entry = {field: item.get(field) for field in EXPLANATION_FIELDS}
+            if not isinstance(entry['recommendations'], list):
+                entry['recommendations'] = []
+            entry.update(test_key=test_key, status=status, direction=direction, test_name=keys[key])
+            entries.append(entry)
+
+        try:
+            await self.explanations.add(entries)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not store explanations: {e}")
+
+    def _questions_messages(self, findings: List[Dict], document_type: str) -> List[Dict]:
         # Create detailed findings summary with actual values
         findings_details = []
         for f in findings:
@@ -391,7 +560,7 @@ Categories: Treatment, Lifestyle, Medication, Testing, Prevention, General
 
 YOUR RESPONSE MUST START WITH {{ AND END WITH }} - NOTHING ELSE."""
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {
                 "role": "user",
@@ -399,37 +568,31 @@ YOUR RESPONSE MUST START WITH {{ AND END WITH }} - NOTHING ELSE."""
             }
         ]
 
+    async def generate_questions(self, findings: List[Dict], document_type: str) -> List[Dict]:
+        """
+        Generate personalized questions for doctor based on findings
+        """
+        messages = self._questions_messages(findings, document_type)
         response = await self._call_llama(messages, temperature=0.3)
 
-        try:
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0]
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0]
-            
-            # Sometimes LLM adds text before JSON; extract just the JSON object
-            first_brace = response.find('{')
-            last_brace = response.rfind('}')
-            if first_brace != -1 and last_brace != -1:
-                response = response[first_brace:last_brace+1]
-
-            questions_data = json.loads(response.strip())
-            questions = questions_data.get("questions", [])
-            
-            # Clean up any LLM formatting quirks where it includes "question": in the text
-            for q in questions:
-                if "question" in q and isinstance(q["question"], str):
-                    # Remove any leading '"question": "' patterns
-                    q["question"] = q["question"].replace('"question": "', '').strip('"')
-                    q["question"] = q["question"].replace('",', '').strip()
-            
-            return questions
+        parsed = parse_partial_json(response)
+        questions_data = parsed.value if isinstance(parsed.value, dict) else {}
+        questions = [q for q in questions_data.get("questions") or [] if isinstance(q, dict) and q.get("question")]
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse questions JSON: {str(e)}")
+        if not questions:
+            logger.error("Failed to parse questions JSON")
             logger.error(f"Response was: {response[:500]}")
             return self._extract_questions_from_text(response)
 
+        # Clean up any LLM formatting quirks where it includes "question": in the text
+        for q in questions:
+            if isinstance(q["question"], str):
+                # Remove any leading '"question": "' patterns
+                q["question"] = q["question"].replace('"question": "', '').strip('"')
+                q["question"] = q["question"].replace('",', '').strip()
+
+        return questions
+
     def _extract_questions_from_text(self, text: str) -> List[Dict]:
         """
         Fallback: Extract questions from unstructured text
@@ -0,0 +1,120 @@
+import time
+import functools
+import inspect
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+# Pipeline stages run from seconds (extract) to minutes (analyze on big reports)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+STAGE_DURATION = Histogram(
+    "docusage_stage_duration_seconds",
+    "Time spent in each document pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_TOKENS = Counter(
+    "docusage_llm_tokens_total",
+    "LLM tokens consumed",
+    ["model", "kind"],
+)
+
+LLM_REQUESTS = Counter(
+    "docusage_llm_requests_total",
+    "LLM API calls by outcome",
+    ["model", "outcome"],
+)
+
+CACHE_REQUESTS = Counter(
+    "docusage_cache_requests_total",
+    "Cache lookups by result (hit ratio = hit / (hit + miss))",
+    ["cache", "result"],
+)
+
+JOBS_IN_FLIGHT = Gauge(
+    "docusage_jobs_in_flight",
+    "Documents currently being processed",
+    ["path"],
+)
+
+JOBS_TOTAL = Counter(
+    "docusage_jobs_total",
+    "Finished processing jobs by outcome",
+    ["path", "outcome"],
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "docusage_db_pool_connections",
+    "PostgreSQL pool connections by state (open, in_use, idle, max)",
+    ["state"],
+)
+
+DB_POOL_WAIT = Histogram(
+    "docusage_db_pool_wait_seconds",
+    "Time spent waiting to acquire a pooled connection",
+    buckets=DB_BUCKETS,
+)
+
+STARTUP_SECONDS = Gauge(
+    "docusage_startup_seconds",
+    "Cold-start time of this process by phase (import, lifespan, total)",
+    ["phase"],
+)
+
+DB_QUERY_DURATION = Histogram(
+    "docusage_db_query_seconds",
+    "Database call latency",
+    ["backend", "operation"],
+    buckets=DB_BUCKETS,
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Observe the wall time of a pipeline stage (works in sync and async code)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_llm_usage(model: str, usage: dict):
+    if not usage:
+        return
+    LLM_TOKENS.labels(model=model, kind="prompt").inc(usage.get("prompt_tokens") or 0)
+    LLM_TOKENS.labels(model=model, kind="completion").inc(usage.get("completion_tokens") or 0)
+
+
+def timed_queries(backend: str):
+    """
+    Class decorator: time every public async method of a database class
+    into docusage_db_query_seconds{backend, operation}
+    """
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(method):
+                continue
+            if name in ("connect", "disconnect", "init_tables"):
+                continue
+            histogram = DB_QUERY_DURATION.labels(backend=backend, operation=name)
+
+            def wrap(method, histogram):
+                @functools.wraps(method)
+                async def timed(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await method(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+                return timed
+
+            setattr(cls, name, wrap(method, histogram))
+        return cls
+    return decorate
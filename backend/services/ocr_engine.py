@@ -0,0 +1,126 @@
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from PIL import Image
+
+from services.image_preprocessing import (
+    TARGET_DPI,
+    TESSERACT_CONFIG,
+    TESSERACT_PSM,
+    TESSERACT_VARIABLES,
+)
+
+logger = logging.getLogger(__name__)
+
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+
+
+class TesserocrEngine:
+    """
+    Pool of long-lived in-process tesseract instances (via tesserocr).
+    Each instance loads the language model once and receives pixels
+    directly from PIL, so there is no process spawn or temp file per page.
+    A tesseract instance is not thread-safe, so each call checks one out.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, size: int = OCR_WORKERS):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        # Fail fast (and fall back) if the language data can't be loaded
+        self._idle.put(self._new_api())
+
+    def _new_api(self):
+        tesserocr = self._tesserocr
+        api = tesserocr.PyTessBaseAPI(
+            lang=OCR_LANG,
+            psm=tesserocr.PSM(TESSERACT_PSM),
+            oem=tesserocr.OEM.LSTM_ONLY,
+        )
+        for name, value in TESSERACT_VARIABLES.items():
+            api.SetVariable(name, value)
+        self._created += 1
+        logger.info(f"Started tesseract worker {self._created}/{self.size}")
+        return api
+
+    @contextmanager
+    def _checkout(self):
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                api = self._new_api() if self._created < self.size else None
+            if api is None:
+                api = self._idle.get()
+        try:
+            yield api
+        finally:
+            self._idle.put(api)
+
+    def recognize(self, img: Image.Image) -> str:
+        with self._checkout() as api:
+            api.SetImage(img)
+            api.SetSourceResolution(TARGET_DPI)
+            try:
+                return api.GetUTF8Text()
+            finally:
+                api.Clear()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                break
+
+
+class PytesseractEngine:
+    """Fallback: one tesseract subprocess per image via pytesseract"""
+
+    name = "pytesseract"
+
+    def __init__(self):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+
+    def recognize(self, img: Image.Image) -> str:
+        return self._pytesseract.image_to_string(img, lang=OCR_LANG, config=TESSERACT_CONFIG)
+
+    def close(self):
+        pass
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """
+    Shared OCR engine. Prefers the tesserocr pool; set OCR_ENGINE=pytesseract
+    to force the subprocess fallback.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                preferred = os.getenv("OCR_ENGINE", "tesserocr").lower()
+                if preferred == "tesserocr":
+                    try:
+                        _engine = TesserocrEngine()
+                    except Exception as e:
+                        logger.info(f"tesserocr unavailable ({e}); falling back to pytesseract")
+                if _engine is None:
+                    _engine = PytesseractEngine()
+                logger.info(f"OCR engine: {_engine.name}")
+    return _engine
@@ -0,0 +1,278 @@
+"""
+Pluggable PDF text extractors.
+
+Each backend returns one string per page. DocumentProcessor runs the
+fastest available backend over the whole document and only re-extracts
+pages whose table layout that pass lost with the layout-aware (slow)
+backend.
+
+Compare backends on a set of PDFs with:
+    python -m services.pdf_extractors path/to/*.pdf
+"""
+import os
+import re
+import abc
+import sys
+import json
+import time
+import logging
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Registered extractors by name, in registration order
+PDF_EXTRACTORS: Dict[str, "PdfExtractor"] = {}
+
+# Which pages get the layout-aware pass: "tables" (where the fast pass lost the layout), "all" or "none"
+PDF_LAYOUT_PAGES = os.getenv("PDF_LAYOUT_PAGES", "tables").lower()
+
+# Fast backends to try, in order of preference
+PDF_FAST_EXTRACTORS = [
+    name.strip() for name in os.getenv("PDF_FAST_EXTRACTORS", "pypdfium2,pypdf2").split(",")
+    if name.strip()
+]
+PDF_LAYOUT_EXTRACTOR = os.getenv("PDF_LAYOUT_EXTRACTOR", "pdfplumber")
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# A fast backend that reads a table column by column gives the test names,
+# then the values ("10.2 g/dL"), then the ranges, each on lines of their own.
+# A page lost its layout when at least TABLE_MIN_LINES lines, and this share
+# of all its lines, are values without a label. Rows read intact
+# ("Hemoglobin 10.2 g/dL 12.0 - 16.0") need no second pass.
+DETACHED_LINE_RATIO = 0.3
+TABLE_MIN_LINES = 3
+
+
+def register_extractor(cls):
+    """Class decorator adding an extractor to the registry (fails here if it's incomplete)"""
+    PDF_EXTRACTORS[cls.name] = cls()
+    return cls
+
+
+class PdfExtractor(abc.ABC):
+    """Base class: subclasses set `name` and implement extract_pages"""
+
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    def extract_pages(self, path: str, page_numbers: Optional[Sequence[int]] = None) -> List[str]:
+        """Return text per page; page_numbers (0-based) restricts which pages are read"""
+
+
+@register_extractor
+class PdfiumExtractor(PdfExtractor):
+    """PDFium via pypdfium2: C++ text extraction, no layout analysis"""
+
+    name = "pypdfium2"
+
+    def available(self) -> bool:
+        try:
+            import pypdfium2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract_pages(self, path, page_numbers=None):
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(path)
+        try:
+            indices = page_numbers if page_numbers is not None else range(len(pdf))
+            pages = []
+            for i in indices:
+                page = pdf[i]
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range() or "")
+                textpage.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+@register_extractor
+class PyPDF2Extractor(PdfExtractor):
+    """PyPDF2: pure Python, no per-character layout work"""
+
+    name = "pypdf2"
+
+    def available(self) -> bool:
+        try:
+            import PyPDF2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract_pages(self, path, page_numbers=None):
+        import PyPDF2
+
+        with open(path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            indices = page_numbers if page_numbers is not None else range(len(reader.pages))
+            pages = []
+            for i in indices:
+                try:
+                    pages.append(reader.pages[i].extract_text() or "")
+                except Exception:
+                    pages.append("")
+            return pages
+
+
+@register_extractor
+class PdfplumberExtractor(PdfExtractor):
+    """pdfplumber: per-character layout, keeps table rows together (slow)"""
+
+    name = "pdfplumber"
+
+    def available(self) -> bool:
+        try:
+            import pdfplumber  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract_pages(self, path, page_numbers=None):
+        import pdfplumber
+
+        wanted = [i + 1 for i in page_numbers] if page_numbers is not None else None
+        with pdfplumber.open(path, pages=wanted) as pdf:
+            return [page.extract_text() or "" for page in pdf.pages]
+
+
+def get_extractor(name: str) -> Optional[PdfExtractor]:
+    extractor = PDF_EXTRACTORS.get(name)
+    if extractor and extractor.available():
+        return extractor
+    return None
+
+
+def _has_label(line: str) -> bool:
+    """A word of 3+ letters that isn't a unit like mg/dL (test names, headings)"""
+    return any("/" not in token and sum(ch.isalpha() for ch in token) >= 3 for token in line.split())
+
+
+def lost_table_layout(page_text: str) -> bool:
+    lines = [line for line in page_text.splitlines() if line.strip()]
+    detached = sum(1 for line in lines if _NUMBER.search(line) and not _has_label(line))
+    return detached >= TABLE_MIN_LINES and detached / len(lines) >= DETACHED_LINE_RATIO
+
+
+def candidate_extractors() -> List[PdfExtractor]:
+    """Available extractors for the full pass: the fast ones, the layout one, then any other registered"""
+    chain = []
+    for name in dict.fromkeys(PDF_FAST_EXTRACTORS + [PDF_LAYOUT_EXTRACTOR] + list(PDF_EXTRACTORS)):
+        extractor = get_extractor(name)
+        if extractor:
+            chain.append(extractor)
+    return chain
+
+
+def extract_pdf_pages(path: str) -> List[str]:
+    """
+    Fast pass over every page, then a layout pass only for pages that need it
+    (see PDF_LAYOUT_PAGES and lost_table_layout). Returns one string per page.
+
+    A backend that fails on the file (malformed, encrypted, unsupported
+    feature) is logged and the next one in candidate_extractors() is tried;
+    the error is raised only when all of them fail. A failed layout pass
+    keeps the fast text.
+    """
+    layout = get_extractor(PDF_LAYOUT_EXTRACTOR)
+
+    pages, used, error = None, None, None
+    for extractor in candidate_extractors():
+        try:
+            pages, used = extractor.extract_pages(path), extractor
+            break
+        except Exception as e:
+            logger.warning(f"{extractor.name} could not read {os.path.basename(path)}: {e}")
+            error = e
+    if used is None:
+        if error is not None:
+            raise error
+        return []
+
+    if not layout or layout is used or PDF_LAYOUT_PAGES == "none":
+        return pages
+
+    if PDF_LAYOUT_PAGES == "all":
+        redo = list(range(len(pages)))
+    else:
+        redo = [i for i, text in enumerate(pages) if lost_table_layout(text)]
+
+    if redo:
+        logger.info(f"{used.name}: {len(pages)} pages, {len(redo)} re-read with {layout.name} for table layout")
+        try:
+            layout_pages = layout.extract_pages(path, redo)
+        except Exception as e:
+            logger.warning(f"{layout.name} layout pass failed, keeping {used.name} text: {e}")
+            layout_pages = []
+        for i, text in zip(redo, layout_pages):
+            # Keep the fast text if the layout pass came back empty
+            if text.strip():
+                pages[i] = text
+
+    return pages
+
+
+def _number_recall(candidate: str, reference: str) -> float:
+    """Share of the reference's numbers (the values we care about) found in candidate"""
+    ref_numbers = _NUMBER.findall(reference)
+    if not ref_numbers:
+        return 1.0
+    remaining = {}
+    for n in _NUMBER.findall(candidate):
+        remaining[n] = remaining.get(n, 0) + 1
+    found = 0
+    for n in ref_numbers:
+        if remaining.get(n):
+            remaining[n] -= 1
+            found += 1
+    return found / len(ref_numbers)
+
+
+def benchmark(paths: Sequence[str], reference: str = PDF_LAYOUT_EXTRACTOR) -> Dict[str, Dict]:
+    """
+    Time every available extractor on the given PDFs. Quality is the recall
+    of numeric tokens against the reference backend's output.
+    """
+    outputs: Dict[str, List[str]] = {}
+    report: Dict[str, Dict] = {}
+
+    for name, extractor in PDF_EXTRACTORS.items():
+        if not extractor.available():
+            report[name] = {"available": False}
+            continue
+        texts, pages, elapsed = [], 0, 0.0
+        for path in paths:
+            start = time.perf_counter()
+            page_texts = extractor.extract_pages(path)
+            elapsed += time.perf_counter() - start
+            pages += len(page_texts)
+            texts.append("\n".join(page_texts))
+        outputs[name] = texts
+        report[name] = {
+            "available": True,
+            "pages": pages,
+            "seconds": round(elapsed, 4),
+            "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        }
+
+    ref_texts = outputs.get(reference)
+    for name, texts in outputs.items():
+        if ref_texts:
+            scores = [_number_recall(c, r) for c, r in zip(texts, ref_texts)]
+            report[name]["quality"] = round(sum(scores) / len(scores), 4) if scores else None
+
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m services.pdf_extractors file.pdf [file.pdf ...]")
+        sys.exit(1)
+    print(json.dumps(benchmark(sys.argv[1:]), indent=2))
@@ -0,0 +1,385 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from services.metrics import JOBS_IN_FLIGHT, JOBS_TOTAL
+from services.tracing import PipelineTrace
+
+logger = logging.getLogger(__name__)
+
+# classify_document only reads this much of the text
+CLASSIFY_PREFIX_CHARS = 1000
+
+# A processing claim older than this (no heartbeat) is considered abandoned
+CLAIM_TTL = float(os.getenv("PIPELINE_CLAIM_TTL", "300"))
+# How often a process waiting on another's claim checks again
+CLAIM_POLL = float(os.getenv("PIPELINE_CLAIM_POLL", "1"))
+# Longest a caller waits on another process's run before giving up with a 409
+CLAIM_WAIT = float(os.getenv("PIPELINE_CLAIM_WAIT", "900"))
+
+# Checkpointed stages, in order; a rerun resumes at the first one missing
+STAGES = ("extract", "classify", "analyze", "questions")
+
+
+async def _classify(llama_analyzer, text: str, trace: PipelineTrace) -> str:
+    with trace.stage("classify"):
+        return await llama_analyzer.classify_document(text)
+
+
+async def extract_and_classify(document_processor, llama_analyzer, file_path: str, trace: PipelineTrace,
+                               on_extracted: Optional[Callable[[str], Awaitable]] = None
+                               ) -> Tuple[str, Optional[str]]:
+    """
+    Extract text page by page and start classification as soon as the
+    first CLASSIFY_PREFIX_CHARS characters exist, so the classify round
+    trip runs while the remaining pages are still being extracted/OCR'd.
+    The prefix is the same one classify would see on the full text.
+
+    Returns (extracted_text, document_type); document_type is None when
+    no text was extracted and "unknown" without an analyzer. on_extracted
+    is awaited with the text once extraction finishes, before waiting on
+    classification.
+    """
+    pages = []
+    classify_task: Optional[asyncio.Task] = None
+    try:
+        with trace.stage("extract"):
+            async for page in document_processor.iter_pages(file_path):
+                pages.append(page)
+                if classify_task is None and llama_analyzer:
+                    prefix = document_processor.clean_text("\n".join(pages))
+                    if len(prefix) >= CLASSIFY_PREFIX_CHARS:
+                        logger.info(f"Classifying after {len(pages)} page(s), extraction continues")
+                        classify_task = asyncio.create_task(_classify(llama_analyzer, prefix, trace))
+
+        extracted_text = document_processor.clean_text("\n".join(pages))
+        if not extracted_text:
+            return extracted_text, None
+        if on_extracted is not None:
+            await on_extracted(extracted_text)
+        if not llama_analyzer:
+            return extracted_text, "unknown"
+
+        if classify_task is None:
+            # Short document: nothing to overlap with
+            return extracted_text, await _classify(llama_analyzer, extracted_text, trace)
+
+        # Whatever classification time extraction did not hide
+        with trace.stage("classify_wait"):
+            return extracted_text, await classify_task
+    finally:
+        if classify_task is not None and not classify_task.done():
+            classify_task.cancel()
+
+
+class PipelineError(Exception):
+    """A run rejected before producing a result (mapped to an HTTP error by main.py)"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class DocumentPipeline:
+    """
+    Extract -> classify -> analyze -> questions -> save, shared by the
+    /process endpoint and upload's background processing.
+
+    Each stage's output is checkpointed (pipeline_checkpoints), so a run
+    after a failure resumes at the first incomplete stage instead of
+    starting again from OCR. Checkpoints are dropped once the result is saved.
+
+    One run per document at a time: a second trigger in this process joins
+    the run already in flight, and a claim on the document row keeps other
+    processes from starting another one (they wait for it and return its
+    stored result). A reanalysis can't reuse another run's result, so one
+    requested during a full run is queued to start after it.
+    """
+
+    def __init__(self, document_processor, llama_analyzer, storage, db=None):
+        self.document_processor = document_processor
+        self.llama_analyzer = llama_analyzer
+        self.storage = storage
+        self.db = db
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # document_id -> (task, reuse_text) of the run in flight
+        self._inflight: Dict[str, Tuple[asyncio.Task, bool]] = {}
+
+    def in_flight(self, document_id: str) -> bool:
+        return document_id in self._inflight
+
+    async def run(self, document_id: str, storage_key: Optional[str], path: str,
+                  reuse_text: bool = False) -> Dict:
+        """
+        Process a document, or wait for the run already in flight for it.
+        reuse_text reruns only the LLM stages from the stored text.
+        """
+        inflight = self._inflight.get(document_id)
+        if inflight is None:
+            task = self._start(document_id, self._claimed_run(document_id, storage_key, path, reuse_text), reuse_text)
+        elif reuse_text and not inflight[1]:
+            # The run in flight may resume from old checkpoints, so its result isn't a reanalysis
+            logger.info(f"🔁 Reanalysis of {document_id} queued behind the run in flight")
+            task = self._start(document_id, self._run_after(inflight[0], document_id, path), reuse_text)
+        else:
+            task = inflight[0]
+            logger.info(f"🔗 Joining the run already in flight for {document_id}")
+            JOBS_TOTAL.labels(path=path, outcome="joined").inc()
+        # A caller going away (client disconnect) must not cancel the run for the others
+        return await asyncio.shield(task)
+
+    async def reanalyze(self, document_id: str) -> Dict:
+        """Classify, analyze and generate questions again without re-extracting"""
+        if not self.db:
+            raise PipelineError(500, "Database not configured")
+        if not await self.db.get_extracted_text(document_id):
+            raise PipelineError(409, "No stored text for this document; process it first")
+        return await self.run(document_id, None, "reanalyze", reuse_text=True)
+
+    def _start(self, document_id: str, run: Awaitable[Dict], reuse_text: bool) -> asyncio.Task:
+        task = asyncio.create_task(run)
+        self._inflight[document_id] = (task, reuse_text)
+        task.add_done_callback(lambda done: self._forget(document_id, done))
+        return task
+
+    def _forget(self, document_id: str, task: asyncio.Task):
+        inflight = self._inflight.get(document_id)
+        if inflight is not None and inflight[0] is task:
+            del self._inflight[document_id]
+
+    async def _run_after(self, previous: asyncio.Task, document_id: str, path: str) -> Dict:
+        """Reanalyze once the run in flight has finished, whatever its outcome"""
+        await asyncio.wait({previous})
+        return await self._claimed_run(document_id, None, path, reuse_text=True)
+
+    async def _claimed_run(self, document_id: str, storage_key: Optional[str], path: str,
+                           reuse_text: bool) -> Dict:
+        waited = await self._claim(document_id, path) if self.db else False
+
+        heartbeat = asyncio.create_task(self._heartbeat(document_id, asyncio.current_task())) if self.db else None
+        try:
+            if waited and not reuse_text:
+                result = await self._finished_result(document_id)
+                if result is not None:
+                    return result
+            return await self._process(document_id, storage_key, path, reuse_text)
+        except asyncio.CancelledError:
+            if heartbeat is not None and heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                # Another owner took the document over and is processing it now
+                JOBS_TOTAL.labels(path=path, outcome="rejected").inc()
+                raise PipelineError(409, "The document was taken over by another run; try again shortly")
+            raise
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+                try:
+                    await self.db.release_document(document_id, self.owner)
+                except Exception as e:
+                    logger.warning(f"Could not release claim on {document_id}: {e}")
+
+    async def _claim(self, document_id: str, path: str) -> bool:
+        """
+        Take the processing claim on the document row, waiting up to
+        CLAIM_WAIT while another process holds it. Returns whether it had to
+        wait (that run's stored result may then be reused).
+        """
+        waited = False
+        deadline = asyncio.get_running_loop().time() + CLAIM_WAIT
+        while not await self.db.claim_document(document_id, self.owner, CLAIM_TTL):
+            # The claim is an UPDATE of the row, so a missing row fails it too
+            if not await self.db.get_document(document_id):
+                raise PipelineError(404, "Document not found")
+            if not waited:
+                logger.info(f"⏳ {document_id} is being processed elsewhere; waiting for that run")
+                JOBS_TOTAL.labels(path=path, outcome="joined").inc()
+                waited = True
+            if asyncio.get_running_loop().time() >= deadline:
+                raise PipelineError(409, "The document is still being processed elsewhere; try again later")
+            await asyncio.sleep(CLAIM_POLL)
+        return waited
+
+    async def _heartbeat(self, document_id: str, run: asyncio.Task) -> bool:
+        """
+        Keep the claim fresh so long OCR/LLM runs aren't taken over. If
+        another owner has taken it over anyway, cancel the run rather than
+        process the document twice; returns True in that case.
+        """
+        while True:
+            await asyncio.sleep(CLAIM_TTL / 3)
+            try:
+                claimed = await self.db.claim_document(document_id, self.owner, CLAIM_TTL)
+            except Exception as e:
+                logger.warning(f"Claim heartbeat failed for {document_id}: {e}")
+                continue
+            if not claimed:
+                logger.warning(f"⚠️  Lost the processing claim on {document_id}; stopping this run")
+                run.cancel()
+                return True
+
+    async def _finished_result(self, document_id: str) -> Optional[Dict]:
+        """The result stored by the run we waited for, if it completed"""
+        document = await self.db.get_document(document_id)
+        if not document:
+            raise PipelineError(404, "Document not found")
+        if document.get("status") != "completed":
+            return None
+        return await self.db.get_analysis(document_id)
+
+    async def _process(self, document_id: str, storage_key: Optional[str], path: str,
+                       reuse_text: bool = False) -> Dict:
+        JOBS_IN_FLIGHT.labels(path=path).inc()
+        trace = PipelineTrace(document_id, path)
+        trace.activate()
+        try:
+            logger.info(f"Processing started: {document_id} ({path})")
+            extracted_text = None
+            if reuse_text:
+                # Every LLM stage runs again; only extraction is reused
+                await self.db.clear_checkpoints(document_id)
+                checkpoints = {"extract": {}}
+            else:
+                checkpoints = await self._load_checkpoints(document_id)
+                if checkpoints:
+                    logger.info(f"♻️  Resuming {document_id} after: {', '.join(checkpoints)}")
+                    trace.add("resumed_stages", len(checkpoints))
+
+            if "extract" in checkpoints:
+                with trace.stage("load_text"):
+                    extracted_text = await self.db.get_extracted_text(document_id)
+                if not extracted_text:
+                    if reuse_text:
+                        raise PipelineError(409, "No stored text for this document; process it first")
+                    # Text went missing: start over
+                    checkpoints = {}
+                elif reuse_text:
+                    await self._checkpoint(document_id, "extract", {"chars": len(extracted_text)})
+
+            if extracted_text:
+                if "classify" in checkpoints:
+                    document_type = checkpoints["classify"]["document_type"]
+                else:
+                    document_type = await self._classify(extracted_text, trace)
+            else:
+                if not self.document_processor:
+                    raise PipelineError(500, "Document processor not configured")
+
+                async def on_extracted(text: str):
+                    # Stored once per document; the checkpoint only marks it done
+                    if self.db:
+                        await self.db.save_extracted_text(document_id, text)
+                    await self._checkpoint(document_id, "extract", {"chars": len(text)})
+
+                # Extract text and classify (classification starts on the first pages)
+                async with self.storage.open_local(storage_key) as file_path:
+                    extracted_text, document_type = await extract_and_classify(
+                        self.document_processor, self.llama_analyzer, file_path, trace, on_extracted
+                    )
+                if not extracted_text:
+                    raise PipelineError(400, "Could not extract text from document")
+
+            if "classify" not in checkpoints:
+                await self._checkpoint(document_id, "classify", {"document_type": document_type})
+                if self.db:
+                    await self.db.set_document_type(document_id, document_type)
+
+            if "analyze" in checkpoints:
+                analysis = checkpoints["analyze"]
+            else:
+                with trace.stage("analyze"):
+                    analysis = await self.llama_analyzer.analyze_document(
+                        text=extracted_text,
+                        document_type=document_type
+                    ) if self.llama_analyzer else {"findings": []}
+                await self._checkpoint(document_id, "analyze", analysis)
+
+            if "questions" in checkpoints:
+                questions = checkpoints["questions"]
+            else:
+                with trace.stage("questions"):
+                    questions = await self.llama_analyzer.generate_questions(
+                        findings=analysis.get("findings", []),
+                        document_type=document_type
+                    ) if self.llama_analyzer else []
+                await self._checkpoint(document_id, "questions", questions)
+
+            result = {
+                "document_id": document_id,
+                "document_type": document_type,
+                "extracted_text": extracted_text,
+                "analysis": analysis,
+                "questions": questions,
+                "processed_at": datetime.utcnow().isoformat(),
+                "prompt_version": self.llama_analyzer.prompt_version if self.llama_analyzer else None
+            }
+
+            if self.db:
+                with trace.stage("db_save"):
+                    await self.db.save_analysis(document_id, result)
+                    await self.db.update_document_status(document_id, "completed")
+                    await self.db.clear_checkpoints(document_id)
+
+            logger.info(f"Processing completed: {document_id}")
+            JOBS_TOTAL.labels(path=path, outcome="completed").inc()
+            trace.finish("completed")
+            return result
+
+        except Exception as e:
+            outcome = "rejected" if isinstance(e, PipelineError) else "failed"
+            logger.error(f"Processing {outcome} for {document_id}: {e}")
+            JOBS_TOTAL.labels(path=path, outcome=outcome).inc()
+            trace.finish(outcome)
+            try:
+                # A failed reanalysis leaves the previous analysis (and status) in place
+                if self.db and not reuse_text:
+                    await self.db.update_document_status(document_id, "failed")
+            except Exception:
+                pass
+            raise
+        except asyncio.CancelledError:
+            # Stopped, not failed: the document's status is left to whoever runs it now
+            trace.finish("cancelled")
+            raise
+        finally:
+            JOBS_IN_FLIGHT.labels(path=path).dec()
+            trace.deactivate()
+            await self._save_trace(trace)
+
+    async def _classify(self, text: str, trace: PipelineTrace) -> str:
+        if not self.llama_analyzer:
+            return "unknown"
+        return await _classify(self.llama_analyzer, text, trace)
+
+    async def _load_checkpoints(self, document_id: str) -> Dict:
+        """Completed stage outputs, up to the first stage without one"""
+        if not self.db:
+            return {}
+        stored = await self.db.get_checkpoints(document_id)
+        checkpoints = {}
+        for stage in STAGES:
+            if stage not in stored:
+                break
+            checkpoints[stage] = stored[stage]
+        return checkpoints
+
+    async def _checkpoint(self, document_id: str, stage: str, data):
+        """Record a stage's output; a failed write only costs the resume"""
+        if not self.db:
+            return
+        try:
+            await self.db.save_checkpoint(document_id, stage, data)
+        except Exception as e:
+            logger.warning(f"Could not checkpoint {stage} for {document_id}: {e}")
+
+    async def _save_trace(self, trace: PipelineTrace):
+        """Persist a pipeline trace; never lets tracing break processing"""
+        if not self.db or not trace.stages:
+            return
+        try:
+            await self.db.save_trace(trace.document_id, trace.to_dict())
+        except Exception as e:
+            logger.warning(f"Could not save trace for {trace.document_id}: {e}")
@@ -0,0 +1,119 @@
+"""
+Deterministic status engine for lab findings.
+
+Parses each finding's value and normal_range ("30-100", "<200", ">40 mg/dL",
+"150,000 - 450,000") into arrays and classifies all of them in one NumPy
+pass using the rules the analysis prompt describes:
+
+- URGENT:  outside the range, or within URGENT_MARGIN of a limit
+- MONITOR: within MONITOR_MARGIN of a limit
+- NORMAL:  further than MONITOR_MARGIN from both limits
+
+Margins are fractions of the range width (of the limit itself for one-sided
+ranges such as "<200"). A lower limit of 0 is no limit: "0-100" is read as
+"<100", so low results (CRP 0.1 of 0.0-3.0) are NORMAL, not near a limit.
+Findings whose value or range can't be read, or
+whose range has several tiers, get no status and keep the LLM's.
+"""
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+URGENT_MARGIN = float(os.getenv("STATUS_URGENT_MARGIN", "0.05"))
+MONITOR_MARGIN = float(os.getenv("STATUS_MONITOR_MARGIN", "0.20"))
+# Replace the LLM's status with the computed one (by default only flag it)
+OVERRIDE = os.getenv("STATUS_OVERRIDE", "false").lower() in ("1", "true", "yes")
+
+_NUM = r"-?\d+(?:\.\d+)?"
+_NUMBER = re.compile(_NUM)
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3})")
+_BETWEEN = re.compile(rf"({_NUM})\s*(?:-|–|—|to)\s*({_NUM})", re.IGNORECASE)
+_UPPER = re.compile(rf"(?:<=?|≤|less than|below|under|up to)\s*=?\s*({_NUM})", re.IGNORECASE)
+_LOWER = re.compile(rf"(?:>=?|≥|greater than|above|over|at least)\s*=?\s*({_NUM})", re.IGNORECASE)
+
+STATUSES = ("URGENT", "MONITOR", "NORMAL")
+
+
+def parse_value(value) -> float:
+    """First number in a result ("10.2 g/dL", "<0.5", "1,200"); NaN if none"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = _NUMBER.search(_THOUSANDS.sub("", str(value or "")))
+    return float(match.group()) if match else np.nan
+
+
+def parse_range(normal_range) -> Tuple[float, float]:
+    """
+    (low, high) of a reference range; a missing bound is NaN. Ranges with
+    several tiers ("Desirable <200, Borderline 200-239, High >=240") or
+    several intervals ("M 13.5-17.5, F 12.0-15.5") have no single normal
+    interval, so both bounds are NaN.
+    """
+    text = _THOUSANDS.sub("", str(normal_range or ""))
+    betweens = _BETWEEN.findall(text)
+    rest = _BETWEEN.sub(" ", text)
+    uppers, lowers = _UPPER.findall(rest), _LOWER.findall(rest)
+    if len(betweens) > 1 or (betweens and (uppers or lowers)) or len(uppers) > 1 or len(lowers) > 1:
+        return np.nan, np.nan
+    if betweens:
+        low, high = betweens[0]
+        return float(low), float(high)
+    return (
+        float(lowers[0]) if lowers else np.nan,
+        float(uppers[0]) if uppers else np.nan,
+    )
+
+
+def classify(values: np.ndarray, lows: np.ndarray, highs: np.ndarray) -> np.ndarray:
+    """Status for each (value, low, high); "" where it can't be determined"""
+    lows = np.where(lows == 0, np.nan, lows)
+    has_low, has_high = ~np.isnan(lows), ~np.isnan(highs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(has_low & has_high, highs - lows, np.where(has_high, np.abs(highs), np.abs(lows)))
+        known = ~np.isnan(values) & (has_low | has_high) & (scale > 0)
+        # NaN bounds compare False, so one-sided ranges only test the side they have
+        outside = (values < lows) | (values > highs)
+        fraction = np.fmin(values - lows, highs - values) / scale
+        return np.select(
+            [~known, outside | (fraction < URGENT_MARGIN), fraction < MONITOR_MARGIN],
+            ["", "URGENT", "MONITOR"],
+            default="NORMAL",
+        )
+
+
+def evaluate(findings: List[Dict]) -> List[Optional[str]]:
+    """Computed status for each finding (None where value/range are unreadable)"""
+    if not findings:
+        return []
+    values = np.fromiter((parse_value(f.get("value")) for f in findings), dtype=float, count=len(findings))
+    bounds = np.array([parse_range(f.get("normal_range")) for f in findings], dtype=float).reshape(-1, 2)
+    return [status or None for status in classify(values, bounds[:, 0], bounds[:, 1]).tolist()]
+
+
+def apply_statuses(findings: List[Dict], override: bool = OVERRIDE) -> int:
+    """
+    Check each finding's status against the computed one. Disagreements keep
+    the model's answer in llm_status and, with override, take the computed
+    status (computed_status otherwise). Returns the number of disagreements.
+    """
+    disagreements = 0
+    for finding, computed in zip(findings, evaluate(findings)):
+        if computed is None:
+            continue
+        llm_status = str(finding.get("status") or "").upper()
+        if llm_status == computed:
+            continue
+        disagreements += 1
+        finding["llm_status"] = finding.get("status")
+        if override:
+            finding["status"] = computed
+        else:
+            finding["computed_status"] = computed
+    if disagreements:
+        logger.info(f"⚖️  Reference ranges disagree with the LLM on {disagreements}/{len(findings)} statuses")
+    return disagreements
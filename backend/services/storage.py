@@ -0,0 +1,245 @@
+import os
+import uuid
+import hashlib
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable
+from fastapi.concurrency import run_in_threadpool
+
+from services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 64
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Accepted upload types and the extension they are stored under
+CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": "pdf",
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "text/plain": "txt",
+}
+
+
+@dataclass
+class StoredFile:
+    """Result of writing an upload to storage"""
+    key: str
+    size: int
+    content_hash: str
+
+
+def shard_key(content_hash: str, extension: str) -> str:
+    """Content-addressed key: ab/cd/abcd...ef.pdf (two levels of 256 shards)"""
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{extension}"
+
+
+def _copy_and_hash(src_file: BinaryIO, dest: BinaryIO, max_bytes: int):
+    """Stream src into dest, hashing as we go. Raises ValueError past max_bytes."""
+    digest = hashlib.sha256()
+    bytes_written = 0
+    while True:
+        chunk = src_file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        bytes_written += len(chunk)
+        if bytes_written > max_bytes:
+            raise ValueError(f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+        digest.update(chunk)
+        dest.write(chunk)
+    return digest.hexdigest(), bytes_written
+
+
+class LocalStorage:
+    """
+    Stores uploads on local disk under hash-sharded directories
+    so no single directory grows without bound
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.incoming_dir = os.path.join(root, ".incoming")
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _save_sync(self, src_file: BinaryIO, extension: str, max_bytes: int) -> StoredFile:
+        tmp_path = os.path.join(self.incoming_dir, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, "wb") as dest:
+                content_hash, size = _copy_and_hash(src_file, dest, max_bytes)
+
+            key = shard_key(content_hash, extension)
+            final_path = self._path(key)
+            duplicate = os.path.exists(final_path)
+            record_cache("upload_dedupe", duplicate)
+            if duplicate:
+                # Same bytes already stored - keep the existing copy
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return StoredFile(key=key, size=size, content_hash=content_hash)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def save(self, src_file: BinaryIO, extension: str,
+                   max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+        """Stream an upload to storage in a threadpool to avoid blocking the event loop"""
+        return await run_in_threadpool(self._save_sync, src_file, extension, max_bytes)
+
+    @asynccontextmanager
+    async def open_local(self, key: str) -> AsyncIterator[str]:
+        """Yield a local filesystem path for the stored object"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(key)
+        yield path
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _delete_sync(self, key: str):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Deleted stored file: {key}")
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._delete_sync, key)
+
+    def _move_sync(self, key: str, new_key: str) -> bool:
+        path = self._path(new_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(self._path(key), path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def move(self, key: str, new_key: str) -> bool:
+        """Rename a stored file; False if it doesn't exist"""
+        return await run_in_threadpool(self._move_sync, key, new_key)
+
+
+class S3Storage:
+    """
+    Stores uploads in an S3-compatible bucket (AWS S3, MinIO, R2...).
+    Requires boto3; point S3_ENDPOINT_URL at a local MinIO for development.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str = None, prefix: str = "uploads"):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("S3 storage requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _save_sync(self, src_file: BinaryIO, extension: str, max_bytes: int) -> StoredFile:
+        # Spool locally first: the key depends on the hash of the full content
+        with tempfile.TemporaryFile() as spool:
+            content_hash, size = _copy_and_hash(src_file, spool, max_bytes)
+            key = shard_key(content_hash, extension)
+            spool.seek(0)
+            self.client.upload_fileobj(spool, self.bucket, self._object_key(key))
+        return StoredFile(key=key, size=size, content_hash=content_hash)
+
+    async def save(self, src_file: BinaryIO, extension: str,
+                   max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+        return await run_in_threadpool(self._save_sync, src_file, extension, max_bytes)
+
+    @asynccontextmanager
+    async def open_local(self, key: str) -> AsyncIterator[str]:
+        """Download the object to a temp file (extractors need a real path)"""
+        suffix = "." + key.rsplit(".", 1)[-1]
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            await run_in_threadpool(
+                self.client.download_file, self.bucket, self._object_key(key), path
+            )
+            yield path
+        finally:
+            os.remove(path)
+
+    def _exists_sync(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception:
+            return False
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self._exists_sync, key)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(
+            self.client.delete_object, Bucket=self.bucket, Key=self._object_key(key)
+        )
+        logger.info(f"Deleted stored object: {key}")
+
+    def _move_sync(self, key: str, new_key: str) -> bool:
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket, Key=self._object_key(new_key),
+                CopySource={"Bucket": self.bucket, "Key": self._object_key(key)}
+            )
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return False
+            raise
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    async def move(self, key: str, new_key: str) -> bool:
+        """Copy an object to a new key and delete the old one; False if it doesn't exist"""
+        return await run_in_threadpool(self._move_sync, key, new_key)
+
+
+async def delete_unreferenced(storage, key: str, count_references: Callable[[str], Awaitable[int]]) -> bool:
+    """
+    Delete a stored file that no document references. Another process may
+    record a new reference to the same deduplicated key at any moment, so
+    the file is first moved aside, references are counted again, and it is
+    moved back if one appeared. An upload checks the file exists after
+    recording its reference and writes it again if not (main._record_upload),
+    so one of the two always keeps it. Returns True if the file was deleted.
+    """
+    if await count_references(key) > 0:
+        return False
+    aside = f".incoming/{uuid.uuid4().hex}.deleting"
+    if not await storage.move(key, aside):
+        return False
+    if await count_references(key) > 0:
+        logger.info(f"Stored file {key} was referenced again while being deleted; keeping it")
+        await storage.move(aside, key)
+        return False
+    await storage.delete(aside)
+    logger.info(f"Deleted unreferenced file: {key}")
+    return True
+
+
+def get_storage(upload_dir: str = "uploads"):
+    """Pick the storage backend from STORAGE_BACKEND (local|s3)"""
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+    if backend == "s3":
+        bucket = os.getenv("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        logger.info(f"Using S3 storage: bucket={bucket}")
+        return S3Storage(bucket, endpoint_url=os.getenv("S3_ENDPOINT_URL"))
+
+    logger.info(f"Using local sharded storage: {upload_dir}")
+    return LocalStorage(upload_dir)
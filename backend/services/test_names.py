@@ -0,0 +1,128 @@
+import re
+from typing import Dict, List
+
+# Canonical test keys and the names labs / the LLM commonly use for them.
+# Aliases are matched after normalization (see _normalize), so casing,
+# punctuation and specimen qualifiers like "Serum" don't need listing here.
+CANONICAL_TEST_NAMES: Dict[str, List[str]] = {
+    "vitamin_b12": ["vitamin b12", "vit b12", "b12", "cobalamin", "cyanocobalamin"],
+    "vitamin_d": [
+        "vitamin d", "vit d", "25 oh vitamin d", "25 hydroxy vitamin d",
+        "25 hydroxyvitamin d", "vitamin d 25 hydroxy", "vitamin d total",
+        "25 oh d", "vitamin d3",
+    ],
+    "folate": ["folate", "folic acid", "vitamin b9"],
+    "ferritin": ["ferritin"],
+    "iron": ["iron", "fe"],
+    "tibc": ["tibc", "total iron binding capacity"],
+    "transferrin_saturation": ["transferrin saturation", "iron saturation", "tsat"],
+    "hemoglobin": ["hemoglobin", "haemoglobin", "hb", "hgb"],
+    "hematocrit": ["hematocrit", "haematocrit", "hct", "pcv", "packed cell volume"],
+    "rbc": ["rbc", "red blood cell count", "red blood cells", "rbc count", "erythrocytes"],
+    "wbc": [
+        "wbc", "white blood cell count", "white blood cells", "wbc count",
+        "leukocytes", "total leukocyte count", "tlc",
+    ],
+    "platelets": ["platelets", "platelet count", "plt"],
+    "mcv": ["mcv", "mean corpuscular volume"],
+    "mch": ["mch", "mean corpuscular hemoglobin"],
+    "mchc": ["mchc", "mean corpuscular hemoglobin concentration"],
+    "rdw": ["rdw", "red cell distribution width", "rdw cv"],
+    "neutrophils": ["neutrophils", "neutrophil", "neutrophil count"],
+    "lymphocytes": ["lymphocytes", "lymphocyte", "lymphocyte count"],
+    "monocytes": ["monocytes", "monocyte"],
+    "eosinophils": ["eosinophils", "eosinophil"],
+    "basophils": ["basophils", "basophil"],
+    "glucose_fasting": ["fasting glucose", "glucose fasting", "fasting blood sugar", "fbs", "fasting plasma glucose"],
+    "glucose": ["glucose", "blood sugar", "random glucose", "random blood sugar"],
+    "hba1c": ["hba1c", "hemoglobin a1c", "a1c", "glycated hemoglobin", "glycosylated hemoglobin"],
+    "cholesterol_total": ["total cholesterol", "cholesterol total", "cholesterol"],
+    "ldl": ["ldl", "ldl cholesterol", "ldl c", "low density lipoprotein", "ldl direct"],
+    "hdl": ["hdl", "hdl cholesterol", "hdl c", "high density lipoprotein"],
+    "vldl": ["vldl", "vldl cholesterol"],
+    "triglycerides": ["triglycerides", "triglyceride", "tg"],
+    "tsh": ["tsh", "thyroid stimulating hormone", "thyrotropin"],
+    "free_t4": ["free t4", "ft4", "free thyroxine", "t4 free"],
+    "free_t3": ["free t3", "ft3", "free triiodothyronine", "t3 free"],
+    "t4": ["t4", "total t4", "thyroxine"],
+    "t3": ["t3", "total t3", "triiodothyronine"],
+    "creatinine": ["creatinine"],
+    "bun": ["bun", "blood urea nitrogen", "urea nitrogen"],
+    "urea": ["urea"],
+    "egfr": ["egfr", "estimated gfr", "gfr"],
+    "uric_acid": ["uric acid"],
+    "sodium": ["sodium", "na"],
+    "potassium": ["potassium", "k"],
+    "chloride": ["chloride", "cl"],
+    "bicarbonate": ["bicarbonate", "co2", "hco3", "total co2"],
+    "calcium": ["calcium", "ca"],
+    "magnesium": ["magnesium", "mg"],
+    "phosphorus": ["phosphorus", "phosphate"],
+    "alt": ["alt", "sgpt", "alanine aminotransferase", "alt sgpt"],
+    "ast": ["ast", "sgot", "aspartate aminotransferase", "ast sgot"],
+    "alp": ["alp", "alkaline phosphatase"],
+    "ggt": ["ggt", "gamma gt", "gamma glutamyl transferase"],
+    "bilirubin_total": ["total bilirubin", "bilirubin total", "bilirubin"],
+    "bilirubin_direct": ["direct bilirubin", "bilirubin direct", "conjugated bilirubin"],
+    "albumin": ["albumin"],
+    "total_protein": ["total protein", "protein total"],
+    "globulin": ["globulin"],
+    "crp": ["crp", "c reactive protein"],
+    "hs_crp": ["hs crp", "hscrp", "high sensitivity crp", "high sensitivity c reactive protein"],
+    "esr": ["esr", "erythrocyte sedimentation rate", "sed rate"],
+    "psa": ["psa", "prostate specific antigen"],
+    "insulin": ["insulin", "fasting insulin"],
+}
+
+# Qualifiers that don't change which test is meant
+_QUALIFIERS = {"serum", "plasma", "blood", "level", "levels", "whole"}
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_PARENS = re.compile(r"\([^)]*\)")
+
+
+def _normalize(name: str) -> str:
+    """Lowercase, drop parentheticals/punctuation and specimen qualifiers"""
+    lowered = _PARENS.sub(" ", (name or "").lower())
+    words = [w for w in _NON_ALNUM.split(lowered) if w and w not in _QUALIFIERS]
+    return " ".join(words)
+
+
+def _word_set_key(normalized: str) -> str:
+    return " ".join(sorted(normalized.split()))
+
+
+def _build_alias_index() -> Dict[str, str]:
+    index = {}
+    for key, aliases in CANONICAL_TEST_NAMES.items():
+        for alias in [key.replace("_", " ")] + aliases:
+            index.setdefault(_normalize(alias), key)
+    return index
+
+
+# Precomputed normalized alias -> canonical key, plus an order-insensitive
+# variant so "B12, Vitamin" resolves the same as "Vitamin B12"
+_ALIAS_INDEX = _build_alias_index()
+_WORD_SET_INDEX = {}
+for _alias, _key in _ALIAS_INDEX.items():
+    _WORD_SET_INDEX.setdefault(_word_set_key(_alias), _key)
+
+
+def canonical_test_key(test_name: str) -> str:
+    """
+    Resolve a free-text test name to its canonical key.
+    Unknown tests fall back to a stable slug of the normalized name.
+    """
+    normalized = _normalize(test_name)
+    if not normalized:
+        return "unknown"
+
+    key = _ALIAS_INDEX.get(normalized)
+    if key:
+        return key
+
+    key = _WORD_SET_INDEX.get(_word_set_key(normalized))
+    if key:
+        return key
+
+    return normalized.replace(" ", "_")
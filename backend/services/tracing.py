@@ -0,0 +1,108 @@
+import sys
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+from services.metrics import STAGE_DURATION
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# The trace for the pipeline run executing in this context. run_in_threadpool
+# copies the context, so extraction/OCR threads see the same trace object.
+_current_trace: ContextVar[Optional["PipelineTrace"]] = ContextVar("current_trace", default=None)
+# The stage counters go to. Per-context, so stages running concurrently in
+# separate tasks (e.g. classify overlapping extract) each keep their own.
+_active_stage: ContextVar[Optional[Dict]] = ContextVar("active_stage", default=None)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Process high-water RSS (ru_maxrss is KB on Linux, bytes on macOS)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+class PipelineTrace:
+    """
+    Wall time, CPU time, peak RSS and work counters (bytes read, pages
+    OCR'd, tokens) for each stage of one document's pipeline run.
+    CPU time is process-wide, so it overstates when jobs run concurrently.
+    """
+
+    def __init__(self, document_id: str, path: str):
+        self.document_id = document_id
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.stages: Dict[str, Dict] = {}
+        self.outcome = "running"
+        self._token = None
+        self._start = time.perf_counter()
+
+    def activate(self):
+        """Make this the current trace for code running in this context"""
+        self._token = _current_trace.set(self)
+
+    def deactivate(self):
+        if self._token is not None:
+            _current_trace.reset(self._token)
+            self._token = None
+
+    @contextmanager
+    def stage(self, name: str):
+        record = self.stages.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0})
+        token = _active_stage.set(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            record["wall_ms"] += round(wall * 1000, 2)
+            record["cpu_ms"] += round((time.process_time() - cpu_start) * 1000, 2)
+            record["peak_rss_mb"] = _peak_rss_mb()
+            _active_stage.reset(token)
+            STAGE_DURATION.labels(stage=name).observe(wall)
+
+    def add(self, counter: str, amount: float):
+        active = _active_stage.get()
+        target = active if active is not None else self.stages.setdefault("other", {})
+        target[counter] = target.get(counter, 0) + amount
+
+    def finish(self, outcome: str):
+        self.outcome = outcome
+
+    def to_dict(self) -> Dict:
+        totals: Dict[str, float] = {}
+        for record in self.stages.values():
+            for key in ("bytes_read", "pages_ocr", "prompt_tokens", "completion_tokens",
+                        "continuations", "explanation_hits", "status_disagreements"):
+                if key in record:
+                    totals[key] = totals.get(key, 0) + record[key]
+        return {
+            "document_id": self.document_id,
+            "path": self.path,
+            "outcome": self.outcome,
+            "started_at": self.started_at.isoformat(),
+            "total_seconds": round(time.perf_counter() - self._start, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+            "totals": totals,
+            "stages": self.stages,
+        }
+
+
+def trace_add(counter: str, amount: float):
+    """Attribute work to the active stage of the current trace (no-op outside a run)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(counter, amount)
+
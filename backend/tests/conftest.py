@@ -0,0 +1,34 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+# Tests run from backend/ like the app does (python -m pytest tests)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh SQLiteDatabase with its tables created"""
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "test.db"))
+    from database.sqlite_db import SQLiteDatabase
+
+    db = SQLiteDatabase()
+    asyncio.run(db.init_tables())
+    yield db
+    asyncio.run(db.disconnect())
+
+
+async def add_document(db, document_id: str, **fields):
+    from datetime import datetime
+    from models.schemas import DocumentMetadata
+
+    await db.save_document_metadata(DocumentMetadata(
+        document_id=document_id,
+        filename=fields.pop("filename", f"{document_id}.txt"),
+        file_type="text/plain",
+        upload_time=datetime.utcnow(),
+        status=fields.pop("status", "completed"),
+        **fields
+    ))
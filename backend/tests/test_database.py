@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import database
+import database.db
+from database.sqlite_db import SQLiteDatabase
+
+
+class FakePostgres:
+    """Stands in for database.db.Database; fails at the step named by fail_at"""
+
+    fail_at = None
+    disconnected = False
+
+    async def connect(self):
+        if self.fail_at == "connect":
+            raise OSError("connection refused")
+
+    async def init_tables(self):
+        if self.fail_at == "init_tables":
+            raise RuntimeError("permission denied for schema public")
+
+    async def warm_up(self):
+        pass
+
+    async def disconnect(self):
+        FakePostgres.disconnected = True
+
+
+@pytest.fixture
+def postgres_configured(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://user@db.invalid/app")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "fallback.db"))
+    monkeypatch.setattr(database.db, "Database", FakePostgres)
+    monkeypatch.setattr(FakePostgres, "disconnected", False)
+    return monkeypatch
+
+
+def test_unreachable_postgres_falls_back_to_sqlite(postgres_configured):
+    postgres_configured.setattr(FakePostgres, "fail_at", "connect")
+
+    selected = asyncio.run(database.select_database())
+
+    assert isinstance(selected, SQLiteDatabase)
+    asyncio.run(selected.disconnect())
+
+
+def test_failure_after_connecting_closes_the_pool_and_raises(postgres_configured):
+    postgres_configured.setattr(FakePostgres, "fail_at", "init_tables")
+
+    with pytest.raises(RuntimeError, match="permission denied"):
+        asyncio.run(database.select_database())
+
+    assert FakePostgres.disconnected
@@ -0,0 +1,31 @@
+import asyncio
+
+from services.explanations import ExplanationCache
+
+
+def _entry(test_name, status, direction):
+    return {"test_key": test_name.lower(), "test_name": test_name, "status": status, "direction": direction,
+            "plain_english": f"A {status.lower()} {test_name} result.", "what_it_means": "A routine lab marker.",
+            "clinical_significance": "None.", "recommendations": []}
+
+
+def test_prompt_list_is_ranked_by_hits_and_survives_a_restart(sqlite_db):
+    async def scenario():
+        cache = ExplanationCache(sqlite_db)
+        await cache.add([_entry("Albumin", "NORMAL", "within"), _entry("Zinc", "NORMAL", "within"),
+                         _entry("Zinc", "URGENT", "low")])
+        for _ in range(3):
+            cache.fill({"test_name": "Zinc", "value": "50 ug/dL", "normal_range": "60-120 ug/dL", "status": "URGENT"})
+        cache.fill({"test_name": "Zinc", "value": "90 ug/dL", "normal_range": "60-120 ug/dL", "status": "NORMAL"})
+        await cache.save_hits()
+        ranked = cache.known_combinations()
+
+        restarted = ExplanationCache(sqlite_db)
+        await restarted.load()
+        return ranked, restarted.known_combinations(), restarted.known_combinations(limit=1)
+
+    ranked, reloaded, top = asyncio.run(scenario())
+
+    assert ranked == [["Zinc", "URGENT", "low"], ["Zinc", "NORMAL", "within"], ["Albumin", "NORMAL", "within"]]
+    assert reloaded == ranked
+    assert top == [["Zinc", "URGENT", "low"]]
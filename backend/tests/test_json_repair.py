@@ -0,0 +1,14 @@
+from services.json_repair import parse_partial_json
+
+
+def test_deeply_nested_output_does_not_raise():
+    for text in ("[" * 5000, "[" * 5000 + "]" * 5000, '{"findings": ' + "[" * 5000):
+        result = parse_partial_json(text)
+        assert result.value is None
+        assert not result.complete
+
+
+def test_truncated_array_is_recovered():
+    result = parse_partial_json('{"findings": [{"test_name": "Hemoglobin"}, {"test_na')
+    assert not result.complete
+    assert result.value["findings"][0] == {"test_name": "Hemoglobin"}
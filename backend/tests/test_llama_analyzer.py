@@ -0,0 +1,124 @@
+import json
+import asyncio
+
+from services.explanations import ExplanationCache
+from services.llama_analyzer import LlamaAnalyzer
+
+
+def _finding(name, value, normal_range):
+    return {"test_name": name, "value": value, "normal_range": normal_range, "status": "NORMAL",
+            "plain_english": f"Your {name} is normal.", "what_it_means": f"{name} is a routine lab marker.",
+            "clinical_significance": "None.", "recommendations": []}
+
+
+FINDINGS = [
+    _finding("Hemoglobin", "13.5 g/dL", "12.0-16.0 g/dL"),
+    _finding("Platelets", "250 10^3/uL", "150-400 10^3/uL"),
+    _finding("Glucose", "90 mg/dL", "70-99 mg/dL"),
+]
+
+
+class ScriptedAnalyzer(LlamaAnalyzer):
+    """
+    Replays canned (content, finish_reason) replies and records the messages
+    sent; a reply may carry a third element, seconds to wait before answering
+    """
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.calls = []
+
+    async def _complete(self, messages, temperature=0.3, max_tokens=None):
+        self.calls.append([dict(m) for m in messages])
+        content, finish_reason, *delay = self.replies.pop(0)
+        if delay:
+            await asyncio.sleep(delay[0])
+        return content, finish_reason
+
+
+def test_continuation_includes_truncated_reply():
+    full = json.dumps({"overall_summary": "Fine.", "overall_status": "NORMAL", "findings": FINDINGS[:2]})
+    # Cut off inside the second finding, mid-array
+    truncated = full[:full.index('"Platelets"') + 20]
+    analyzer = ScriptedAnalyzer([
+        (truncated, "length"),
+        (json.dumps({"findings": FINDINGS[1:]}), "stop"),
+    ])
+
+    analysis = asyncio.run(analyzer.analyze_document("Hemoglobin ... Platelets ... Glucose ...", "Lab Results"))
+
+    first, continuation = analyzer.calls
+    assert continuation[:len(first)] == first
+    assert continuation[-2] == {"role": "assistant", "content": truncated}
+    assert continuation[-1]["role"] == "user"
+    assert 'after "Hemoglobin"' in continuation[-1]["content"]
+    assert [f["test_name"] for f in analysis["findings"]] == ["Hemoglobin", "Platelets", "Glucose"]
+    assert analysis["continuation_rounds"] == 1
+
+
+def _explanations_reply():
+    return json.dumps({"explanations": [
+        {"test_name": f["test_name"], "status": "NORMAL", "direction": "within",
+         "plain_english": "A normal result.", "what_it_means": "A routine lab marker.",
+         "clinical_significance": "None.", "recommendations": []}
+        for f in FINDINGS
+    ]})
+
+
+def _analyze_then_drain(analyzer, timeout):
+    analyzer.explanations = ExplanationCache()
+
+    async def scenario():
+        await analyzer.analyze_document("Hemoglobin ... Platelets ... Glucose ...", "Lab Results")
+        # Findings came with inline explanations, so generic ones are generated in the background
+        assert len(analyzer._background) == 1
+        await analyzer.drain(timeout)
+
+    asyncio.run(scenario())
+
+
+def test_drain_waits_for_background_explanations():
+    analysis = json.dumps({"overall_summary": "Fine.", "overall_status": "NORMAL", "findings": FINDINGS})
+    analyzer = ScriptedAnalyzer([(analysis, "stop"), (_explanations_reply(), "stop", 0.05)])
+
+    _analyze_then_drain(analyzer, timeout=5)
+
+    assert not analyzer._background
+    assert all(analyzer.explanations.lookup(f) for f in FINDINGS)
+
+
+def test_drain_cancels_background_explanations_after_timeout():
+    analysis = json.dumps({"overall_summary": "Fine.", "overall_status": "NORMAL", "findings": FINDINGS})
+    analyzer = ScriptedAnalyzer([(analysis, "stop"), (_explanations_reply(), "stop", 30)])
+
+    _analyze_then_drain(analyzer, timeout=0.05)
+
+    assert not analyzer._background
+    assert not any(analyzer.explanations.lookup(f) for f in FINDINGS)
+
+
+def test_prompt_asks_for_explanations_of_uncached_combinations():
+    # Hemoglobin is cached only as NORMAL; this report has it URGENT low
+    urgent = dict(_finding("Hemoglobin", "9.0 g/dL", "12.0-16.0 g/dL"), status="URGENT")
+    analysis = json.dumps({"overall_summary": "Low.", "overall_status": "URGENT", "findings": [urgent]})
+    analyzer = ScriptedAnalyzer([(analysis, "stop"), (_explanations_reply(), "stop")])
+    analyzer.explanations = ExplanationCache()
+
+    async def scenario():
+        await analyzer.explanations.add([{
+            "test_key": "hemoglobin", "test_name": "Hemoglobin", "status": "NORMAL", "direction": "within",
+            "plain_english": "A normal result.", "what_it_means": "", "clinical_significance": "",
+            "recommendations": [],
+        }])
+        result = await analyzer.analyze_document("Hemoglobin 9.0 g/dL 12.0-16.0", "Lab Results")
+        # Only the background request for the new combination follows; nothing blocks the result
+        assert len(analyzer.calls) == 1
+        await analyzer.drain(5)
+        return result
+
+    result = asyncio.run(scenario())
+
+    system = analyzer.calls[0][0]["content"]
+    assert '[["Hemoglobin", "NORMAL", "within"]]' in system
+    assert result["findings"][0]["plain_english"] == urgent["plain_english"]
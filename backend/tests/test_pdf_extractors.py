@@ -0,0 +1,88 @@
+import pytest
+
+from services import pdf_extractors
+from services.pdf_extractors import PdfExtractor, extract_pdf_pages, register_extractor
+
+ROWS_PAGE = "Hemoglobin 10.2 g/dL 12.0 - 16.0\nFerritin 8 ng/mL 15 - 150\nGlucose 99 mg/dL 70 - 99"
+# The same table read column by column, as fast backends do with separately placed cells
+COLUMNS_PAGE = "Hemoglobin\nFerritin\nGlucose\n10.2 g/dL\n8 ng/mL\n99 mg/dL\n12.0 - 16.0\n15 - 150\n70 - 99"
+
+
+class Broken(PdfExtractor):
+    name = "broken"
+
+    def extract_pages(self, path, page_numbers=None):
+        raise ValueError("encrypted")
+
+
+class Fixed(PdfExtractor):
+    def __init__(self, name, pages):
+        self.name = name
+        self.pages = pages
+
+    def extract_pages(self, path, page_numbers=None):
+        if page_numbers is None:
+            return list(self.pages)
+        return [self.pages[i] for i in page_numbers]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry with broken as the only fast backend and layout as the layout backend"""
+    monkeypatch.setattr(pdf_extractors, "PDF_EXTRACTORS", {})
+    monkeypatch.setattr(pdf_extractors, "PDF_FAST_EXTRACTORS", ["broken"])
+    monkeypatch.setattr(pdf_extractors, "PDF_LAYOUT_EXTRACTOR", "layout")
+    monkeypatch.setattr(pdf_extractors, "PDF_LAYOUT_PAGES", "tables")
+    return pdf_extractors.PDF_EXTRACTORS
+
+
+def test_failing_fast_backend_falls_back_to_layout(registry):
+    registry["broken"] = Broken()
+    registry["layout"] = Fixed("layout", ["layout page 1", "layout page 2"])
+    assert extract_pdf_pages("report.pdf") == ["layout page 1", "layout page 2"]
+
+
+def test_failing_backends_fall_back_to_any_registered(registry):
+    registry["broken"] = Broken()
+    registry["other"] = Fixed("other", ["other page"])
+    assert extract_pdf_pages("report.pdf") == ["other page"]
+
+
+def test_error_is_raised_when_every_backend_fails(registry):
+    registry["broken"] = Broken()
+    with pytest.raises(ValueError, match="encrypted"):
+        extract_pdf_pages("report.pdf")
+
+
+def test_failing_layout_pass_keeps_fast_text(registry, monkeypatch):
+    monkeypatch.setattr(pdf_extractors, "PDF_FAST_EXTRACTORS", ["fast"])
+    registry["fast"] = Fixed("fast", [COLUMNS_PAGE, "plain text"])
+    registry["layout"] = Broken()
+    registry["layout"].name = "layout"
+    assert extract_pdf_pages("report.pdf") == [COLUMNS_PAGE, "plain text"]
+
+
+def test_layout_pass_only_rereads_pages_that_lost_their_rows(registry, monkeypatch):
+    monkeypatch.setattr(pdf_extractors, "PDF_FAST_EXTRACTORS", ["fast"])
+    registry["fast"] = Fixed("fast", [ROWS_PAGE, COLUMNS_PAGE])
+    registry["layout"] = Fixed("layout", ["layout page 1", "layout page 2"])
+    assert extract_pdf_pages("report.pdf") == [ROWS_PAGE, "layout page 2"]
+
+
+@pytest.mark.parametrize("page, lost", [
+    (ROWS_PAGE, False),
+    (COLUMNS_PAGE, True),
+    ("1 HbA1c 5.4 % 4.0-5.6\n2 TSH 2.1 uIU/mL 0.4-4.0\n3 Iron 80 ug/dL 60-170", False),
+    ("Patient: Jane Doe\nCollected 2024-03-01 08:15\nPage 1 of 2", False),
+    ("Vitamin D, 25-OH\n25.3 ng/mL\n30-100 ng/mL\nFerritin\n8 ng/mL\n15-150 ng/mL\nIron\n80 ug/dL", True),
+])
+def test_lost_table_layout(page, lost):
+    assert pdf_extractors.lost_table_layout(page) is lost
+
+
+def test_incomplete_extractor_fails_at_registration(registry):
+    with pytest.raises(TypeError):
+        @register_extractor
+        class Incomplete(PdfExtractor):
+            name = "incomplete"
+    assert "incomplete" not in registry
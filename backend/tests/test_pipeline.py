@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from conftest import add_document
+from services import pipeline as pipeline_module
+from services.pipeline import DocumentPipeline, PipelineError
+
+
+class RecordingPipeline(DocumentPipeline):
+    """Skips the real stages: each run records its reuse_text and waits until released"""
+
+    def __init__(self, db=None):
+        super().__init__(None, None, None, db)
+        self.runs = []
+        self.release = asyncio.Event()
+
+    async def _process(self, document_id, storage_key, path, reuse_text=False):
+        self.runs.append(reuse_text)
+        number = len(self.runs)
+        await self.release.wait()
+        return {"run": number, "reuse_text": reuse_text}
+
+
+def test_reanalysis_during_full_run_is_queued_after_it():
+    async def scenario():
+        pipeline = RecordingPipeline()
+        full = asyncio.create_task(pipeline.run("doc-1", "doc-1.txt", "process"))
+        await asyncio.sleep(0)
+        joined = asyncio.create_task(pipeline.run("doc-1", "doc-1.txt", "background"))
+        reanalysis = [asyncio.create_task(pipeline.run("doc-1", None, "reanalyze", reuse_text=True)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert pipeline.runs == [False]
+
+        pipeline.release.set()
+        results = await asyncio.gather(full, joined, *reanalysis)
+        assert not pipeline.in_flight("doc-1")
+        return pipeline.runs, results
+
+    runs, results = asyncio.run(scenario())
+
+    assert runs == [False, True]
+    assert results == [
+        {"run": 1, "reuse_text": False},
+        {"run": 1, "reuse_text": False},
+        {"run": 2, "reuse_text": True},
+        {"run": 2, "reuse_text": True},
+    ]
+
+
+def test_reanalysis_runs_after_a_failed_full_run():
+    class FailingFirstRun(RecordingPipeline):
+        async def _process(self, document_id, storage_key, path, reuse_text=False):
+            result = await super()._process(document_id, storage_key, path, reuse_text)
+            if not reuse_text:
+                raise RuntimeError("OCR failed")
+            return result
+
+    async def scenario():
+        pipeline = FailingFirstRun()
+        full = asyncio.create_task(pipeline.run("doc-1", "doc-1.txt", "process"))
+        await asyncio.sleep(0)
+        reanalysis = asyncio.create_task(pipeline.run("doc-1", None, "reanalyze", reuse_text=True))
+        pipeline.release.set()
+        return await asyncio.gather(full, reanalysis, return_exceptions=True)
+
+    full, reanalysis = asyncio.run(scenario())
+
+    assert isinstance(full, RuntimeError)
+    assert reanalysis == {"run": 2, "reuse_text": True}
+
+
+@pytest.fixture
+def fast_claims(monkeypatch):
+    monkeypatch.setattr(pipeline_module, "CLAIM_TTL", 0.15)
+    monkeypatch.setattr(pipeline_module, "CLAIM_POLL", 0.01)
+    monkeypatch.setattr(pipeline_module, "CLAIM_WAIT", 0.1)
+
+
+def test_missing_document_row_is_not_found(sqlite_db, fast_claims):
+    pipeline = RecordingPipeline(sqlite_db)
+    pipeline.release.set()
+
+    with pytest.raises(PipelineError) as raised:
+        asyncio.run(asyncio.wait_for(pipeline.run("no-such-doc", "x.pdf", "process"), 5))
+
+    assert raised.value.status_code == 404
+    assert pipeline.runs == []
+
+
+def test_wait_on_another_process_is_capped(sqlite_db, fast_claims):
+    async def scenario():
+        await add_document(sqlite_db, "doc-1", status="processing")
+        assert await sqlite_db.claim_document("doc-1", "other-host", 60)
+        pipeline = RecordingPipeline(sqlite_db)
+        pipeline.release.set()
+        await asyncio.wait_for(pipeline.run("doc-1", "doc-1.txt", "process"), 5)
+
+    with pytest.raises(PipelineError) as raised:
+        asyncio.run(scenario())
+
+    assert raised.value.status_code == 409
+
+
+def test_run_is_cancelled_when_its_claim_is_taken_over(sqlite_db, fast_claims):
+    pipeline = RecordingPipeline(sqlite_db)
+
+    async def scenario():
+        await add_document(sqlite_db, "doc-1", status="processing")
+        run = asyncio.create_task(pipeline.run("doc-1", "doc-1.txt", "process"))
+        await asyncio.sleep(0.02)
+        assert pipeline.runs == [False]
+        # Another worker decided the claim was stale and took the document
+        sqlite_db.conn.execute("UPDATE documents SET claimed_by = 'other-host' WHERE document_id = 'doc-1'")
+        sqlite_db.conn.commit()
+        return await asyncio.wait_for(run, 5)
+
+    with pytest.raises(PipelineError) as raised:
+        asyncio.run(scenario())
+
+    assert raised.value.status_code == 409
+    document = asyncio.run(sqlite_db.get_document("doc-1"))
+    assert document["status"] == "processing"
+    assert document["claimed_by"] == "other-host"
+
+
+class FlakyAnalyzer:
+    """Classifies, then fails every analysis like an LLM outage would"""
+
+    prompt_version = "test"
+
+    async def classify_document(self, text):
+        return "Lab Results"
+
+    async def analyze_document(self, text, document_type):
+        raise RuntimeError("LLM unavailable")
+
+
+def test_failed_reanalysis_keeps_the_completed_document(sqlite_db):
+    pipeline = DocumentPipeline(None, FlakyAnalyzer(), None, sqlite_db)
+    previous = {"analysis": {"findings": [{"test_name": "Hemoglobin", "value": "13.5 g/dL", "status": "NORMAL"}]}}
+
+    async def scenario():
+        await add_document(sqlite_db, "doc-1", status="completed")
+        await sqlite_db.save_extracted_text("doc-1", "Hemoglobin 13.5 g/dL 12.0-16.0")
+        await sqlite_db.save_analysis("doc-1", previous)
+        with pytest.raises(RuntimeError):
+            await pipeline.reanalyze("doc-1")
+        return await sqlite_db.get_document("doc-1"), await sqlite_db.get_analysis("doc-1")
+
+    document, analysis = asyncio.run(scenario())
+
+    assert document["status"] == "completed"
+    assert analysis["analysis"] == previous["analysis"]
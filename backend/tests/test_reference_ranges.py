@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from services.reference_ranges import apply_statuses, evaluate, parse_range
+
+
+@pytest.mark.parametrize("normal_range, expected", [
+    ("30-100", (30, 100)),
+    ("150,000 - 450,000", (150000, 450000)),
+    ("<200 mg/dL", (None, 200)),
+    (">40", (40, None)),
+])
+def test_parse_range(normal_range, expected):
+    assert [None if math.isnan(bound) else bound for bound in parse_range(normal_range)] == list(expected)
+
+
+@pytest.mark.parametrize("normal_range", [
+    "Desirable <200, Borderline 200-239, High >=240",
+    "Optimal <100; Near optimal 100-129; Borderline high 130-159",
+    "M: 13.5-17.5, F: 12.0-15.5",
+    "Normal <5.7, Prediabetes 5.7-6.4, Diabetes >=6.5",
+])
+def test_multi_tier_ranges_are_unparseable(normal_range):
+    assert all(math.isnan(bound) for bound in parse_range(normal_range))
+
+
+def test_multi_tier_range_keeps_llm_status():
+    findings = [
+        {"test_name": "Total Cholesterol", "value": "215 mg/dL", "status": "MONITOR",
+         "normal_range": "Desirable <200, Borderline 200-239, High >=240"},
+        {"test_name": "Vitamin D", "value": "25 ng/mL", "normal_range": "30-100 ng/mL", "status": "NORMAL"},
+    ]
+
+    assert evaluate(findings) == [None, "URGENT"]
+    assert apply_statuses(findings, override=True) == 1
+    assert findings[0]["status"] == "MONITOR" and "llm_status" not in findings[0]
+    assert findings[1]["status"] == "URGENT" and findings[1]["llm_status"] == "NORMAL"
+
+
+@pytest.mark.parametrize("value, normal_range, expected", [
+    ("0.1 mg/L", "0.0-3.0 mg/L", "NORMAL"),
+    ("0 mg/L", "0-3 mg/L", "NORMAL"),
+    ("10 mg/dL", "0-100 mg/dL", "NORMAL"),
+    ("85 mg/dL", "0-100 mg/dL", "MONITOR"),
+    ("98 mg/dL", "0-100 mg/dL", "URGENT"),
+    ("120 mg/dL", "0-100 mg/dL", "URGENT"),
+    ("0.2 mg/L", "<3.0 mg/L", "NORMAL"),
+])
+def test_zero_lower_limit_has_no_low_side_margin(value, normal_range, expected):
+    assert evaluate([{"value": value, "normal_range": normal_range}]) == [expected]
+
+
+def test_disagreements_are_only_flagged_by_default():
+    finding = {"test_name": "Vitamin D", "value": "25 ng/mL", "normal_range": "30-100 ng/mL", "status": "NORMAL"}
+
+    assert apply_statuses([finding]) == 1
+    assert finding["status"] == "NORMAL" and finding["computed_status"] == "URGENT"
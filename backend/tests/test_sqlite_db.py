@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+
+from conftest import add_document
+
+TEXT = "Hemoglobin: 10.2 g/dL (ref 12.0-16.0); Ferritin: 8 ng/mL (ref 15-150). " * 200
+
+
+def test_extracted_text_is_stored_once(sqlite_db):
+    async def scenario():
+        await add_document(sqlite_db, "doc-1")
+        await sqlite_db.save_extracted_text("doc-1", TEXT)
+        # Saving again replaces the indexed terms instead of adding to them
+        await sqlite_db.save_extracted_text("doc-1", TEXT)
+        assert await sqlite_db.get_extracted_text("doc-1") == TEXT
+        results = await sqlite_db.search_documents("ferritin")
+        assert results["total"] == 1
+        assert "<mark>Ferritin</mark>" in results["results"][0]["snippet"]
+
+    asyncio.run(scenario())
+
+    conn = sqlite_db.conn
+    assert conn.execute("SELECT extracted_text FROM documents").fetchone()[0] is None
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "documents_fts_content" not in tables
+    # No table, the index included, holds the text uncompressed
+    conn.commit()
+    with open(sqlite_db.db_path, "rb") as f:
+        assert b"Hemoglobin: 10.2 g/dL" not in f.read()
+
+
+def test_deleted_document_leaves_the_index(sqlite_db):
+    async def scenario():
+        await add_document(sqlite_db, "doc-1")
+        await add_document(sqlite_db, "doc-2")
+        await sqlite_db.save_extracted_text("doc-1", TEXT)
+        await sqlite_db.save_extracted_text("doc-2", "Vitamin D 25-OH: 18 ng/mL")
+        await sqlite_db.delete_document("doc-1")
+        assert (await sqlite_db.search_documents("ferritin"))["total"] == 0
+        assert (await sqlite_db.search_documents("vitamin"))["total"] == 1
+
+    asyncio.run(scenario())
+    sqlite_db.conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('integrity-check')")
+
+
+def test_legacy_index_is_rebuilt_without_text(sqlite_db):
+    async def scenario():
+        await add_document(sqlite_db, "doc-1")
+        await sqlite_db.save_extracted_text("doc-1", TEXT)
+
+    asyncio.run(scenario())
+    conn = sqlite_db.conn
+    conn.execute("DROP TABLE documents_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE documents_fts USING fts5(
+            document_id UNINDEXED, filename, extracted_text, tokenize = 'porter unicode61'
+        )
+    """)
+    conn.execute("INSERT INTO documents_fts VALUES ('doc-1', 'doc-1.txt', ?)", (TEXT,))
+    conn.commit()
+
+    asyncio.run(sqlite_db.init_tables())
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "documents_fts_content" not in tables
+    assert asyncio.run(sqlite_db.search_documents("ferritin"))["total"] == 1
+
+
+async def _collect(rows):
+    return [row async for row in rows]
+
+
+def test_export_after_delete_leaves_out_the_document(sqlite_db):
+    finding = {"test_name": "Hemoglobin", "value": "10.2 g/dL", "status": "URGENT"}
+
+    async def scenario():
+        for document_id in ("doc-1", "doc-2"):
+            await add_document(sqlite_db, document_id)
+            await sqlite_db.save_analysis(document_id, {"analysis": {"findings": [finding]}})
+        await sqlite_db.delete_document("doc-1")
+        # An orphan left by a delete from before findings were removed with their document
+        sqlite_db.conn.execute(
+            "INSERT INTO findings (document_id, test_name, test_date) VALUES ('gone', 'Ferritin', '2024-01-01')"
+        )
+        return await _collect(sqlite_db.iter_findings()), await _collect(sqlite_db.iter_analyses())
+
+    findings, analyses = asyncio.run(scenario())
+
+    assert [row["document_id"] for row in findings] == ["doc-2"]
+    assert [row["document_id"] for row in analyses] == ["doc-2"]
+    assert sqlite_db.conn.execute("SELECT COUNT(*) FROM findings WHERE document_id = 'doc-1'").fetchone()[0] == 0
@@ -0,0 +1,116 @@
+import io
+import os
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from models.schemas import DocumentMetadata
+from services.storage import LocalStorage, delete_unreferenced
+
+CONTENT = b"Hemoglobin 10.2 g/dL 12.0 - 16.0\n"
+
+
+@pytest.fixture
+def app(sqlite_db, tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "db", sqlite_db)
+    monkeypatch.setattr(main, "storage", LocalStorage(str(tmp_path / "uploads")))
+    return main
+
+
+def _metadata(document_id, stored):
+    return DocumentMetadata(
+        document_id=document_id, filename="report.txt", file_type="text/plain",
+        upload_time=datetime.utcnow(), status="processing",
+        storage_key=stored.key, file_size=stored.size, content_hash=stored.content_hash
+    )
+
+
+def test_upload_rewrites_file_deleted_after_dedupe(app):
+    async def scenario():
+        stored = await app.storage.save(io.BytesIO(CONTENT), "txt")
+        await app._record_upload(_metadata("doc-a", stored), io.BytesIO(CONTENT), "txt")
+        await app.db.delete_document("doc-a")
+
+        # Same content uploaded again: save() dedupes onto the existing file...
+        stored = await app.storage.save(io.BytesIO(CONTENT), "txt")
+        # ...which doc-a's delete then removes before the new reference is recorded
+        await app._delete_stored_file(stored.key)
+        assert not await app.storage.exists(stored.key)
+
+        await app._record_upload(_metadata("doc-b", stored), io.BytesIO(CONTENT), "txt")
+        assert await app.storage.exists(stored.key)
+        async with app.storage.open_local(stored.key) as path:
+            assert open(path, "rb").read() == CONTENT
+
+    asyncio.run(scenario())
+
+
+def test_delete_keeps_a_file_referenced_while_it_is_deleted(app):
+    """Another process records a reference between the delete's first count and its move"""
+    counts = []
+
+    async def count_references(key):
+        count = await app.db.count_storage_references(key)
+        if not counts:
+            await app.db.save_document_metadata(_metadata("doc-b", stored))
+        counts.append(count)
+        return count
+
+    async def scenario():
+        nonlocal stored
+        stored = await app.storage.save(io.BytesIO(CONTENT), "txt")
+        deleted = await delete_unreferenced(app.storage, stored.key, count_references)
+        return deleted, await app.storage.exists(stored.key)
+
+    stored = None
+    deleted, exists = asyncio.run(scenario())
+
+    assert counts == [0, 1]
+    assert not deleted and exists
+
+
+def test_upload_rewrites_file_set_aside_by_a_delete(app):
+    """The upload's existence check lands while the delete has the file moved aside"""
+
+    async def count_references(key):
+        count = await app.db.count_storage_references(key)
+        if not await app.storage.exists(key):
+            # Set aside: the upload records its reference and finds the file missing
+            await app._record_upload(_metadata("doc-b", stored), io.BytesIO(CONTENT), "txt")
+            count = await app.db.count_storage_references(key)
+        return count
+
+    async def scenario():
+        nonlocal stored
+        stored = await app.storage.save(io.BytesIO(CONTENT), "txt")
+        await delete_unreferenced(app.storage, stored.key, count_references)
+        async with app.storage.open_local(stored.key) as path:
+            return open(path, "rb").read()
+
+    stored = None
+    assert asyncio.run(scenario()) == CONTENT
+
+
+def test_unreferenced_file_is_deleted(app):
+    async def scenario():
+        stored = await app.storage.save(io.BytesIO(CONTENT), "txt")
+        deleted = await delete_unreferenced(app.storage, stored.key, app.db.count_storage_references)
+        return deleted, await app.storage.exists(stored.key), os.listdir(app.storage.incoming_dir)
+
+    deleted, exists, incoming = asyncio.run(scenario())
+
+    assert deleted and not exists and incoming == []
+
+
+def test_unrecorded_file_is_registered_for_processing(app):
+    async def scenario():
+        await app._register_unrecorded("legacy-1", "legacy-1.pdf")
+        return await app.db.get_document("legacy-1"), await app.db.claim_document("legacy-1", "test", 60)
+
+    document, claimed = asyncio.run(scenario())
+
+    assert document["file_type"] == "application/pdf" and document["storage_key"] == "legacy-1.pdf"
+    assert claimed